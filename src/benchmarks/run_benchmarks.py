@@ -0,0 +1,280 @@
+# Example params:
+# --output_path output/benchmarks
+# --tweets_per_hour 5000
+# --repeats 3
+# --only tweet_file_oneperc find_location (optional, default all benchmarks)
+# --compare output/benchmarks/bench_20221101_120000.json (optional, print the speedup against an earlier run)
+
+"""
+Benchmarks for the hot paths of the pipeline on seeded synthetic data (see synthetic_data.py). Every benchmark is run
+--repeats times; the best and mean wall time and the throughput are written to a JSON file per run in output_path, so
+runs can be compared over time. The imputer benchmarks use the stand-in models, so they run without torch; benchmarks
+whose dependencies are not installed (emoji for the dictionary imputer) are recorded as skipped.
+"""
+
+import os
+import sys
+import gzip
+import json
+import time
+import shutil
+import argparse
+import datetime
+import platform
+import subprocess
+import tempfile
+import numpy as np
+import pandas as pd
+
+SRC_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(SRC_PATH)
+sys.path.append(os.path.join(SRC_PATH, "project_ida"))
+
+import synthetic_data
+from synthetic_data import StandInEmbedding, StandInClassifier
+
+def read_raw_texts(path):
+    """
+    (text, lang) pairs of the tweets in a raw hour-file
+    """
+    texts = []
+    with gzip.open(path, "r") as f:
+        for line in f:
+            tweet = json.loads(line)
+            if "text" in tweet:
+                texts.append((tweet["text"], tweet["lang"]))
+    return texts
+
+def bench_gz_to_dataframe(data):
+    from main_sentiment_imputer import gz_to_dataframe
+    def run():
+        return sum(len(gz_to_dataframe(path)) for path in data["oneperc_paths"])
+    return run
+
+def bench_tweet_file_oneperc(data):
+    from tweet_file import TweetFile
+    def run():
+        return sum(TweetFile(path, is_geo=False, locs_only=True).get_len_all_tweets() for path in data["oneperc_paths"])
+    return run
+
+def bench_tweet_file_geo(data):
+    from tweet_file import TweetFile
+    def run():
+        return sum(TweetFile(path, is_geo=True).get_len_tweets() for path in data["geo_paths"])
+    return run
+
+def bench_clean_for_content(data):
+    from utils.data_read_in import clean_for_content
+    texts = read_raw_texts(data["oneperc_paths"][0])
+    def run():
+        for text, lang in texts:
+            clean_for_content(text, lang)
+        return len(texts)
+    return run
+
+def bench_dict_imputer(data):
+    from utils.dict_sentiment_imputer import by_chunk, _build_trie
+    from utils.data_read_in import clean_for_content
+    texts = read_raw_texts(data["oneperc_paths"][0])
+    df = pd.DataFrame({"message_id": np.arange(len(texts)), "lang": [lang for _, lang in texts],
+                       "text_clean": [clean_for_content(text, lang) for text, lang in texts]})
+
+    # Stand-in hedonometer and LIWC dictionaries over the synthetic vocabulary, so no dictionary files are needed
+    rng = np.random.default_rng(data["seed"])
+    words = synthetic_data.WORDS
+    hedono = {lang: dict(zip(words, np.round(rng.random(len(words)), 2))) for lang in set(df["lang"])}
+    lexicon = {word[:4] + "*" if ind % 3 == 0 else word: [["posemo", "negemo"][ind % 2]] for ind, word in enumerate(words)}
+    liwc = {lang: {"trie": _build_trie(lexicon), "xwalk": {"126": "posemo", "127": "negemo"}, "year": 2007}
+            for lang in set(df["lang"])}
+    args = argparse.Namespace(score_digits=6)
+    def run():
+        by_chunk(df, "hedono", hedono, args)
+        by_chunk(df, "liwc", liwc, args)
+        return 2 * len(df)
+    return run
+
+def bench_embed_imputer(data):
+    from main_sentiment_imputer import impute_sentiment_embed
+    args = argparse.Namespace(data_path=data["raw_path"], emb_model=StandInEmbedding(), clf_model=StandInClassifier(),
+                              batch_size=100, score_digits=6)
+    names = [os.path.basename(path) for path in data["oneperc_paths"]]
+    def run():
+        return sum(len(impute_sentiment_embed(name, "onepercent", args)) for name in names)
+    return run
+
+def bench_find_location(data):
+    from inference import Inference
+    users = synthetic_data.random_users(data["n_users"], data["n_users"], data["seed"])
+    def run():
+        # A new Inference object every run, so the in-memory location cache starts empty
+        inference = Inference(data["names_path"])
+        inference.find_location(users)
+        return len(users)
+    return run
+
+def bench_unique_users(data):
+    from unique_users import UniqueUsers
+    batches = [synthetic_data.random_users(data["tweets_per_hour"], data["n_users"], data["seed"] + hour)
+               for hour in range(data["hours"])]
+    def run():
+        unique_users = UniqueUsers()
+        for batch in batches:
+            unique_users.update_users(batch)
+        unique_users.get_users()
+        return sum(len(batch) for batch in batches)
+    return run
+
+def bench_run_aggregation(data):
+    from utils.aggregation_utils import run_aggregation
+    date = data["date"].strftime("%Y-%m-%d")
+    def run():
+        args = argparse.Namespace(
+            text_path=data["text_path"], geo_path=data["geo_path"], sent_path=data["sent_path"],
+            sentiment_method="bert", countries=[], geo_level="admin1", time_level="day", name_ext="_bench",
+            incl_keywords=["storm", "flood"], excl_keywords=[], lang_level=False, ind_level=False,
+            subset_usernames_file="", start_date=date, end_date=date, ind_robust_threshold=1)
+        # save_df writes to data/aggregate_sentiment relative to the working directory
+        cwd = os.getcwd()
+        os.chdir(data["agg_out_path"])
+        try:
+            run_aggregation(args)
+        finally:
+            os.chdir(cwd)
+        return 24 * data["tweets_per_hour"]
+    return run
+
+BENCHMARKS = {
+    "gz_to_dataframe": bench_gz_to_dataframe,
+    "tweet_file_oneperc": bench_tweet_file_oneperc,
+    "tweet_file_geo": bench_tweet_file_geo,
+    "clean_for_content": bench_clean_for_content,
+    "dict_imputer": bench_dict_imputer,
+    "embed_imputer": bench_embed_imputer,
+    "find_location": bench_find_location,
+    "unique_users": bench_unique_users,
+    "run_aggregation": bench_run_aggregation,
+}
+
+def generate_data(args, data_path):
+    """
+    Generate all synthetic inputs in data_path
+    """
+    date = datetime.date(2021, 8, 29)
+    data = {"seed": args.seed, "tweets_per_hour": args.tweets_per_hour, "hours": args.hours, "n_users": args.n_users,
+            "date": date, "raw_path": os.path.join(data_path, "raw")}
+
+    oneperc_path = os.path.join(data["raw_path"], "onepercent")
+    geo_path = os.path.join(data["raw_path"], "worldgeo")
+    names = synthetic_data.generate_raw_hours(oneperc_path, "onepercent", args.hours, args.tweets_per_hour,
+                                              args.n_users, args.seed, date)
+    data["oneperc_paths"] = [os.path.join(oneperc_path, name) for name in names]
+    names = synthetic_data.generate_raw_hours(geo_path, "worldgeo", args.hours, args.tweets_per_hour,
+                                              args.n_users, args.seed + 1, date)
+    data["geo_paths"] = [os.path.join(geo_path, name) for name in names]
+
+    data["names_path"] = os.path.join(data_path, "Location_synthetic.xlsx")
+    synthetic_data.generate_location_names(data["names_path"], seed=args.seed)
+
+    for key in ["text_path", "geo_path", "sent_path"]:
+        data[key] = os.path.join(data_path, "aggregation", key[:-5])
+    synthetic_data.generate_aggregation_hours(data["text_path"], data["geo_path"], data["sent_path"],
+                                              tweets_per_hour=args.tweets_per_hour, n_users=args.n_users,
+                                              seed=args.seed, date=date)
+    data["agg_out_path"] = os.path.join(data_path, "aggregation_out")
+    os.makedirs(os.path.join(data["agg_out_path"], "data", "aggregate_sentiment"), exist_ok=True)
+    return data
+
+def run_benchmark(name, data, repeats):
+    """
+    Set up and time a benchmark. Returns a dictionary with the timings, or the reason it was skipped
+    """
+    try:
+        run = BENCHMARKS[name](data)
+    except ImportError as e:
+        print("Skipping {}: {}".format(name, e))
+        return {"skipped": str(e)}
+
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        items = run()
+        times.append(time.perf_counter() - start)
+    best = min(times)
+    return {"items": items, "best_seconds": round(best, 4), "mean_seconds": round(float(np.mean(times)), 4),
+            "items_per_second": round(items / best, 1) if best > 0 else None}
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SRC_PATH, capture_output=True,
+                              text=True).stdout.strip()
+    except OSError:
+        return ""
+
+def compare(results, path):
+    """
+    Print the speedup of every benchmark against an earlier run
+    """
+    with open(path) as f:
+        before = json.load(f)["results"]
+    print("\n{:<22}{:>14}{:>14}{:>10}".format("benchmark", "before (s)", "now (s)", "speedup"))
+    for name, result in results.items():
+        if "best_seconds" in result and "best_seconds" in before.get(name, {}):
+            old = before[name]["best_seconds"]
+            print("{:<22}{:>14}{:>14}{:>9.2f}x".format(name, old, result["best_seconds"],
+                                                       old / max(result["best_seconds"], 1e-9)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output_path", default="output/benchmarks", type=str, help="Folder for the results files")
+    parser.add_argument("--data_path", default="", type=str,
+                        help="Folder for the synthetic data (default: a temporary folder that is removed afterwards)")
+    parser.add_argument("--only", nargs="*", default=[], type=str,
+                        help="Benchmarks to run (default all): " + ", ".join(BENCHMARKS))
+    parser.add_argument("--seed", default=0, type=int, help="Seed of the synthetic data")
+    parser.add_argument("--tweets_per_hour", default=5000, type=int, help="Tweets in every synthetic hour-file")
+    parser.add_argument("--hours", default=4, type=int, help="Number of synthetic raw hour-files per stream")
+    parser.add_argument("--n_users", default=5000, type=int, help="Number of synthetic users")
+    parser.add_argument("--repeats", default=3, type=int, help="How many times every benchmark is run")
+    parser.add_argument("--compare", default="", type=str, help="Results file of an earlier run to compare with")
+    args = parser.parse_args()
+
+    names = args.only if len(args.only) > 0 else list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            raise ValueError("Unknown benchmark {}, choose from {}".format(name, ", ".join(BENCHMARKS)))
+
+    data_path = args.data_path if args.data_path != "" else tempfile.mkdtemp(prefix="benchmark_data_")
+    print("Generating synthetic data in ", data_path)
+    data = generate_data(args, data_path)
+
+    results = {}
+    try:
+        for name in names:
+            print("\nBenchmark: ", name)
+            results[name] = run_benchmark(name, data, args.repeats)
+    finally:
+        if args.data_path == "":
+            shutil.rmtree(data_path)
+
+    run_info = {"timestamp": datetime.datetime.now().isoformat(timespec="seconds"), "commit": git_commit(),
+                "python": platform.python_version(), "machine": platform.machine(), "processor": platform.processor(),
+                "cpu_count": os.cpu_count(),
+                "params": {key: vars(args)[key] for key in ["seed", "tweets_per_hour", "hours", "n_users", "repeats"]},
+                "results": results}
+
+    os.makedirs(args.output_path, exist_ok=True)
+    out_file = os.path.join(args.output_path, "bench_{}.json".format(datetime.datetime.now().strftime("%Y%m%d_%H%M%S")))
+    with open(out_file, "w") as f:
+        json.dump(run_info, f, indent=2)
+
+    print("\n{:<22}{:>12}{:>16}".format("benchmark", "best (s)", "items/s"))
+    for name, result in results.items():
+        if "skipped" in result:
+            print("{:<22}{:>12}".format(name, "skipped"))
+        else:
+            print("{:<22}{:>12}{:>16}".format(name, result["best_seconds"], result["items_per_second"]))
+    print("Results written to ", out_file)
+
+    if args.compare != "":
+        compare(results, args.compare)
@@ -0,0 +1,192 @@
+"""
+Seeded synthetic data for the benchmarks. Generates hour-files in the raw schema (gzip JSON lines with id, lang, text,
+user.id, user.location and place), the hourly text/geo/sentiment .tsv files read by utils/aggregation_utils.py, a
+location names file for Inference, and a tiny stand-in embedding model and classifier so everything runs offline.
+The same seed always gives the same files.
+"""
+
+import os
+import zlib
+import gzip
+import json
+import datetime
+import numpy as np
+import pandas as pd
+
+WORDS = ["storm", "power", "out", "flood", "water", "rain", "wind", "house", "happy", "sad", "great", "terrible",
+         "safe", "help", "thanks", "love", "hate", "school", "work", "road", "closed", "open", "family", "friends",
+         "today", "tonight", "morning", "hurricane", "ida", "damage", "lights", "back", "finally", "stay", "home"]
+EXTRAS = ["http://t.co/abc123", "@someone", "&amp;", "w/", "rn", "<3", "#ida", "\U0001F600", "\U0001F622", "&gt;"]
+LANGS = ["en", "en", "en", "en", "es", "fr", "de", "pt"]
+
+# Profile locations: about 30% name one of the cities (in several spellings), the rest are empty or unmatched
+CITIES = ["New Orleans", "Baton Rouge", "Newark", "Jersey City", "Houston", "Jackson"]
+CITY_STATES = {"New Orleans": ("Louisiana", "LA"), "Baton Rouge": ("Louisiana", "LA"), "Newark": ("New Jersey", "NJ"),
+               "Jersey City": ("New Jersey", "NJ"), "Houston": ("Texas", "TX"), "Jackson": ("Mississippi", "MS")}
+OTHER_LOCATIONS = ["", "", "", "Earth", "somewhere", "USA", "London", "the moon", "NYC", "Paris, France", "she/her"]
+
+PLACES = [("city", "New Orleans, LA", "United States"), ("city", "Newark, NJ", "United States"),
+          ("admin", "Louisiana, USA", "United States"), ("admin", "New Jersey, USA", "United States"),
+          ("city", "Austin, TX", "United States"), ("city", "Chicago, IL", "United States"),
+          ("city", "Toronto, Ontario", "Canada"), ("city", "Paris", "France")]
+
+def random_text(rng):
+    n_words = rng.integers(3, 20)
+    words = list(rng.choice(WORDS, n_words))
+    for _ in range(rng.integers(0, 3)):
+        words.insert(rng.integers(0, len(words) + 1), rng.choice(EXTRAS))
+    return " ".join(words)
+
+def random_location(rng):
+    if rng.random() < 0.3:
+        city = CITIES[rng.integers(len(CITIES))]
+        return rng.choice([city, city.upper(), city + ", USA", "near " + city.lower(), city + " 🌴"])
+    return rng.choice(OTHER_LOCATIONS)
+
+def hour_tweets(rng, n_tweets, n_users, first_id, geo):
+    """
+    Returns a list of n_tweets raw tweet dictionaries
+    """
+    # Users keep their profile location, so draw the user table once per call from the same seed
+    user_rng = np.random.default_rng(n_users)
+    user_locs = [random_location(user_rng) for _ in range(n_users)]
+
+    tweets = []
+    tweet_ids = first_id + np.cumsum(rng.integers(1, 1000, n_tweets))
+    for tweet_id in tweet_ids:
+        user = int(rng.integers(n_users))
+        location = user_locs[user] if user_locs[user] != "" else None
+        tweet = {"id": int(tweet_id), "lang": rng.choice(LANGS), "text": random_text(rng),
+                 "user": {"id": 10**9 + user, "location": location}}
+        if geo:
+            place_type, full_name, country = PLACES[rng.integers(len(PLACES))]
+            tweet["place"] = {"place_type": place_type, "full_name": full_name, "country": country}
+        else:
+            tweet["place"] = None
+        tweets.append(tweet)
+    return tweets
+
+def generate_raw_hours(out_dir, stream="onepercent", n_hours=2, tweets_per_hour=2000, n_users=5000, seed=0,
+                       date=datetime.date(2021, 8, 29)):
+    """
+    Write raw hour-files, named like the real onepercent (2021_08_29_00_onepercent.txt.gz) or worldgeo
+    (2021-08-29_00_00_01.txt.gz) files. About 1% of the lines are malformed, like in the real files
+    Returns
+        names: list of file names
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    names = []
+    for hour in range(n_hours):
+        if stream == "onepercent":
+            name = "{}_{}_onepercent.txt.gz".format(date.strftime("%Y_%m_%d"), str(hour).zfill(2))
+        else:
+            name = "{}_{}_00_01.txt.gz".format(date.strftime("%Y-%m-%d"), str(hour).zfill(2))
+        tweets = hour_tweets(rng, tweets_per_hour, n_users, 1430000000000000000 + hour * 10**12, stream != "onepercent")
+        with gzip.open(os.path.join(out_dir, name), "wt", encoding="utf-8") as f:
+            for tweet in tweets:
+                f.write(json.dumps(tweet) + "\n")
+                if rng.random() < 0.01:
+                    f.write('{"delete": {"status": {"id": 1}}}\n')
+        names.append(name)
+    return names
+
+def generate_aggregation_hours(text_path, geo_path, sent_path, n_hours=24, tweets_per_hour=2000, n_users=5000, seed=0,
+                               date=datetime.date(2021, 8, 29), sentiment_method="bert"):
+    """
+    Write the hourly text, geography and sentiment .tsv.gz files of one day, as read by read_hour in
+    utils/aggregation_utils.py. The files are in message_id order; a few tweets have no geography or no score
+    """
+    for path in [text_path, geo_path, sent_path]:
+        os.makedirs(path, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    for hour in range(n_hours):
+        hour_name = "{}_{}_{}_{}".format(date.year, date.month, str(date.day).zfill(2), str(hour).zfill(2))
+        message_ids = 1430000000000000000 + hour * 10**12 + np.cumsum(rng.integers(1, 1000, tweets_per_hour))
+
+        text_df = pd.DataFrame({"message_id": message_ids, "user_id": 10**9 + rng.integers(0, n_users, tweets_per_hour),
+                                "tweet_lang": rng.choice(LANGS, tweets_per_hour),
+                                "text": [random_text(rng) for _ in range(tweets_per_hour)]})
+        text_df.to_csv(os.path.join(text_path, "{}.csv.gz".format(hour_name)), sep="\t", index=False)
+
+        has_geo = rng.random(tweets_per_hour) < 0.95
+        n_geo = int(has_geo.sum())
+        id_1 = rng.integers(1, 52, n_geo)
+        geo_df = pd.DataFrame({"message_id": message_ids[has_geo], "ID_0": np.where(rng.random(n_geo) < 0.8, 244, 42),
+                               "ISO": "", "ID_1": id_1, "ID_2": id_1 * 100 + rng.integers(0, 60, n_geo)})
+        geo_df["ISO"] = np.where(geo_df["ID_0"] == 244, "USA", "CAN")
+        geo_df.to_csv(os.path.join(geo_path, "geography_{}.csv.gz".format(hour_name)), sep="\t", index=False)
+
+        scores = np.round(rng.beta(2, 2, tweets_per_hour), 6)
+        scores[rng.random(tweets_per_hour) < 0.02] = np.nan
+        sent_df = pd.DataFrame({"message_id": message_ids, "score": scores})
+        sent_df.to_csv(os.path.join(sent_path, "{}_sentiment_{}.csv.gz".format(sentiment_method, hour_name)),
+                       sep="\t", index=False)
+
+def generate_location_names(path, n_extra=300, seed=0):
+    r"""
+    Write a location names file like the Location_<area>.xlsx files made by prepare_files.setup_regex_files (columns
+    Name, city, state, state_abbrev and regex): the synthetic cities plus n_extra made-up place names. The cities get
+    the regex of a city unique in the US, like (?i:Newark), except Jackson, which is not unique and gets
+    (?i:Jackson),?\s((?i:MS\b)|(?i:Mississippi))
+    """
+    rng = np.random.default_rng(seed)
+    cities = list(CITIES)
+    syllables = ["ba", "ton", "ville", "port", "ro", "lan", "mer", "ford", "chester", "dale", "ka", "wood"]
+    while len(cities) < len(CITIES) + n_extra:
+        city = "".join(rng.choice(syllables, rng.integers(2, 4))).title()
+        if city not in cities:
+            cities.append(city)
+
+    names, states, abbrevs, regex = [], [], [], []
+    for city in cities:
+        state, abbrev = CITY_STATES.get(city, ("Louisiana", "LA"))
+        states.append(state)
+        abbrevs.append(abbrev)
+        if city == "Jackson":
+            names.append("{}, {}".format(city, abbrev))
+            regex.append(r"(?i:{city}),?\s((?i:{abbrev}\b)|(?i:{state}))".format(city=city, abbrev=abbrev, state=state))
+        else:
+            names.append(city)
+            regex.append("(?i:{city})".format(city=city))
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    pd.DataFrame({"Name": names, "city": cities, "state": states, "state_abbrev": abbrevs,
+                  "regex": regex}).to_excel(path, index=False)
+
+def random_users(n_rows, n_users, seed=0):
+    """
+    DataFrame with user_id and location, with repeated users, like a batch passed to UniqueUsers.update_users
+    """
+    rng = np.random.default_rng(seed)
+    locations = [random_location(rng) for _ in range(n_users)]
+    users = rng.integers(0, n_users, n_rows)
+    return pd.DataFrame({"user_id": 10**9 + users, "location": np.array(locations, dtype=object)[users]})
+
+class StandInEmbedding:
+    """
+    Tiny stand-in for the sentence embedding model: hashed bag of words, with the same encode() signature
+    """
+
+    def __init__(self, dim=64, seed=0):
+        self.dim = dim
+        self.seed = seed
+
+    def encode(self, sentences, show_progress_bar=False, batch_size=100):
+        emb = np.zeros((len(sentences), self.dim), dtype=np.float32)
+        for row, sentence in enumerate(sentences):
+            for word in str(sentence).lower().split():
+                emb[row, zlib.crc32(word.encode("utf-8"), self.seed) % self.dim] += 1
+        norms = np.linalg.norm(emb, axis=1, keepdims=True)
+        return emb / np.maximum(norms, 1)
+
+class StandInClassifier:
+    """
+    Tiny stand-in for the trained classifier: logistic regression with fixed random weights
+    """
+
+    def __init__(self, dim=64, seed=0):
+        self.weights = np.random.default_rng(seed).normal(size=dim)
+
+    def predict_proba(self, embeddings):
+        prob = 1 / (1 + np.exp(-np.asarray(embeddings) @ self.weights))
+        return np.column_stack([1 - prob, prob])
@@ -4,7 +4,6 @@ import multiprocessing
 
 import pandas as pd
 import numpy as np
-import torch
 import gzip
 import os
 import glob
@@ -13,6 +12,13 @@ import re
 
 from utils.data_read_in import clean_for_content
 from utils.emb_sentiment_imputer import create_embeddings
+from utils.score_index import write_score_index
+from utils.file_catalog import filter_names, parse_file_name
+from utils.score_io import OUTPUT_FORMATS, score_file_path, write_scores
+from utils.scoring_client import ScoringClient, ScoringServiceError
+from utils.id_filter import load_id_filter
+from utils.metrics import Metrics, get_metrics
+from utils.profiling import make_profiler, add_profile_args
 
 def extract_latest_file(path):
     """
@@ -34,6 +40,22 @@ def extract_latest_ind(args, year):
     index = args.file_names.index(latest_input_file)
     return index
 
+def list_raw_files(path):
+    """
+    Returns the sorted names of the raw .txt.gz files in a folder (not their sidecar indexes or other files): the name
+    of the file, like 2013-08.txt.gz, and not its full path, for easy reference later
+    """
+    return sorted([os.path.basename(elem) for elem in glob.glob(os.path.join(path, "*.txt.gz"))])
+
+def select_file_names(file_names, year, args):
+    """
+    Keep the file names of args.months of the year, or all if no months are given. Names without a date, like a README
+    in the data folder, are left out with a message: the columnar outputs can not be partitioned without their month
+    """
+    if args.months == '':
+        return filter_names(file_names)
+    return filter_names(file_names, year=year, months=args.months)
+
 def extract_date(basename):
     """
     Extract the date from a basename, like so: sentiment_2016-05-06_16_00_02.csv --> 2016-05-06_16_00_02
@@ -42,44 +64,36 @@ def extract_date(basename):
     end_index = basename.index(".")
     return basename[date_index:end_index]
 
-def extract_month_files(args, year):
+def gz_to_dataframe(file_path, metrics=None):
     """
-    Returns files only from month(s) specified in args for the year given as parameter
+    Converts .txt.gz file to pandas DataFrame format. The tweet text, language, message ID and user ID are saved
+        @param file_path: path to file containing tweets. Every file contains tweets sent within an hour interval,
+        like 2013-08-26_03_00_02.
+        @param metrics: optional Metrics object to time the read and parse stages and count the lines
     """
-    months = [int(x) for x in args.months]
-    low = min(months)
-    high = max(months)
-
-    # Append 0's to month-numbers under 10 because they appear so in filenames (e.g. 9 is 09)
-    low = f"0{low}" if low < 10 else low
-    high = f"0{high}" if high < 10 else high
+    if metrics is None:
+        metrics = Metrics(enabled=False)
 
-    low_ind = -1
-    # for worldgeo the files are named like so: 2021-01-01_00_00_01.txt.gz
-    # for onepercent the files are named like so: 2021_01_01_00_onepercent.txt.gz
-    # We thus have two different dashes
-    dash_str = "-" if args.tweet_type == "worldgeo" else "_"
-
-    for index, f in enumerate(args.file_names):
-        if f.startswith(f"{year}{dash_str}{str(low)}"):
-            if low_ind == -1:
-                low_ind = index
+    print("Converting gzip file to dataframe..")
+    with metrics.stage("read"):
+        with gzip.open(file_path, "r") as f:
+            lines = f.readlines()
+    metrics.count("bytes_compressed", os.path.getsize(file_path))
+    metrics.count("bytes_read", sum(len(line) for line in lines))
 
-        if f.startswith(f"{year}{dash_str}{str(high)}"):
-            high_ind = index
+    with metrics.stage("parse"):
+        tweets = parse_lines(lines)
 
-    return args.file_names[low_ind:(high_ind + 1)]
+    print("{} entries out of {} were discarded".format(len(lines)-len(tweets), len(lines)))
+    metrics.count("lines", len(lines))
+    metrics.count("discarded_lines", len(lines) - len(tweets))
+    df = pd.DataFrame(tweets)
+    return df
 
-def gz_to_dataframe(file_path):
+def parse_lines(lines):
     """
-    Converts .txt.gz file to pandas DataFrame format. The tweet text, language, message ID and user ID are saved
-        @param file_path: path to file containing tweets. Every file contains tweets sent within an hour interval,
-        like 2013-08-26_03_00_02.
+    Parse the JSON lines of a tweet file, keeping the lines with text, language, message ID and user ID
     """
-    print("Converting gzip file to dataframe..")
-    with gzip.open(file_path, "r") as f:
-        lines = f.readlines()
-
     tweets = []
     for line in lines:
         try:
@@ -93,10 +107,20 @@ def gz_to_dataframe(file_path):
             tweets.append(tweet)
         except:
             continue
+    return tweets
 
-    print("{} entries out of {} were discarded".format(len(lines)-len(tweets), len(lines)))
-    df = pd.DataFrame(tweets)
-    return df
+def select_targets(df, args):
+    """
+    Targeted scoring: keep only the tweets from the target users or with a target tweet ID (either one is enough when
+    both are given), so the other tweets are never cleaned or encoded
+    """
+    keep = np.zeros(len(df), dtype=bool)
+    if args.user_filter is not None:
+        keep |= args.user_filter.contains(df['user_id'].to_numpy(dtype=np.int64))
+    if args.tweet_filter is not None:
+        keep |= args.tweet_filter.contains(df['message_id'].to_numpy(dtype=np.int64))
+    print("Targeted scoring: {} of {} tweets selected".format(keep.sum(), len(df)))
+    return df[keep].reset_index(drop=True)
 
 def impute_sentiment_embed(file_name, year, args):
     """
@@ -107,13 +131,20 @@ def impute_sentiment_embed(file_name, year, args):
         year: year of the tweets
         args: arguments from ArgParser
     """
+    metrics = get_metrics(args)
     file_path = os.path.join(args.data_path, year, file_name)
-    df = gz_to_dataframe(file_path)
+    df = gz_to_dataframe(file_path, metrics)
+    metrics.count("rows_in", len(df))
+
+    if getattr(args, 'user_filter', None) is not None or getattr(args, 'tweet_filter', None) is not None:
+        with metrics.stage("filter"):
+            df = select_targets(df, args)
 
     print("Cleaning data")
 
-    df['text'] = [clean_for_content(text, lang) for text, lang in zip(df['text'], df['lang'])]
-    df = df[df['text'] != ""].reset_index(drop=True)  # some tweets might have empty text fields after clean_for_content
+    with metrics.stage("clean"):
+        df['text'] = [clean_for_content(text, lang) for text, lang in zip(df['text'], df['lang'])]
+        df = df[df['text'] != ""].reset_index(drop=True)  # some tweets might have empty text fields after clean_for_content
 
     # args.emb_model = torch.load('models/emb.pkl')
     # args.clf_model = torch.load('models/clf.pkl')
@@ -121,16 +152,40 @@ def impute_sentiment_embed(file_name, year, args):
     predictions, scores = [], []
 
     print("Imputing Sentiment")
-    embeddings = create_embeddings(args.emb_model, df, args)
-
-    # predictions += list(args.clf_model.predict(embeddings))
-    scores += list(args.clf_model.predict_proba(embeddings)[:, 1])
-    del embeddings
+    if getattr(args, 'scoring_client', None) is not None:
+        # Client mode: the scoring service encodes and classifies, batched with the texts of its other clients
+        with metrics.stage("score_service"):
+            scores += list(args.scoring_client.score(df['text'].values))
+    else:
+        with metrics.stage("encode"):
+            embeddings = create_embeddings(args.emb_model, df, args)
+
+        # predictions += list(args.clf_model.predict(embeddings))
+        with metrics.stage("classify"):
+            scores += list(args.clf_model.predict_proba(embeddings)[:, 1])
+        del embeddings
 
     df['score'] = np.round(scores, args.score_digits)
     scores = df[['message_id', 'user_id', 'score']]  # data frame with only the message ID's, tweet ID's and sentiment scores
+    metrics.count("rows_out", len(scores))
     return scores
 
+def load_models(args):
+    """
+    Load the embedding model and classifier trained by setup_emb_clf.py into args.emb_model and args.clf_model
+    """
+    import torch # Imported here, so the parsing and client mode (--scoring_url) run without torch installed
+
+    if torch.cuda.is_available():
+        args.emb_model = torch.load('models/emb.pkl')
+        args.clf_model = torch.load('models/clf.pkl')
+    else:
+        print("WARNING: Running on CPU")
+        args.emb_model = torch.load('models/emb.pkl', map_location=torch.device('cpu'))
+        args.emb_model._target_device = torch.device(type='cpu')
+        args.clf_model = torch.load('models/clf.pkl', map_location=torch.device('cpu'))
+        args.clf_model._target_device = torch.device(type='cpu')
+
 def imputer(file_name, year, args):
     """
     Imputer function to call the impute_sentiment sub-function and write the output to a csv file
@@ -138,14 +193,32 @@ def imputer(file_name, year, args):
         file_name: file name for which sentiment will be computed. Note, it is a file name and not a full path
         args: arguments from ArgParser
     """
-    try:
-        senti_scores = impute_sentiment_embed(file_name, year, args)
+    metrics = get_metrics(args)
+    entry = parse_file_name(file_name) # Only the columnar formats need the month, for their year=/month= partitions
+    if entry is None and args.output_format != 'csv':
+        raise ValueError("Can not tell the month of {} for the {} output".format(file_name, args.output_format))
 
-        out_path = os.path.join(args.output_path, args.tweet_type, year)
-        print("Out path: ", out_path)
-        senti_scores.to_csv(os.path.join(out_path, "sentiment_{}.csv".format(extract_date(file_name))))
-    except:
-        print("File {} does not contain tweets".format(file_name))
+    with metrics.file(file_name):
+        try:
+            senti_scores = impute_sentiment_embed(file_name, year, args)
+
+            out_file = score_file_path(os.path.join(args.output_path, args.tweet_type), year,
+                                       entry.month if entry is not None else None,
+                                       "sentiment_{}".format(extract_date(file_name)), args.output_format)
+            print("Out path: ", os.path.dirname(out_file))
+            with metrics.stage("write"):
+                write_scores(senti_scores, out_file, args.output_format)
+
+                if args.score_index_path != '':
+                    # Sorted id/score arrays for fast lookups by message ID, see utils/score_index.py
+                    index_path = os.path.join(args.score_index_path, args.tweet_type, year)
+                    write_score_index(senti_scores, index_path, extract_date(file_name))
+        except ScoringServiceError:
+            # Not a problem of this file: stop instead of skipping every next file without scores
+            raise
+        except:
+            print("File {} does not contain tweets".format(file_name))
+            metrics.count("failed_files")
 
 
 if __name__ == '__main__':
@@ -154,6 +227,11 @@ if __name__ == '__main__':
     parser.add_argument('--platform', default='', help='Which social media data are we using (twitter, weibo)?')
     parser.add_argument('--data_path', default='', type=str, help='Path to data folder')
     parser.add_argument('--output_path', default='data/sentiment_scores/', type=str, help='path to output')
+    parser.add_argument('--output_format', default='csv', type=str, choices=OUTPUT_FORMATS,
+                        help='format of the score files: csv, or parquet/feather (int64 IDs, float32 scores, zstd, '
+                             'partitioned in year=/month= folders)')
+    parser.add_argument('--score_index_path', default='', type=str,
+                        help='path to also write the memory-mapped score index to (sorted message ID and score arrays)')
     parser.add_argument('--dict_methods', nargs='*', default='liwc emoji hedono', help='Which dict techniques do you '
                                                                                        'want to use?')
     parser.add_argument('--emb_methods', nargs='*', default='bert',
@@ -165,43 +243,62 @@ if __name__ == '__main__':
     parser.add_argument('--months', nargs='*', default='', type=str, help='For which month(s) do we want to compute sentiment')
     parser.add_argument('--tweet_type', default='worldgeo', help='What type of tweets are we analyzing? (worldgeo, onepercent)')
 
+    # Targeted scoring parameters
+    parser.add_argument('--target_users', default='', type=str,
+                        help='only score tweets of these users: affected users .csv (like <area>_unique_users_loc.csv), '
+                             'folder of .csv files, .npy or .txt file of user IDs, or a saved .bloom.npz filter')
+    parser.add_argument('--target_tweets', default='', type=str,
+                        help='only score these tweets: affected tweets .csv or folder, .npy or .txt file of tweet IDs, '
+                             'or a saved .bloom.npz filter')
+    parser.add_argument('--bloom', action='store_true',
+                        help='use a Bloom filter instead of an exact set for the target IDs (less memory)')
+    parser.add_argument('--bloom_error_rate', default=0.001, type=float, help='false positive rate of the Bloom filter')
+
     # Emb based parameters
     parser.add_argument('--batch_size', default=100, type=int, help='batch size')
+    parser.add_argument('--scoring_url', default='', type=str,
+                        help='score with a running scoring service (src/scoring_service.py) at this address, like '
+                             'http://127.0.0.1:8765, instead of loading the models')
 
     # Dict based parameters
     parser.add_argument('--max_rows', default=2500000, type=int, help='Run by chunks of how many rows')
     parser.add_argument('--nb_cores', default=min(16, multiprocessing.cpu_count()), type=int, help='')
 
-    args = parser.parse_args()
+    parser.add_argument('--metrics_path', default='', type=str,
+                        help='JSON-lines file to write the per-file stage timings, counts and memory to')
+    add_profile_args(parser)
 
-    if 'bert' in args.emb_methods:
-        if torch.cuda.is_available():
-            args.emb_model = torch.load('models/emb.pkl')
-            args.clf_model = torch.load('models/clf.pkl')
-        else:
-            print("WARNING: Running on CPU")
-            args.emb_model = torch.load('models/emb.pkl', map_location=torch.device('cpu'))
-            args.emb_model._target_device = torch.device(type='cpu')
-            args.clf_model = torch.load('models/clf.pkl', map_location=torch.device('cpu'))
-            args.clf_model._target_device = torch.device(type='cpu')
+    args = parser.parse_args()
+    args.metrics = Metrics(args.metrics_path if args.metrics_path != '' else None, run_name="sentiment_imputer",
+                           profiler=make_profiler(args, "sentiment_imputer", os.path.join(args.output_path, "profiles")))
+
+    args.scoring_client = None
+    if args.scoring_url != '':
+        args.scoring_client = ScoringClient(args.scoring_url)
+        print("Scoring with the service at {}: {}".format(args.scoring_url, args.scoring_client.health()))
+    elif 'bert' in args.emb_methods:
+        load_models(args)
+
+    args.user_filter, args.tweet_filter = None, None
+    if args.target_users != '':
+        args.user_filter = load_id_filter(args.target_users, 'user_id', args.bloom, args.bloom_error_rate)
+    if args.target_tweets != '':
+        args.tweet_filter = load_id_filter(args.target_tweets, 'tweet_id', args.bloom, args.bloom_error_rate)
 
     for year in args.years:
         if args.filename == '':
-            path = os.path.join(args.data_path, year)
-            args.file_names = sorted([os.path.basename(elem) for elem in glob.glob(os.path.join(path, "*"))])
-            # store the name of the file, like 2013-08.txt.gz, and not its full path, for easy reference later
+            args.file_names = list_raw_files(os.path.join(args.data_path, year))
         else:
             args.file_names = [args.filename]
 
+        args.file_names = select_file_names(args.file_names, year, args)
+
         # Hard-coded year where the imputer was stopped because of Supercloud maintenance
         if year == '2017':
             # Files still to go from this specific year
             latest_index = extract_latest_ind(args, year) + 1
             args.file_names = args.file_names[latest_index:]
 
-        if args.months != '':
-            args.file_names = extract_month_files(args, year)
-
         print(f"Running for year {year}. This year has {len(args.file_names)} files.")
 
         for i, file_name in enumerate(args.file_names):
@@ -210,6 +307,7 @@ if __name__ == '__main__':
             imputer(file_name, year, args)
             print("Runtime: {} minutes\n\n".format(round((time.time() - start) / 60, 1)))
 
+    args.metrics.summary()
     print("Done. All sentiment scores computed.")
 
 
@@ -0,0 +1,248 @@
+"""
+Sidecar index for random access into the raw hourly .txt.gz files, e.g. to pull the tweets of a few thousand users
+or tweet ID's to audit Inference matches without parsing whole hour-files. The index of a file holds
+    checkpoints: (compressed offset, uncompressed offset) of every gzip member, the points where decompression can
+                 start (like BGZF, which is a series of small gzip members). A file written as one gzip member has a
+                 single checkpoint at its start
+    tweet_ids, tweet_offsets: sorted tweet ID's and the uncompressed byte offset of their line
+    user_ids, user_offsets: the same, sorted by user ID (a user can have several tweets)
+A lookup decompresses from the nearest checkpoint before the first needed line and only reads forward from there,
+parsing just the needed lines. The index is built while TweetFile parses a file (TweetFile(..., index_path=...)), so
+it costs no extra pass, or with the command line:
+    python3 src/project_ida/gzip_index.py build --input /data1/groups/SUL_TWITTER/onepercent/2021 --index_path data/gzip_index
+    python3 src/project_ida/gzip_index.py lookup --input /data1/groups/SUL_TWITTER/onepercent/2021/2021_08_29_00_onepercent.txt.gz --index_path data/gzip_index --user_ids 123 456
+The index is saved as <index_path>/<file name>.idx.npz, or in a gzip_index/ folder next to the file if index_path is
+empty, so the indexes do not end up in the listings of the raw files.
+"""
+
+import os
+import json
+import zlib
+import argparse
+import numpy as np
+
+INDEX_EXT = ".idx.npz"
+DEFAULT_INDEX_FOLDER = "gzip_index" # Sub-folder of the raw files' folder for the indexes if no index_path is given
+CHUNK_SIZE = 1 << 20
+
+def index_file_path(path, index_path=""):
+    folder = index_path if index_path else os.path.join(os.path.dirname(os.path.abspath(path)), DEFAULT_INDEX_FOLDER)
+    return os.path.join(folder, os.path.basename(path) + INDEX_EXT)
+
+def decompress_members(f, start=0, out_start=0, checkpoints=None, chunk_size=CHUNK_SIZE):
+    """
+    Decompress the gzip members of an open file from the compressed offset start
+    Params
+        f: file opened in binary mode
+        start, out_start: compressed and uncompressed offset to start at, must be the start of a gzip member
+        checkpoints: optional list to append the (compressed offset, uncompressed offset) of every member to
+    Returns
+        generator of decompressed chunks
+    """
+    f.seek(start)
+    offset, out_pos = start, out_start
+    pending = b""
+    decompressor = None
+    while True:
+        if len(pending) == 0:
+            pending = f.read(chunk_size)
+            if len(pending) == 0:
+                return
+        if decompressor is None:
+            if pending[:1] != b"\x1f": # Padding after the last member, not a new member
+                return
+            decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+            if checkpoints is not None:
+                checkpoints.append((offset, out_pos))
+
+        out = decompressor.decompress(pending)
+        if decompressor.eof:
+            used = len(pending) - len(decompressor.unused_data)
+            pending = decompressor.unused_data
+            decompressor = None
+        else:
+            used = len(pending)
+            pending = b""
+        offset += used
+        if len(out) > 0:
+            out_pos += len(out)
+            yield out
+
+def iter_lines(path, checkpoints=None):
+    """
+    Stream the lines of a gzip file like gzip.open, recording the member checkpoints on the way
+    Returns
+        generator of (uncompressed offset, line) tuples
+    """
+    with open(path, "rb") as f:
+        pos, tail = 0, b""
+        for chunk in decompress_members(f, checkpoints=checkpoints):
+            lines = (tail + chunk).split(b"\n")
+            tail = lines.pop()
+            for line in lines:
+                line += b"\n"
+                yield pos, line
+                pos += len(line)
+        if len(tail) > 0:
+            yield pos, tail
+
+class GzipIndexBuilder:
+    """
+    GzipIndexBuilder class to collect the index of a file while it is parsed: iterate over lines() and call add()
+    for every parsed tweet
+    Params
+        path: path of the .txt.gz file
+        index_path: folder for the index - default "" (gzip_index/ next to the file)
+    """
+
+    def __init__(self, path, index_path=""):
+        self.path = path
+        self.index_path = index_path
+        self.checkpoints = []
+        self.tweet_ids, self.user_ids, self.offsets = [], [], []
+
+    def lines(self):
+        return iter_lines(self.path, self.checkpoints)
+
+    def add(self, tweet_id, user_id, offset):
+        self.tweet_ids.append(tweet_id)
+        self.user_ids.append(user_id)
+        self.offsets.append(offset)
+
+    def save(self):
+        tweet_ids = np.array(self.tweet_ids, dtype=np.int64)
+        user_ids = np.array(self.user_ids, dtype=np.int64)
+        offsets = np.array(self.offsets, dtype=np.int64)
+        by_tweet = np.argsort(tweet_ids, kind="stable")
+        by_user = np.lexsort((offsets, user_ids))
+
+        out_file = index_file_path(self.path, self.index_path)
+        os.makedirs(os.path.dirname(out_file), exist_ok=True)
+        tmp_file = out_file[:-len(".npz")] + ".tmp.npz"
+        np.savez(tmp_file, checkpoints=np.array(self.checkpoints, dtype=np.int64).reshape(-1, 2),
+                 tweet_ids=tweet_ids[by_tweet], tweet_offsets=offsets[by_tweet],
+                 user_ids=user_ids[by_user], user_offsets=offsets[by_user],
+                 file_size=os.path.getsize(self.path))
+        os.replace(tmp_file, out_file)
+        return out_file
+
+def build_index(path, index_path=""):
+    """
+    Build the index of a file on its own, outside of TweetFile
+    """
+    builder = GzipIndexBuilder(path, index_path)
+    for offset, line in builder.lines():
+        try:
+            dict_line = json.loads(line)
+            builder.add(dict_line['id'], dict_line['user']['id'], offset)
+        except:
+            continue
+    return builder.save()
+
+class ForwardReader:
+    """
+    Reads lines at increasing uncompressed offsets, decompressing forward from a checkpoint
+    """
+
+    def __init__(self, f, start, out_start):
+        self.chunks = decompress_members(f, start, out_start)
+        self.buf = b""
+        self.buf_start = out_start
+
+    def line_at(self, offset):
+        while self.buf_start + len(self.buf) <= offset:
+            self.buf_start += len(self.buf)
+            self.buf = next(self.chunks, b"")
+            if len(self.buf) == 0:
+                return None
+        pos = offset - self.buf_start
+        end = self.buf.find(b"\n", pos)
+        while end < 0:
+            # The line continues in the next chunk; drop the part of the buffer before the line
+            more = next(self.chunks, None)
+            if more is None:
+                return self.buf[pos:]
+            self.buf = self.buf[pos:] + more
+            self.buf_start += pos
+            pos = 0
+            end = self.buf.find(b"\n")
+        return self.buf[pos:end + 1]
+
+class GzipIndex:
+    """
+    GzipIndex class to look up tweets in a raw .txt.gz file through its sidecar index
+    Params
+        path: path of the .txt.gz file
+        index_path: folder of the index - default "" (gzip_index/ next to the file)
+    """
+
+    def __init__(self, path, index_path=""):
+        self.path = path
+        data = np.load(index_file_path(path, index_path))
+        if int(data["file_size"]) != os.path.getsize(path):
+            raise ValueError("Index of {} is out of date, build it again".format(path))
+        self.checkpoints = data["checkpoints"]
+        self.tweet_ids, self.tweet_offsets = data["tweet_ids"], data["tweet_offsets"]
+        self.user_ids, self.user_offsets = data["user_ids"], data["user_offsets"]
+
+    def __len__(self):
+        return len(self.tweet_ids)
+
+    def offsets_of(self, ids, sorted_ids, offsets):
+        ids = np.unique(np.asarray(ids, dtype=np.int64))
+        left = np.searchsorted(sorted_ids, ids, side="left")
+        right = np.searchsorted(sorted_ids, ids, side="right")
+        found = [offsets[l:r] for l, r in zip(left, right) if r > l]
+        return np.unique(np.concatenate(found)) if len(found) > 0 else np.empty(0, dtype=np.int64)
+
+    def read_lines(self, offsets):
+        """
+        Lines at the given uncompressed offsets, in file order
+        Returns
+            generator of (offset, line) tuples
+        """
+        offsets = np.unique(np.asarray(offsets, dtype=np.int64))
+        with open(self.path, "rb") as f:
+            reader = None
+            for offset in offsets:
+                checkpoint = np.searchsorted(self.checkpoints[:, 1], offset, side="right") - 1
+                start, out_start = self.checkpoints[checkpoint]
+                # Jump to the checkpoint if it is ahead of the reader, otherwise keep reading forward
+                if reader is None or out_start > reader.buf_start:
+                    reader = ForwardReader(f, int(start), int(out_start))
+                line = reader.line_at(int(offset))
+                if line is not None:
+                    yield int(offset), line
+
+    def lookup(self, tweet_ids=(), user_ids=()):
+        """
+        Tweets with one of the tweet ID's or from one of the users, parsed from the raw lines
+        Returns
+            tweets: list of tweet dictionaries, in file order
+        """
+        offsets = np.concatenate([self.offsets_of(tweet_ids, self.tweet_ids, self.tweet_offsets),
+                                  self.offsets_of(user_ids, self.user_ids, self.user_offsets)])
+        return [json.loads(line) for _, line in self.read_lines(offsets)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["build", "lookup"], help="Build indexes or look up tweets")
+    parser.add_argument("--input", default="", type=str, help=".txt.gz file, or folder of .txt.gz files to build")
+    parser.add_argument("--index_path", default="", type=str,
+                        help="Folder of the indexes (default: a gzip_index/ folder next to the files)")
+    parser.add_argument("--tweet_ids", nargs="*", default=[], type=int, help="Tweet ID's to look up")
+    parser.add_argument("--user_ids", nargs="*", default=[], type=int, help="User ID's to look up")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        if os.path.isdir(args.input):
+            paths = [os.path.join(args.input, f) for f in sorted(os.listdir(args.input)) if f.endswith(".txt.gz")]
+        else:
+            paths = [args.input]
+        for path in paths:
+            print("Index written to ", build_index(path, args.index_path))
+    else:
+        index = GzipIndex(args.input, args.index_path)
+        for tweet in index.lookup(args.tweet_ids, args.user_ids):
+            print(json.dumps(tweet))
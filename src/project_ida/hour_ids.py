@@ -0,0 +1,70 @@
+import os
+import numpy as np
+import pandas as pd
+
+class HourIds:
+    """
+    HourIds class to keep the (tweet ID, user ID) pairs of every hour-file until the user locations are inferred,
+    instead of keeping the TweetFile objects with their raw lines. The pairs are stored as int64 arrays, in memory or
+    spilled to .npy files, so peak memory is bounded by the unique users table.
+    Params
+        spill_dir: folder to write the arrays to - default None (arrays are kept in memory)
+    """
+
+    def __init__(self, spill_dir=None):
+        self.spill_dir = spill_dir
+        self.hours = []
+        if spill_dir is not None:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def add(self, tweet_file, scores=None):
+        """
+        Store the tweet and user ID's and the counts needed for the stats of an hour-file
+        Params
+            tweet_file: TweetFile object of the hour-file
+            scores: optional float64 array of sentiment scores aligned with the tweets (NaN for unscored tweets)
+        """
+        tweets = tweet_file.get_tweets()
+        ids = np.empty((len(tweets), 2), dtype=np.int64)
+        ids[:, 0] = tweets["tweet_id"].to_numpy(dtype=np.int64)
+        ids[:, 1] = tweets["user_id"].to_numpy(dtype=np.int64)
+
+        hour = {"date_name": tweet_file.get_date_name(), "len_tweets": tweet_file.get_len_tweets(),
+                "len_all_tweets": tweet_file.get_len_all_tweets()}
+        if self.spill_dir is None:
+            hour["ids"] = ids
+            if scores is not None:
+                hour["scores"] = np.asarray(scores, dtype=np.float64)
+        else:
+            hour["path"] = os.path.join(self.spill_dir, "ids_{}.npy".format(hour["date_name"]))
+            np.save(hour["path"], ids)
+            if scores is not None:
+                hour["scores_path"] = os.path.join(self.spill_dir, "scores_{}.npy".format(hour["date_name"]))
+                np.save(hour["scores_path"], np.asarray(scores, dtype=np.float64))
+        self.hours.append(hour)
+
+    def __iter__(self):
+        """
+        Yields the date name, a DataFrame with tweet_id and user_id (and score, if scores were added), and the stats
+        counts for every hour-file
+        """
+        for hour in self.hours:
+            ids = hour["ids"] if "ids" in hour else np.load(hour["path"], mmap_mode="r")
+            tweets_df = pd.DataFrame({"tweet_id": ids[:, 0], "user_id": ids[:, 1]})
+            if "scores" in hour:
+                tweets_df["score"] = hour["scores"]
+            elif "scores_path" in hour:
+                tweets_df["score"] = np.load(hour["scores_path"], mmap_mode="r")
+            yield hour["date_name"], tweets_df, hour["len_tweets"], hour["len_all_tweets"]
+
+    def __len__(self):
+        return len(self.hours)
+
+    def cleanup(self):
+        """
+        Remove the spilled arrays
+        """
+        for hour in self.hours:
+            for key in ["path", "scores_path"]:
+                if key in hour and os.path.exists(hour[key]):
+                    os.remove(hour[key])
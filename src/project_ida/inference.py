@@ -1,17 +1,84 @@
-import re
+import os
+import hashlib
+import pickle
+import numpy as np
 import pandas as pd
+from multiprocessing import Pool
 from tqdm import tqdm
 
+from location_matcher import LocationMatcher
+
+# Version of the cache keys, part of the cache file name. Version 1 keyed on the stripped location, which could give
+# a location the match of another spelling
+CACHE_VERSION = 2
+
+def location_key(location):
+    r"""
+    Cache key of a profile location: the location string itself. It is not normalized in any way, since the regexes
+    can be case-sensitive (e.g. state abbreviations) and whitespace-sensitive (^ NJ, ,?\s), so two spellings can
+    have a different match. Locations that are not strings (NaN from a csv, None) have no key and never match
+    """
+    if not isinstance(location, str):
+        return None
+    return location
+
+def sheet_hash(names):
+    """
+    Hash of the Name and regex columns of the location sheet (the xlsx bytes also contain timestamps)
+    """
+    content = "\n".join("{}\t{}".format(name, regex) for name, regex in zip(names["Name"], names["regex"]))
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+# Matcher of a pool worker process, built once per worker by init_worker
+worker_matcher = None
+
+def init_worker(names):
+    global worker_matcher
+    worker_matcher = LocationMatcher(names, verbose=False)
+
+def match_shard(locations):
+    return worker_matcher.match_all(locations)
+
 class Inference:
     """
     Inference class to save the location names (states, cities) to look for and their regular expressions (regex)
     Params
         path_to_names: path to excel file containing location names and the corresponding regex
+        cache_dir: folder for the persistent location cache (profile location -> inferred Name). The cache file is
+                   keyed by the content hash of the regex sheet, so editing the sheet starts a new cache - default None
+                   (cache is kept in memory only)
+        workers: number of processes to match the locations with - default 1
     """
     
-    def __init__(self, path_to_names):
+    def __init__(self, path_to_names, cache_dir=None, workers=1):
         self.names = pd.read_excel(path_to_names)
-        self.regex = [re.compile(entry) for entry in self.names['regex']]
+        self.matcher = LocationMatcher(self.names)
+        self.regex = self.matcher.regex
+        self.workers = workers
+
+        self.cache_path = None
+        if cache_dir is not None:
+            base_name = os.path.splitext(os.path.basename(path_to_names))[0]
+            self.cache_path = os.path.join(cache_dir, "{}_{}_v{}.pkl".format(base_name, sheet_hash(self.names)[:16],
+                                                                           CACHE_VERSION))
+        self.cache = self.load_cache()
+
+    def load_cache(self):
+        if self.cache_path is None or not os.path.exists(self.cache_path):
+            return {}
+        with open(self.cache_path, "rb") as f:
+            cache = pickle.load(f)
+        print("Loaded location cache with {} entries from {}".format(len(cache), self.cache_path))
+        return cache
+
+    def save_cache(self):
+        if self.cache_path is None:
+            return
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        tmp_path = self.cache_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(self.cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.cache_path)
 
     def inference_loc(self, df):
         """
@@ -40,37 +107,55 @@ class Inference:
             df_out: DataFrame with user ID, profile location and inferred location
         """
         print("Finding location matches")
-        locations = list(df['location']) # The user-profile locations
-        outlist = locations.copy()
+        locations = df['location'].values # The user-profile locations
 
-        for loc_ind, loc in tqdm(enumerate(locations), total=len(locations)):
-            results = []
+        # Many users share the same location string, so every distinct location is matched only once (and only if it
+        # was not already matched in an earlier run)
+        codes, uniques = pd.factorize(np.array([location_key(loc) for loc in locations], dtype=object))
+        unseen = [ind for ind, key in enumerate(uniques) if key not in self.cache]
+        hits = len(uniques) - len(unseen)
+        print("Location cache: {} users, {} unique locations, {} cache hits ({:.1f}%), {} to match"
+              .format(len(locations), len(uniques), hits, 100 * hits / max(len(uniques), 1), len(unseen)))
 
-            for regex_ind, regex in enumerate(self.regex):
-                if regex.search(loc):
-                    results.append(self.names.loc[regex_ind, "Name"])
-                    # If a match is found, we can stop searching
-                    break
+        if len(unseen) > 0:
+            names = self.match_locations([uniques[ind] for ind in unseen])
+            self.cache.update(zip(uniques[unseen], names))
+            self.save_cache()
 
-            user_id = df.iloc[loc_ind]["user_id"]
-            line = {"user_id": user_id, "location": loc, "inferred loc": results}
-            outlist[loc_ind] = line
+        # The last entry is for the locations that are not strings (code -1), they have no match
+        inferred = np.empty(len(uniques) + 1, dtype=object)
+        for ind, key in enumerate(uniques):
+            name = self.cache[key]
+            inferred[ind] = [name] if name is not None else []
+        inferred[-1] = []
 
-        df_out = pd.DataFrame(outlist)
+        df_out = pd.DataFrame({"user_id": df["user_id"].values, "location": locations, "inferred loc": inferred[codes]})
         return df_out
 
+    def match_locations(self, locations):
+        """
+        Match a list of locations. With more than one worker the list is split into shards that are matched in a
+        process pool; every worker builds its LocationMatcher once and the shard results are merged in order.
+        """
+        # Only the regexes whose city name occurs in the location are verified, see LocationMatcher
+        if self.workers <= 1 or len(locations) < self.workers:
+            return self.matcher.match_all(tqdm(locations, total=len(locations)))
+
+        # A few shards per worker to even out the load, small enough to keep the progress bar moving
+        shards = np.array_split(np.array(locations, dtype=object), self.workers * 8)
+        names = []
+        with Pool(self.workers, initializer=init_worker, initargs=(self.names,)) as pool:
+            for shard_names in tqdm(pool.imap(match_shard, shards), total=len(shards)):
+                names += shard_names
+        return names
+
     def find_location_row(self, row, not_found="not_found"):
         """
         Find match(es) for a single row (ie, tweet)
         """
         location = row["location"]
-        results = []
-
-        for regex_ind, regex in enumerate(self.regex):
-            if regex.search(location):
-                results.append(self.names.loc[regex_ind, "Name"])
-                # If a match is found, stop searching
-                break
+        name = self.matcher.match(location) if isinstance(location, str) else None
+        results = [name] if name is not None else []
 
         if len(results) == 0:
             results = not_found
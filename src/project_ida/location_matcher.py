@@ -0,0 +1,145 @@
+import re
+from itertools import chain
+
+# Cities containing a regex character (REGEX_META, e.g. "St. Louis") are not used as literal keys, their regex is
+# checked for every location instead. Locations are folded (fold) before the literal prefilter, so it never drops a
+# location that the regex itself would match
+from utils.keyword_filter import REGEX_META, fold
+
+# A quantifier right after the city group can make the city optional: (?i:City)?, (?i:City)*, (?i:City){0,1}
+QUANTIFIERS = {"?", "*", "+", "{"}
+
+# Length of the prefix used to index the literal keys when pyahocorasick is not installed
+PREFIX_LEN = 3
+
+
+def has_top_level_alternation(regex):
+    """
+    Check whether a regex has a '|' outside of any group, in which case the first group is not required for a match
+    """
+    depth = 0
+    escaped = False
+    for char in regex:
+        if escaped:
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "|" and depth == 0:
+            return True
+    return False
+
+
+def literal_key(city, regex):
+    r"""
+    Returns the literal every match of the regex must contain (case-insensitively), or None if there is no such
+    literal. The generated regexes start with the city name, like (?i:Seattle) or (?i:Crowley),?\s((?i:LA\b)|(?i:Louisiana))
+    (see prepare_files.setup_regex_files). Manually written regexes, like the ones for states, get no key, and neither
+    do regexes where the city group is optional, like (?i:Crowley)?,?\sLA
+    """
+    if not isinstance(city, str) or city == "" or not city.isascii():
+        return None
+    if any(char in REGEX_META for char in city):
+        return None
+    head = "(?i:{})".format(city)
+    if not regex.startswith(head):
+        return None
+    rest = regex[len(head):]
+    if rest[:1] in QUANTIFIERS or has_top_level_alternation(rest):
+        return None
+    return city.lower()
+
+
+class LocationMatcher:
+    """
+    LocationMatcher class to find the first regex (in sheet order) that matches a user-profile location.
+    The literal city names in the regex sheet are indexed (Aho-Corasick automaton if pyahocorasick is installed,
+    otherwise a prefix hash index), so for each location only the regexes whose city name occurs in it are verified,
+    together with the regexes that have no literal key. This gives exactly the same result as trying every regex.
+    Params
+        names: DataFrame with at least the columns "Name" and "regex", and optionally "city"
+        verbose: bool to print the index statistics - default True
+    """
+
+    def __init__(self, names, verbose=True):
+        self.names = list(names["Name"])
+        self.regex = [re.compile(entry) for entry in names["regex"]]
+        cities = names["city"] if "city" in names else [None] * len(names)
+
+        self.always = [] # Indices of the regexes that must be checked for every location
+        self.key_inds = {} # Literal key -> indices of the regexes that require it
+        for regex_ind, (city, regex) in enumerate(zip(cities, names["regex"])):
+            key = literal_key(city, regex)
+            if key is None:
+                self.always.append(regex_ind)
+            else:
+                self.key_inds.setdefault(key, []).append(regex_ind)
+
+        self.automaton = self.build_automaton()
+        if self.automaton is None:
+            self.by_prefix = {}
+            self.short_keys = []
+            for key in self.key_inds:
+                if len(key) < PREFIX_LEN:
+                    self.short_keys.append(key)
+                else:
+                    self.by_prefix.setdefault(key[:PREFIX_LEN], []).append(key)
+
+        if verbose:
+            print("Location matcher: {} regexes indexed by {} literal keys, {} always checked"
+                  .format(len(self.regex) - len(self.always), len(self.key_inds), len(self.always)))
+
+    def build_automaton(self):
+        if len(self.key_inds) == 0: # An empty automaton cannot be searched
+            return None
+        try:
+            import ahocorasick
+        except ImportError:
+            return None
+
+        automaton = ahocorasick.Automaton()
+        for key in self.key_inds:
+            automaton.add_word(key, key)
+        automaton.make_automaton()
+        return automaton
+
+    def find_keys(self, text):
+        """
+        Find the literal keys that occur in the (folded) location text
+        """
+        if self.automaton is not None:
+            return {key for _, key in self.automaton.iter(text)}
+
+        found = set()
+        for i in range(len(text) - PREFIX_LEN + 1):
+            for key in self.by_prefix.get(text[i:i + PREFIX_LEN], ()):
+                if text.startswith(key, i):
+                    found.add(key)
+        for key in self.short_keys:
+            if key in text:
+                found.add(key)
+        return found
+
+    def candidates(self, location):
+        """
+        Indices of the regexes that can match the location, in original sheet order
+        """
+        keys = self.find_keys(fold(location))
+        if len(keys) == 0:
+            return self.always
+        return sorted(chain(self.always, *(self.key_inds[key] for key in keys)))
+
+    def match(self, location):
+        """
+        Returns the Name of the first regex that matches the location, or None
+        """
+        for regex_ind in self.candidates(location):
+            if self.regex[regex_ind].search(location):
+                return self.names[regex_ind]
+        return None
+
+    def match_all(self, locations):
+        return [self.match(location) for location in locations]
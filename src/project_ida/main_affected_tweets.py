@@ -7,6 +7,8 @@
 # --months '8' '9' (starting from 1)
 # --country 'United States'
 # --areas 'full_country'
+# --loc_cache_path data/Ida_aug-sept-21/location_cache (optional)
+# --workers 32 (optional)
 
 """
 Main script to extract the tweets from users in a designated affected area. For instance, if we wish to select all tweets originating from the United States, 
@@ -14,42 +16,21 @@ the result is a subsection of the database with only those tweets. The tweet dat
 aff_cities_path is a folder with files that contain the names of cities in the affected areas.
 """
 
-from tweet_file import TweetFile
-from inference import Inference
-from unique_users import UniqueUsers
-
 import os
+import sys
 import pandas as pd
 import argparse
-import glob
 
-def extract_month_files(args, year):
-    """
-    Returns files only from month(s) specified in args for the year given as parameter
-    """
-    months = [int(x) for x in args.months]
-    low = min(months)
-    high = max(months)
-
-    # Append 0's to month-numbers under 10 because they appear so in filenames (e.g. 9 is 09)
-    low = f"0{low}" if low < 10 else low
-    high = f"0{high}" if high < 10 else high
-
-    low_ind = -1
-    # for worldgeo the files are named like so: 2021-01-01_00_00_01.txt.gz
-    # for onepercent the files are named like so: 2021_01_01_00_onepercent.txt.gz
-    # We thus have two different dashes
-    dash_str = "-" if args.tweet_type == "worldgeo" else "_"
-
-    for index, file in enumerate(args.file_names):
-        if file.startswith(f"{year}{dash_str}{str(low)}"):
-            if low_ind == -1:
-                low_ind = index
-
-        if file.startswith(f"{year}{dash_str}{str(high)}"):
-            high_ind = index
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from tweet_file import TweetFile
+from inference import Inference
+from unique_users import UniqueUsers
+from hour_ids import HourIds
+from place_lookup import PlaceAreaLookup
 
-    return args.file_names[low_ind : (high_ind+1)]
+from utils.file_catalog import FileCatalog
+from utils.metrics import Metrics, get_metrics
+from utils.profiling import make_profiler, add_profile_args
 
 def stats_to_csv(out_path, len_tweets, matches, date_name, locs=0, is_geo=True):
     """
@@ -66,126 +47,166 @@ def stats_to_csv(out_path, len_tweets, matches, date_name, locs=0, is_geo=True):
     stats_out_path = os.path.join(out_path, "stats", "stats_{}.csv".format(date_name))
     df.to_csv(stats_out_path)
 
-def extract_state_matches(country_df, states):
+def get_index_path(args):
+    """
+    Folder for the sidecar indexes of the raw hour-files (--index_path), None if no indexes are built
+    """
+    path = getattr(args, "index_path", "")
+    return path if path != "" else None
+
+def count_tweet_file(metrics, tweet_file, tweets_path):
     """
-    Extract geo-tag references to the states that are fully affected for the area
+    Add the size and line counts of a parsed hour-file to the metrics of the current file
     """
-    state_df = pd.DataFrame([{}])
-    for state in states:
-        match = country_df.loc[(country_df["type"] == "admin") &
-                               (country_df["full_name"] == state)]
-        state_df = pd.concat([state_df, match]).reset_index(drop=True)
-    return state_df.loc[1:]
-
-def match_tweets_locs(all_matches, tweet_files, out_path):
+    metrics.count("bytes_compressed", os.path.getsize(tweets_path))
+    metrics.count("bytes_read", tweet_file.get_len_bytes())
+    metrics.count("lines", tweet_file.get_len_lines())
+    metrics.count("rows_in", tweet_file.get_len_tweets())
+
+def match_tweets_locs(all_matches, hour_ids, out_path, metrics=None):
     """
     ONLY USED FOR REGULAR TWEETS
     Matching the tweets and users in each tweet file to the user ID's and inferred user locations in all_matches
     Params:
         all_matches: DataFrame with all unique users, profile locations and inferred location
-        tweet_files: list of TweetFile objects, each TweetFile object is the tweets of one hour-file
+        hour_ids: HourIds object with the tweet and user ID's of each hour-file
+        metrics: optional Metrics object to time the merge and write stages
     """
+    if metrics is None:
+        metrics = Metrics(enabled=False)
+
     print("Merging tweet files with inferred location")
-    for tweet_file in tweet_files:
-        tweets_df = tweet_file.get_tweets()
-        tweets_df = tweets_df[["tweet_id", "user_id"]]
-        df = pd.merge(tweets_df, all_matches, left_on="user_id", right_on="user_id")
-        print("Merged: ", df.head().to_string())
-        df = df[["tweet_id", "user_id", "location", "inferred loc"]]
+    for date_name, tweets_df, locs, all_tweets in hour_ids:
+        with metrics.stage("merge"):
+            df = pd.merge(tweets_df, all_matches, left_on="user_id", right_on="user_id")
+            print("Merged: ", df.head().to_string())
+            df = df[["tweet_id", "user_id", "location", "inferred loc"]]
 
         # Tweets to csv
-        df.to_csv(os.path.join(out_path, "tweets", "aff_{}.csv".format(tweet_file.get_date_name())))
+        with metrics.stage("write"):
+            df.to_csv(os.path.join(out_path, "tweets", "aff_{}.csv".format(date_name)))
 
-        # Stats to csv
-        matches = len(df)
-        print("Location matches for file {}: {}".format(tweet_file.get_date_name(), matches))
-        locs = tweet_file.get_len_tweets() # Number of tweets with non-empty location entry, because locs_only=True
-        all_tweets = tweet_file.get_len_all_tweets() # Number of tweets (all)
-        stats_to_csv(out_path, all_tweets, matches, tweet_file.get_date_name(), locs, is_geo=False)
+            # Stats to csv
+            matches = len(df)
+            print("Location matches for file {}: {}".format(date_name, matches))
+            # locs is the number of tweets with non-empty location entry (because locs_only=True), all_tweets the number
+            # of tweets (all)
+            stats_to_csv(out_path, all_tweets, matches, date_name, locs, is_geo=False)
+        metrics.count("rows_out", matches)
 
-def affect_tweets_worldgeo(args, tweets_folder_path, out_path, area, full_states):
+def affect_tweets_worldgeo(args, tweets_folder_path, out_paths, full_states):
     """
-    Finds tweets originating from Ida-affected area for geo-tagged tweets
+    Finds tweets originating from Ida-affected area(s) for geo-tagged tweets. Every hour-file is read once and the
+    tweets are classified for all areas in out_paths (dictionary of area -> output path)
     """
-    if area != "full_country":
-        # Read in Dataframe with affected cities for this area. If one of these cities is referenced in the tag, the
-        # tweet originates from the Ida-affected area
-        aff_path = os.path.join(args.aff_cities_path, "Ida_files", area+".csv")
-        aff_cities = pd.read_csv(aff_path)
+    # Read in Dataframe with affected cities for each area. If one of these cities is referenced in the tag, the
+    # tweet originates from the Ida-affected area
+    aff_cities = {}
+    for area in out_paths:
+        if area != "full_country":
+            aff_path = os.path.join(args.aff_cities_path, "Ida_files", area+".csv")
+            aff_cities[area] = pd.read_csv(aff_path)
+
+    # Lookup from geo-tag (place type, full name) to the areas it belongs to, built once for all files
+    lookup = PlaceAreaLookup(out_paths.keys(), aff_cities, full_states)
+    metrics = get_metrics(args)
 
     for file in args.file_names:
         print("File: ", file)
         tweets_path = os.path.join(tweets_folder_path, file)
 
-        # Make TweetFile object to store the data for each hour-file
-        tweet_file = TweetFile(tweets_path, is_geo=True)
-        tweets_df = tweet_file.get_tweets()
-        len_tweets = tweet_file.get_len_tweets()  # Number of tweets in original file
-        date_name = tweet_file.get_date_name()  # date_name is like 2021-08-01_00_00_00 (no path or extension)
-
-        # Find the tweets tagged with the country as specified in args
-        country_df = tweets_df[tweets_df["country"] == args.country]
-        country_df = country_df[["tweet_id", "user_id", "type", "full_name"]]
-
-        if area == "full_country":
-            # If the area is full_country, all the geo-tags originating from the country should be included, so write this to csv
-            country_df.to_csv(os.path.join(out_path, "tweets", "aff_{}.csv".format(date_name)))
-
-            matches = len(country_df)
-            print("Matches: ", matches)
-            stats_to_csv(matches, len_tweets, out_path, date_name)
-        else:
-            # If area is not full_country, only the geo-tags originating from the specific sub-area should be included. This is a subset of country_df
-
-            # Extract the tweets that match with affected cities
-            city_df = country_df[country_df["type"] == "city"]
-            city_df = city_df.merge(aff_cities, left_on="full_name", right_on="city_and_abbrev")
-
-            # Extract the tweets that geo-tag the fully affected state(s) of the area (stored in full_states dictionary)
-            state_df = extract_state_matches(country_df, full_states[area])
-            df = pd.concat([city_df, state_df]).reset_index(drop=True)
-            df = df[["tweet_id", "user_id", "full_name"]]
-
-            # Tweets to csv
-            df.to_csv(os.path.join(out_path, "tweets", "aff_{}.csv".format(date_name)))
-
-            matches = len(df)
-            print("Matches: ", matches)
-            stats_to_csv(matches, len_tweets, out_path, date_name)
-
-def affect_tweets_oneperc(args, tweets_folder_path, out_path, area):
+        with metrics.file(file):
+            # Make TweetFile object to store the data for each hour-file (the file is streamed and parsed at once)
+            with metrics.stage("read_parse"):
+                tweet_file = TweetFile(tweets_path, is_geo=True, index_path=get_index_path(args))
+            tweets_df = tweet_file.get_tweets()
+            len_tweets = tweet_file.get_len_tweets()  # Number of tweets in original file
+            date_name = tweet_file.get_date_name()  # date_name is like 2021-08-01_00_00_00 (no path or extension)
+            count_tweet_file(metrics, tweet_file, tweets_path)
+            metrics.count("discarded_lines", tweet_file.get_len_lines() - len_tweets)
+
+            # Find the tweets tagged with the country as specified in args
+            with metrics.stage("classify"):
+                country_df = tweets_df[tweets_df["country"] == args.country]
+                country_df = country_df[["tweet_id", "user_id", "type", "full_name"]]
+
+                # Classify every tweet for all areas at once
+                masks = lookup.classify(country_df)
+
+            for area, out_path in out_paths.items():
+                if area == "full_country":
+                    # If the area is full_country, all the geo-tags originating from the country should be included
+                    df = country_df
+                else:
+                    # If area is not full_country, only the geo-tags of the affected cities and the fully affected
+                    # state(s) of the area should be included. This is a subset of country_df
+                    df = country_df[lookup.in_area(masks, area)]
+                    df = df[["tweet_id", "user_id", "full_name"]].reset_index(drop=True)
+
+                # Tweets to csv
+                with metrics.stage("write"):
+                    df.to_csv(os.path.join(out_path, "tweets", "aff_{}.csv".format(date_name)))
+
+                    matches = len(df)
+                    print("Matches {}: {}".format(area, matches))
+                    stats_to_csv(out_path, len_tweets, matches, date_name)
+                metrics.count("rows_out", matches)
+
+        print("Distinct places seen so far: ", len(lookup.cache))
+
+def affect_tweets_oneperc(args, tweets_folder_path, out_paths):
     """
-    Finds tweets originating from Ida-affected area for regular tweets, not geo-tagged
+    Finds tweets originating from Ida-affected area(s) for regular tweets, not geo-tagged. The unique users do not
+    depend on the area, so every hour-file is read once and only the location inference is done per area in out_paths
+    (dictionary of area -> output path)
     """
-    unique_users = UniqueUsers() # Create UniqueUsers object to store the unique users over all files
-    tweet_files = [] # List to store the tweet files so we don't have to load them again
+    # Create UniqueUsers object to store the unique users over all files, optionally spilled to disk
+    unique_users = UniqueUsers(spill_path=args.users_spill_path if args.users_spill_path != "" else None)
+    # Compact (tweet ID, user ID) arrays of the hour-files so we don't have to load them again, but also don't keep the
+    # raw lines of the whole month in memory
+    hour_ids = HourIds(spill_dir=args.spill_dir if args.spill_dir != "" else None)
+    metrics = get_metrics(args)
 
     for file in args.file_names:
         print("\nFile: ", file)
         tweets_path = os.path.join(tweets_folder_path, file)
 
-        # Make TweetFile object - not geo-tagged, storing only tweets with non-empty location
-        tweet_file = TweetFile(tweets_path, is_geo=False, locs_only=True)
-        tweets_df = tweet_file.get_tweets() # Tweets with non-empty profile location
+        with metrics.file(file):
+            # Make TweetFile object - not geo-tagged, storing only tweets with non-empty location
+            with metrics.stage("read_parse"):
+                tweet_file = TweetFile(tweets_path, is_geo=False, locs_only=True, index_path=get_index_path(args))
+            tweets_df = tweet_file.get_tweets() # Tweets with non-empty profile location
+            count_tweet_file(metrics, tweet_file, tweets_path)
+            metrics.count("discarded_lines", tweet_file.get_len_lines() - tweet_file.get_len_all_tweets())
 
-        # To update the unique users we only need the user ID and location, not tweet ID
-        unique_users.update_users(tweets_df[["user_id", "location"]])
-        tweet_files.append(tweet_file)
+            # To update the unique users we only need the user ID and location, not tweet ID
+            with metrics.stage("users"):
+                unique_users.update_users(tweets_df[["user_id", "location"]])
+                hour_ids.add(tweet_file)
+            del tweet_file, tweets_df
 
     users = unique_users.get_users() # Single file with all unique users for all files
+    metrics.count("unique_users", len(users))
+
+    for area, out_path in out_paths.items():
+        print("\nArea: ", area)
+
+        # Read in affected city names and regex and instantiate Inference object
+        aff_path = os.path.join(args.aff_cities_path, "regex_files", "Location_{}.xlsx".format(area))
+        inference = Inference(aff_path, cache_dir=args.loc_cache_path, workers=args.workers)
 
-    # Read in affected city names and regex and instantiate Inference object
-    aff_path = os.path.join(args.aff_cities_path, "regex_files", "Location_{}.xlsx".format(area))
-    inference = Inference(aff_path)
+        # Infer the location with the regex for the unique users
+        with metrics.stage("infer"):
+            all_matches = inference.inference_loc(users)
+        with metrics.stage("write"):
+            all_matches.to_csv(os.path.join(out_path, "{}_unique_users_loc.csv".format(area)), index=False)
+        print("All matches found")
 
-    # Infer the location with the regex for the unique users
-    all_matches = inference.inference_loc(users)
-    all_matches.to_csv(os.path.join(out_path, "{}_unique_users_loc.csv".format(area)), index=False)
-    print("All matches found")
+        # Now that we have inferred the location for all users, we have to connect this to the users in each hour-file
+        # The result is the inferred location for the users in each hour-file
+        match_tweets_locs(all_matches, hour_ids, out_path, metrics)
 
-    # Now that we have inferred the location for all users, we have to connect this to the users in each hour-file
-    # The result is the inferred location for the users in each hour-file
-    match_tweets_locs(all_matches, tweet_files, out_path)
+    hour_ids.cleanup()
 
 
 if __name__ == "__main__":
@@ -202,10 +223,30 @@ if __name__ == "__main__":
     parser.add_argument('--tweet_type', default='worldgeo',
                         help='What type of tweets are we analyzing? (worldgeo, onepercent)')
     parser.add_argument("--country", default="United States", type=str, help="Country to select affected tweets for")
-    parser.add_argument("--areas", nargs="*", default="full_country", type=str,
+    parser.add_argument("--areas", nargs="*", default=["full_country"], type=str,
                         help="What specific areas do we want to find the tweets for")
     parser.add_argument("--sub_files", nargs="*", default="", type=str, help="Sub section of files where we want to find affected tweets for")
+    parser.add_argument("--catalog_cache_path", default="", type=str,
+                        help="Folder to cache the listing of the data folders in (default: no cache)")
+    parser.add_argument("--loc_cache_path", default="", type=str,
+                        help="Folder for the persistent location-inference cache (default: <output_path>/location_cache)")
+    parser.add_argument("--workers", default=1, type=int, help="Number of processes for the location inference")
+    parser.add_argument("--spill_dir", default="", type=str,
+                        help="Folder to spill the per-hour tweet and user ID's to until the locations are inferred")
+    parser.add_argument("--users_spill_path", default="", type=str,
+                        help="sqlite file to keep the unique users on disk instead of in memory (for year-scale runs)")
+    parser.add_argument("--index_path", default="", type=str,
+                        help="Folder to write a sidecar index of every raw hour-file to while parsing, for lookups by "
+                             "tweet or user ID (see gzip_index.py)")
+    parser.add_argument("--metrics_path", default="", type=str,
+                        help="JSON-lines file to write the per-file stage timings, counts and memory to")
+    add_profile_args(parser)
     args = parser.parse_args()
+    args.metrics = Metrics(args.metrics_path if args.metrics_path != "" else None, run_name="affected_tweets",
+                           profiler=make_profiler(args, "affected_tweets", os.path.join(args.output_path, "profiles")))
+
+    if args.loc_cache_path == "":
+        args.loc_cache_path = os.path.join(args.output_path, "location_cache")
 
     # Fully affected states for the areas  - hard-coded but can be added as argument
     n_states = ["New Jersey, USA"]
@@ -218,35 +259,25 @@ if __name__ == "__main__":
         tweets_folder_path = os.path.join(args.data_path, args.tweet_type, year)
 
         if args.sub_files == "":
-            args.file_names = sorted([os.path.basename(elem) for elem in glob.glob(os.path.join(tweets_folder_path, "*"))])
             # Store the basename of the file, like 2021-01-01_00_00_01.txt.gz, and not its full path, for easy reference later
-
-            if args.months != '':
-                # If specific months are given, not all months of the year should be included
-                args.file_names = extract_month_files(args, year)
+            # If specific months are given, not all months of the year should be included
+            catalog = FileCatalog(tweets_folder_path, cache_dir=args.catalog_cache_path or None)
+            args.file_names = catalog.names(year=year, months=args.months if args.months != '' else None)
         else:
             args.file_names = args.sub_files
 
         print("Extracting tweets from the following files: ", args.file_names)
 
-        # Get tweets from affected areas
-        for area in args.areas:
-            out_path = os.path.join(args.output_path, args.tweet_type, year, area)
-            print("Out path: ", out_path)
-
-            # Regular tweets
-            if args.tweet_type == "onepercent":
-                affect_tweets_oneperc(args, tweets_folder_path, out_path, area)
-
-            # Geo-tagged tweets
-            else:
-                affect_tweets_worldgeo(args, tweets_folder_path, out_path, area, full_states)
-
-
-
-
-
-
+        # Get tweets from affected areas. Every hour-file is read once for all areas, each area has its own output
+        out_paths = {area: os.path.join(args.output_path, args.tweet_type, year, area) for area in args.areas}
+        print("Out paths: ", out_paths)
 
+        # Regular tweets
+        if args.tweet_type == "onepercent":
+            affect_tweets_oneperc(args, tweets_folder_path, out_paths)
 
+        # Geo-tagged tweets
+        else:
+            affect_tweets_worldgeo(args, tweets_folder_path, out_paths, full_states)
 
+    args.metrics.summary()
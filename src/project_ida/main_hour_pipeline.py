@@ -0,0 +1,313 @@
+# Example params:
+# --data_path /data1/groups/SUL_TWITTER
+# --output_path data/Ida_aug-sept-21/aggregated_sentiment
+# --aff_cities_path data/Ida_aug-sept-21/affect_area_files (generated by prepare_files)
+# --tweet_type 'onepercent' (worldgeo or onepercent)
+# --years '2021'
+# --months '8' '9' (starting from 1)
+# --country 'United States'
+# --areas 'full_country' 'north' 'south'
+# --results_format 'csv' (csv, or parquet to keep the moments and allow --append)
+# --debug_path data/Ida_aug-sept-21/debug (optional, also write the intermediate sentiment and affected tweets files)
+# --scoring_url http://127.0.0.1:8765 (optional, score with a running scoring_service.py instead of loading the models)
+
+"""
+Fused version of main_sentiment_imputer.py, main_affected_tweets.py and main_senti_aggregator.py. Every raw hour-file is
+decompressed and parsed once: the tweets that can be located are scored with the embedding model and classifier, and
+assigned to the areas in the same pass. The per-area aggregates are kept in memory and written to the same results
+file as main_senti_aggregator.py (all_means_<area>.csv or hourly_scores_<area>.parquet), without the intermediate
+sentiment and affected tweets .csv files (those can still be written to debug_path).
+Only the tweets that can end up in an area are scored: for geo-tagged tweets the tweets tagged with the country, for
+regular tweets the tweets with a non-empty user-profile location.
+"""
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from tweet_file import TweetFile
+from inference import Inference
+from unique_users import UniqueUsers
+from hour_ids import HourIds
+from place_lookup import PlaceAreaLookup
+from main_affected_tweets import stats_to_csv, match_tweets_locs, get_index_path, count_tweet_file
+
+from main_sentiment_imputer import load_models
+from utils.data_read_in import clean_for_content
+from utils.emb_sentiment_imputer import create_embeddings
+from utils.file_catalog import FileCatalog
+from utils.scoring_client import ScoringClient
+from utils.results_store import HourlyResults, RESULTS_FORMATS, results_file_path
+from utils.metrics import Metrics, get_metrics
+from utils.profiling import make_profiler, add_profile_args
+
+def score_tweets(tweets_df, args):
+    """
+    Impute the sentiment scores of the tweets, like impute_sentiment_embed in main_sentiment_imputer.py
+    Params
+        tweets_df: DataFrame with text and lang columns (text is None for tweets without text)
+    Returns
+        scores: float64 array aligned with tweets_df, NaN for tweets without text or with empty text after cleaning
+    """
+    metrics = get_metrics(args)
+    scores = np.full(len(tweets_df), np.nan)
+    has_text = tweets_df["text"].notna().to_numpy()
+    with metrics.stage("clean"):
+        texts = [clean_for_content(text, lang) for text, lang in zip(tweets_df["text"][has_text], tweets_df["lang"][has_text])]
+
+    # Some tweets might have empty text fields after clean_for_content
+    non_empty = np.array([text != "" for text in texts], dtype=bool)
+    rows = np.flatnonzero(has_text)[non_empty]
+    if len(rows) == 0:
+        return scores
+
+    df = pd.DataFrame({"text": [text for text in texts if text != ""]})
+    if args.scoring_client is not None:
+        # Client mode: the scoring service encodes and classifies, batched with the texts of its other clients
+        with metrics.stage("score_service"):
+            scores[rows] = np.round(args.scoring_client.score(df["text"].values), args.score_digits)
+        return scores
+
+    with metrics.stage("encode"):
+        embeddings = create_embeddings(args.emb_model, df, args)
+    with metrics.stage("classify"):
+        scores[rows] = np.round(args.clf_model.predict_proba(embeddings)[:, 1], args.score_digits)
+    del embeddings
+    return scores
+
+def valid_scores(scores):
+    """
+    Scores that are aggregated: scored tweets with score <= 1, as in main_senti_aggregator.py
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    return scores[scores <= 1]
+
+def write_debug_scores(args, year, tweets_df, scores, date_name):
+    """
+    Write the scored tweets of an hour-file like main_sentiment_imputer.py does
+    """
+    scored = ~np.isnan(scores)
+    df = pd.DataFrame({"message_id": tweets_df["tweet_id"].to_numpy()[scored],
+                       "user_id": tweets_df["user_id"].to_numpy()[scored], "score": scores[scored]})
+    out_path = os.path.join(args.debug_path, "sentiment_scores", args.tweet_type, year)
+    os.makedirs(out_path, exist_ok=True)
+    df.to_csv(os.path.join(out_path, "sentiment_{}.csv".format(date_name)))
+
+def debug_area_paths(args, year, areas):
+    """
+    Output paths of the affected tweets per area, with the tweets and stats folders main_affected_tweets.py writes to
+    """
+    out_paths = {area: os.path.join(args.debug_path, "affect_tweets", args.tweet_type, year, area) for area in areas}
+    for out_path in out_paths.values():
+        os.makedirs(os.path.join(out_path, "tweets"), exist_ok=True)
+        os.makedirs(os.path.join(out_path, "stats"), exist_ok=True)
+    return out_paths
+
+def pipeline_worldgeo(args, year, tweets_folder_path, full_states):
+    """
+    Score and aggregate the geo-tagged tweets. The areas of a tweet only depend on its geo-tag, so every hour-file is
+    classified, scored and aggregated for all areas while it is read
+    Returns
+        results: dictionary of area -> HourlyResults
+    """
+    aff_cities = {}
+    for area in args.areas:
+        if area != "full_country":
+            aff_path = os.path.join(args.aff_cities_path, "Ida_files", area+".csv")
+            aff_cities[area] = pd.read_csv(aff_path)
+
+    lookup = PlaceAreaLookup(args.areas, aff_cities, full_states)
+    results = {area: HourlyResults() for area in args.areas}
+    debug_paths = debug_area_paths(args, year, args.areas) if args.debug_path != "" else None
+    metrics = get_metrics(args)
+
+    for file in args.file_names:
+        print("\nFile: ", file)
+        start = time.time()
+        tweets_path = os.path.join(tweets_folder_path, file)
+
+        with metrics.file(file):
+            with metrics.stage("read_parse"):
+                tweet_file = TweetFile(tweets_path, is_geo=True, with_text=True, index_path=get_index_path(args))
+            tweets_df = tweet_file.get_tweets()
+            date_name = tweet_file.get_date_name()
+            count_tweet_file(metrics, tweet_file, tweets_path)
+            metrics.count("discarded_lines", tweet_file.get_len_lines() - tweet_file.get_len_tweets())
+
+            # Only the tweets tagged with the country can be in one of the areas, so only those are scored
+            with metrics.stage("classify_areas"):
+                country_df = tweets_df[tweets_df["country"] == args.country]
+                masks = lookup.classify(country_df)
+            scores = score_tweets(country_df, args)
+
+            for area in args.areas:
+                in_area = np.ones(len(country_df), dtype=bool) if area == "full_country" else lookup.in_area(masks, area)
+                area_scores = valid_scores(scores[in_area])
+                results[area].add(date_name, area_scores)
+                print("Matches {}: {}, scored: {}".format(area, int(in_area.sum()), len(area_scores)))
+                metrics.count("rows_out", len(area_scores))
+
+                if debug_paths is not None:
+                    if area == "full_country":
+                        df = country_df[["tweet_id", "user_id", "type", "full_name"]]
+                    else:
+                        df = country_df[in_area][["tweet_id", "user_id", "full_name"]].reset_index(drop=True)
+                    df.to_csv(os.path.join(debug_paths[area], "tweets", "aff_{}.csv".format(date_name)))
+                    stats_to_csv(debug_paths[area], tweet_file.get_len_tweets(), len(df), date_name)
+
+            if debug_paths is not None:
+                write_debug_scores(args, year, country_df, scores, date_name)
+        print("Runtime: {} minutes".format(round((time.time() - start) / 60, 1)))
+
+    return results
+
+def pipeline_oneperc(args, year, tweets_folder_path):
+    """
+    Score and aggregate the regular tweets. The location of a user is inferred from the first profile location seen
+    over all files, so the tweets with a location are scored while reading and kept as compact (tweet ID, user ID,
+    score) arrays until the locations are inferred; then the scores are aggregated per area
+    Returns
+        results: dictionary of area -> HourlyResults
+    """
+    unique_users = UniqueUsers(spill_path=args.users_spill_path if args.users_spill_path != "" else None)
+    hour_ids = HourIds(spill_dir=args.spill_dir if args.spill_dir != "" else None)
+    metrics = get_metrics(args)
+
+    for file in args.file_names:
+        print("\nFile: ", file)
+        start = time.time()
+        tweets_path = os.path.join(tweets_folder_path, file)
+
+        with metrics.file(file):
+            with metrics.stage("read_parse"):
+                tweet_file = TweetFile(tweets_path, is_geo=False, locs_only=True, with_text=True,
+                                       index_path=get_index_path(args))
+            tweets_df = tweet_file.get_tweets() # Tweets with non-empty profile location
+            count_tweet_file(metrics, tweet_file, tweets_path)
+            metrics.count("discarded_lines", tweet_file.get_len_lines() - tweet_file.get_len_all_tweets())
+
+            scores = score_tweets(tweets_df, args)
+            with metrics.stage("users"):
+                unique_users.update_users(tweets_df[["user_id", "location"]])
+                hour_ids.add(tweet_file, scores)
+
+            if args.debug_path != "":
+                write_debug_scores(args, year, tweets_df, scores, tweet_file.get_date_name())
+            del tweet_file, tweets_df
+        print("Runtime: {} minutes".format(round((time.time() - start) / 60, 1)))
+
+    users = unique_users.get_users()
+    metrics.count("unique_users", len(users))
+    results = {area: HourlyResults() for area in args.areas}
+    debug_paths = debug_area_paths(args, year, args.areas) if args.debug_path != "" else None
+
+    for area in args.areas:
+        print("\nArea: ", area)
+        aff_path = os.path.join(args.aff_cities_path, "regex_files", "Location_{}.xlsx".format(area))
+        inference = Inference(aff_path, cache_dir=args.loc_cache_path, workers=args.workers)
+        with metrics.stage("infer"):
+            all_matches = inference.inference_loc(users)
+
+        if debug_paths is not None:
+            all_matches.to_csv(os.path.join(debug_paths[area], "{}_unique_users_loc.csv".format(area)), index=False)
+            match_tweets_locs(all_matches, hour_ids, debug_paths[area], metrics)
+
+        # Same merge of the hour's tweets with the inferred user locations as in main_affected_tweets.py
+        with metrics.stage("aggregate"):
+            for date_name, tweets_df, locs, all_tweets in hour_ids:
+                df = pd.merge(tweets_df, all_matches[["user_id"]], on="user_id")
+                results[area].add(date_name, valid_scores(df["score"]))
+
+    hour_ids.cleanup()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--data_path', default='', type=str, help='Path to tweets data')
+    parser.add_argument('--output_path', default='', type=str, help='Path to output of aggregated sentiment scores')
+    parser.add_argument('--aff_cities_path', default='', type=str, help='Path to .csv file with affected cities')
+    parser.add_argument('--years', nargs='*', default=['2021'], type=str, help='Which year(s) are we running for')
+    parser.add_argument('--months', nargs='*', default='', type=str, help='Which month(s) are we running for')
+    parser.add_argument('--tweet_type', default='worldgeo',
+                        help='What type of tweets are we analyzing? (worldgeo, onepercent)')
+    parser.add_argument("--country", default="United States", type=str, help="Country to select affected tweets for")
+    parser.add_argument("--areas", nargs="*", default=["full_country"], type=str,
+                        help="What specific areas do we want to aggregate for")
+    parser.add_argument("--sub_files", nargs="*", default="", type=str, help="Sub section of files to run for")
+    parser.add_argument("--catalog_cache_path", default="", type=str,
+                        help="Folder to cache the listing of the data folders in (default: no cache)")
+    parser.add_argument("--results_format", default="csv", type=str, choices=RESULTS_FORMATS,
+                        help="Format of the results file per area: csv (all_means_<area>.csv) or parquet "
+                             "(hourly_scores_<area>.parquet with the moments, needs pyarrow)")
+    parser.add_argument("--append", action="store_true",
+                        help="Merge with the results file of an earlier run instead of overwriting it")
+    parser.add_argument("--debug_path", default="", type=str,
+                        help="Folder to also write the intermediate sentiment score and affected tweets files to")
+
+    # Location inference parameters, see main_affected_tweets.py
+    parser.add_argument("--loc_cache_path", default="", type=str,
+                        help="Folder for the persistent location-inference cache (default: <output_path>/location_cache)")
+    parser.add_argument("--workers", default=1, type=int, help="Number of processes for the location inference")
+    parser.add_argument("--spill_dir", default="", type=str,
+                        help="Folder to spill the per-hour tweet ID's and scores to until the locations are inferred")
+    parser.add_argument("--users_spill_path", default="", type=str,
+                        help="sqlite file to keep the unique users on disk instead of in memory (for year-scale runs)")
+
+    # Sentiment parameters, see main_sentiment_imputer.py
+    parser.add_argument('--score_digits', default=6, type=int, help='how many digits to the output score')
+    parser.add_argument('--batch_size', default=100, type=int, help='batch size')
+    parser.add_argument('--scoring_url', default='', type=str,
+                        help='score with a running scoring service (src/scoring_service.py) at this address, like '
+                             'http://127.0.0.1:8765, instead of loading the models')
+    parser.add_argument('--index_path', default='', type=str,
+                        help='Folder to write a sidecar index of every raw hour-file to while parsing, for lookups by '
+                             'tweet or user ID (see gzip_index.py)')
+    parser.add_argument("--metrics_path", default="", type=str,
+                        help="JSON-lines file to write the per-file stage timings, counts and memory to")
+    add_profile_args(parser)
+    args = parser.parse_args()
+    if args.append and args.results_format != "parquet":
+        parser.error("--append needs --results_format parquet, the csv results have no moments to merge")
+    args.metrics = Metrics(args.metrics_path if args.metrics_path != "" else None, run_name="hour_pipeline",
+                           profiler=make_profiler(args, "hour_pipeline", os.path.join(args.output_path, "profiles")))
+
+    if args.loc_cache_path == "":
+        args.loc_cache_path = os.path.join(args.output_path, "location_cache")
+
+    # Fully affected states for the areas, as in main_affected_tweets.py
+    full_states = {"north": ["New Jersey, USA"], "south": ["Louisiana, USA", "Mississippi, USA"]}
+
+    args.scoring_client = None
+    if args.scoring_url != '':
+        args.scoring_client = ScoringClient(args.scoring_url)
+        print("Scoring with the service at {}: {}".format(args.scoring_url, args.scoring_client.health()))
+    else:
+        load_models(args)
+
+    for year in args.years:
+        tweets_folder_path = os.path.join(args.data_path, args.tweet_type, year)
+        if args.sub_files == "":
+            catalog = FileCatalog(tweets_folder_path, cache_dir=args.catalog_cache_path or None)
+            args.file_names = catalog.names(year=year, months=args.months if args.months != '' else None)
+        else:
+            args.file_names = args.sub_files
+        print(f"Running for year {year}. This year has {len(args.file_names)} files.")
+
+        if args.tweet_type == "onepercent":
+            results = pipeline_oneperc(args, year, tweets_folder_path)
+        else:
+            results = pipeline_worldgeo(args, year, tweets_folder_path, full_states)
+
+        for area, area_results in results.items():
+            out_path = os.path.join(args.output_path, args.tweet_type, year, area)
+            with args.metrics.stage("write"):
+                area_results.save(results_file_path(out_path, area, args.results_format), append=args.append)
+
+    args.metrics.summary()
+    print("Done. All hourly scores aggregated.")
@@ -5,64 +5,30 @@
 # --years '2021'
 # --tweet_type 'worldgeo'
 # --areas 'north' 'south'
+# --score_index_path data/Ida_aug-sept-21/score_index (optional, written by main_sentiment_imputer.py)
+# --results_format 'csv' (csv, or parquet to keep the moments and allow --append)
+# --append (optional, merge with the results of an earlier run)
 
 """
 Main script to aggregate the sentiment scores of the tweets and the location of the Twitter users. Sentiment scores for all tweets in the database are stored at
-senti_scores_path; the affected tweets are stored at aff_tweets_path; the sentiment scores for users from the affected area is saved to output_path
+senti_scores_path; the affected tweets are stored at aff_tweets_path; the sentiment scores for users from the affected area is saved to output_path, as a single file per area with the
+mean and standardized mean of the scores of every hour-file (all_means_<area>.csv), or also their count, sum and sum of
+squares (hourly_scores_<area>.parquet)
 """
 
 import argparse
 import numpy as np
 import pandas as pd
 import os
-import glob
-
-def standardize(values):
-    mean = np.nanmean(values)
-    std = np.nanstd(values)
-    return [(value - mean)/std for value in values]
-
-def comp_single_file(out_path, area):
-    """
-    Compile single file with all the means and standardized scores for the hour-files
-    """
-    score_files = sorted(glob.glob(os.path.join(out_path, "*")))
-    means, base_names = [], []
-    for file in score_files:
-        base_name = os.path.basename(file)
-        base_names.append(base_name)
-        mean = pd.read_csv(file)["mean"].iloc[0]
-        means.append(mean)
-
-    means = {"base_name": base_names, "mean": means, "standardized": standardize(means)}
-    df = pd.DataFrame(means)
-    df.to_csv(os.path.join(out_path, f"all_means_{area}.csv"))
-
-def align_folders(score_files, aff_tweet_files):
-    """
-    Align folders if a score file is missing, this tweet file should be skipped - only works if a single score file is missing in single sequence
-    """
-    iter_score = iter(score_files)
-    iter_tweets = iter(aff_tweet_files)
-    scores, aff_tweets = [], []
-
-    for score_file, tweet_file in zip(iter_score, iter_tweets):
-        hour_score = score_file.split("_")[4]
-        hour_tweet = tweet_file.split("_")[4]
-
-        if hour_score != hour_tweet:
-            tweet_file = next(iter_tweets)
-
-        scores.append(score_file)
-        aff_tweets.append(tweet_file)
-    return scores, aff_tweets
-
-def get_date_name(score_file):
-    beg_ind = score_file.index("_")
-    end_ind = score_file.index(".")
-    date_name = score_file[beg_ind + 1: end_ind]
-    return date_name
+import sys
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from utils.score_index import ScoreIndex, IDS_EXT
+from utils.file_catalog import FileCatalog
+from utils.score_io import read_scores, scores_year_path
+from utils.results_store import HourlyResults, RESULTS_FORMATS, results_file_path
+from utils.metrics import Metrics
+from utils.profiling import make_profiler, add_profile_args
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -75,43 +41,76 @@ if __name__ == "__main__":
     parser.add_argument('--tweet_type', default='worldgeo',
                         help='What type of tweets are we analyzing? (worldgeo, onepercent)')
     parser.add_argument("--areas", nargs="*", default="full_country", help="Which areas do we want to aggregate for")
+    parser.add_argument("--score_index_path", default='', type=str,
+                        help="Path to the score index written by the imputer; used instead of the score .csv files")
+    parser.add_argument("--results_format", default="csv", type=str, choices=RESULTS_FORMATS,
+                        help="Format of the results file per area: csv (all_means_<area>.csv) or parquet "
+                             "(hourly_scores_<area>.parquet with the moments, needs pyarrow)")
+    parser.add_argument("--catalog_cache_path", default="", type=str,
+                        help="Folder to cache the listing of the score and affected tweets folders in (default: no cache)")
+    parser.add_argument("--append", action="store_true",
+                        help="Merge with the results file of an earlier run instead of overwriting it")
+    parser.add_argument("--metrics_path", default="", type=str,
+                        help="JSON-lines file to write the per-file stage timings, counts and memory to")
+    add_profile_args(parser)
     args = parser.parse_args()
+    if args.append and args.results_format != "parquet":
+        parser.error("--append needs --results_format parquet, the csv results have no moments to merge")
+    metrics = Metrics(args.metrics_path if args.metrics_path != "" else None, run_name="senti_aggregator",
+                      profiler=make_profiler(args, "senti_aggregator", os.path.join(args.output_path, "profiles")))
 
     for year in args.years:
-        scores_path = os.path.join(args.senti_scores_path, args.tweet_type, year)
-        score_files = sorted([os.path.basename(elem) for elem in glob.glob(os.path.join(scores_path, "*"))])
+        index = None
+        if args.score_index_path != '':
+            # The index has a partition per hour-file, use it instead of the score files
+            index_path = os.path.join(args.score_index_path, args.tweet_type, year)
+            index = ScoreIndex(index_path)
+            score_catalog = FileCatalog(index_path, cache_dir=args.catalog_cache_path or None)
+            score_filters = {"ext": IDS_EXT}
+        else:
+            # Score files in any output format: <year> folder for csv, year=/month= partitions for parquet/feather
+            score_catalog = FileCatalog(scores_year_path(os.path.join(args.senti_scores_path, args.tweet_type), year),
+                                        cache_dir=args.catalog_cache_path or None, recursive=True)
+            score_filters = None
 
         for area in args.areas:
             tweets_path = os.path.join(args.aff_tweets_path, args.tweet_type, year, area)
-            aff_tweet_files = sorted([os.path.basename(elem) for elem in glob.glob(os.path.join(tweets_path, "tweets", "*"))])
+            aff_catalog = FileCatalog(os.path.join(tweets_path, "tweets"), cache_dir=args.catalog_cache_path or None)
             out_path = os.path.join(args.output_path, args.tweet_type, year, area)
+            results = HourlyResults() # Per-hour moments, kept in memory and written once
 
-            # Some files might be missing in the sentiment scores, also need to remove these from affected tweets
-            score_files, aff_tweet_files = align_folders(score_files, aff_tweet_files)
-
-            for score_file, aff_tweet_file in zip(score_files, aff_tweet_files):
-                score_path = os.path.join(scores_path, score_file)
-                aff_path = os.path.join(tweets_path, "tweets", aff_tweet_file)
-
-                date_name = get_date_name(score_file)
+            # Pair the score file and affected tweets file of every hour; hours missing in either folder are skipped
+            for aff_entry, score_entry in aff_catalog.join(score_catalog, other_filters=score_filters):
+                date_name = score_entry.date_name
                 print("date name: ", date_name)
-                if date_name not in aff_tweet_file:
-                    # We must be sure that we combine senti score and affected tweets of the same hour-file
-                    print("The file names are different. \nscore file: {} \naffected tweets file: {}"
-                          .format(score_file, aff_tweet_file))
-                else:
-                    senti_df = pd.read_csv(score_path)
-                    senti_df = senti_df[senti_df["score"] <= 1]
-
-                    aff_tweets_df = pd.read_csv(aff_path)
-
-                    # Merge affected tweets with sentiment scores to get the score for tweets from the affected area only
-                    df = aff_tweets_df.merge(senti_df, left_on="tweet_id", right_on="message_id")
-                    df = df[["score"]]
-
-                    mean_score = np.mean(df['score'])
-                    mean_df = pd.DataFrame([{"mean": mean_score}])
-                    mean_df.to_csv(os.path.join(out_path, "aggr_score_{}.csv".format(date_name)))
-
-            # Compile all the average scores and standardized values into a single .csv file
-            comp_single_file(out_path, area)
+                with metrics.file("{}:{}".format(area, date_name)):
+                    with metrics.stage("read"):
+                        aff_tweets_df = pd.read_csv(aff_catalog.full_path(aff_entry))
+                    metrics.count("rows_in", len(aff_tweets_df))
+
+                    if index is not None:
+                        # Look up the scores of the affected tweets directly in the memory-mapped score index
+                        with metrics.stage("merge"):
+                            df = index.lookup_frame(aff_tweets_df["tweet_id"], date_name)
+                            df = df[df["score"] <= 1]
+                            df = df[["score"]].astype(np.float64)
+                    else:
+                        with metrics.stage("read"):
+                            senti_df = read_scores(score_catalog.full_path(score_entry), columns=["message_id", "score"])
+                        metrics.count("score_rows", len(senti_df))
+
+                        # Merge affected tweets with sentiment scores to get the score for tweets from the affected area only
+                        with metrics.stage("merge"):
+                            senti_df = senti_df[senti_df["score"] <= 1]
+                            df = aff_tweets_df.merge(senti_df, left_on="tweet_id", right_on="message_id")
+                            df = df[["score"]]
+
+                    with metrics.stage("aggregate"):
+                        results.add(date_name, df['score'].to_numpy())
+                    metrics.count("rows_out", len(df))
+
+            # Write all hours with mean and standardized values to a single file
+            with metrics.stage("write"):
+                results.save(results_file_path(out_path, area, args.results_format), append=args.append)
+
+    metrics.summary()
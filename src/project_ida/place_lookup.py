@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+
+class PlaceAreaLookup:
+    """
+    PlaceAreaLookup class to classify geo-tagged tweets into all areas in one vectorized step.
+    The lookup is built once per run and maps (place_type, full_name) to a bitmask of the areas the place belongs to:
+    affected cities are matched on their "city, abbrev" name, fully affected states on their admin name. The mask of
+    every distinct place seen across the files is cached, so each hour only the new places are looked up.
+    Params
+        areas: list of areas, "full_country" includes every place in the country
+        aff_cities: dictionary of area -> DataFrame with affected cities (column city_and_abbrev)
+        full_states: dictionary of area -> list of fully affected states, like "Louisiana, USA"
+    """
+
+    def __init__(self, areas, aff_cities, full_states):
+        self.areas = list(areas)
+        self.bits = {area: 1 << ind for ind, area in enumerate(self.areas)}
+
+        # Areas that every place in the country belongs to
+        self.country_mask = sum(bit for area, bit in self.bits.items() if area == "full_country")
+
+        self.table = {}
+        for area, bit in self.bits.items():
+            if area == "full_country":
+                continue
+            for city in aff_cities[area]["city_and_abbrev"]:
+                self.table[("city", city)] = self.table.get(("city", city), 0) | bit
+            for state in full_states[area]:
+                self.table[("admin", state)] = self.table.get(("admin", state), 0) | bit
+
+        self.cache = {}
+
+    def place_mask(self, place):
+        mask = self.cache.get(place)
+        if mask is None:
+            mask = self.country_mask | self.table.get(place, 0)
+            self.cache[place] = mask
+        return mask
+
+    def classify(self, country_df):
+        """
+        Returns an array with the area bitmask of every tweet in country_df (tweets from the country, with columns
+        type and full_name)
+        """
+        places = pd.MultiIndex.from_arrays([country_df["type"].astype(object).fillna(""),
+                                            country_df["full_name"].astype(object).fillna("")])
+        codes, uniques = pd.factorize(places)
+        unique_masks = np.array([self.place_mask(place) for place in uniques], dtype=np.int64)
+        return unique_masks[codes]
+
+    def in_area(self, masks, area):
+        """
+        Boolean array of the tweets that belong to the area
+        """
+        return (masks & self.bits[area]) != 0
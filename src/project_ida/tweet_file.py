@@ -1,8 +1,11 @@
 import gzip
 import json
+import numpy as np
 import pandas as pd
 import os
 
+from gzip_index import GzipIndexBuilder
+
 class TweetFile:
     """
     TweetFile class to store information for each file containing tweets
@@ -11,21 +14,24 @@ class TweetFile:
         is_geo: bool to set the type of tweet (True is geo-tagged, False is regular) - default False
         locs_only: bool to set whether we only want to store the tweets with non-empty user location
                    this is to save memory because we only consider the tweets where we can infer the location - default True
+        with_text: bool to also store the tweet text and language, for scoring the tweets in the same pass - default False
+        index_path: folder to write the sidecar index of the file to while parsing (see gzip_index.py), "" for a
+                    gzip_index/ folder next to the file - default None (no index)
     """
 
-    def __init__(self, path_to_data, is_geo=False, locs_only=True):
+    def __init__(self, path_to_data, is_geo=False, locs_only=True, with_text=False, index_path=None):
         self.path = path_to_data
-        self.lines = self.extract_lines()
-        self.len_lines = len(self.lines)
+        self.len_lines = 0
+        self.len_bytes = 0 # Uncompressed bytes read
+        self.line_offset = 0 # Uncompressed offset of the current line
+        self.with_text = with_text
+        self.index = GzipIndexBuilder(path_to_data, index_path) if index_path is not None else None
 
         # Regular tweets
         if not is_geo:
-            self.tweets = self.extract_tweets()
-
-            # Override tweets and only store the tweets with non-empty user-profile location
-            if locs_only:
-                self.len_all_tweets = len(self.tweets) # len_all_tweets refers to all tweets, not just with location
-                self.tweets = self.extract_location()
+            # With locs_only, tweets with empty user-profile location are skipped while parsing, len_all_tweets still
+            # refers to all tweets, not just with location
+            self.tweets = self.extract_tweets(locs_only)
 
         # Geo-tagged tweets
         else:
@@ -33,50 +39,95 @@ class TweetFile:
 
         self.len_tweets = len(self.tweets)
         self.date_name = self.extract_date_name()
+        if self.index is not None:
+            self.index.save()
 
     def extract_lines(self):
         """
-        Method to open the .txt.gzip file. 
+        Method to stream the lines of the .txt.gzip file, so the raw lines are never all in memory at once.
         Returns
-            Lines: a txt file object
+            Lines: generator over the lines of the file
+        """
+        for line in self.open_lines():
+            self.line_offset = self.len_bytes
+            self.len_lines += 1
+            self.len_bytes += len(line)
+            yield line
+        print("Lines in original file: ", self.len_lines)
+
+    def open_lines(self):
+        if self.index is not None:
+            # Same lines as gzip.open, also recording the decompression checkpoints of the index
+            for _, line in self.index.lines():
+                yield line
+        else:
+            with gzip.open(self.path, "r") as f:
+                yield from f
+
+    def add_to_index(self, dict_line):
         """
-        with gzip.open(self.path, "r") as f:
-            lines = f.readlines()
-        print("Lines in original file: ", len(lines))
-        return lines
+        Add a parsed line to the sidecar index, if one is built; lines without tweet or user ID are not indexed
+        """
+        try:
+            self.index.add(dict_line['id'], dict_line['user']['id'], self.line_offset)
+        except (KeyError, TypeError):
+            pass
 
-    def extract_tweets(self):
+    def extract_tweets(self, locs_only=False):
         """
-        Extract the tweets from the data file, storing tweet ID, user ID and location entry (not storing any geo-tag information)
+        Extract the tweets from the data file, storing tweet ID, user ID and location entry (not storing any geo-tag information).
+        The columns are built directly as typed arrays: int64 ID's and an object array of location strings. With
+        with_text the text and language are stored too (None if the tweet has none).
+        Params
+            locs_only: bool to only keep the tweets with non-empty user-profile location - default False
         Returns
             df: DataFrame with tweets
         """
-        tweets = []
-        for line in self.lines:
+        tweet_ids, user_ids, locations, texts, langs = [], [], [], [], []
+        self.len_all_tweets = 0
+        for line in self.extract_lines():
             try:
                 dict_line = json.loads(line)
+                if self.index is not None:
+                    self.add_to_index(dict_line)
                 tweet_id = dict_line['id']
                 user_id = dict_line['user']['id']
                 location = dict_line['user']['location']
-
-                tweet = {"tweet_id": tweet_id, "user_id": user_id, "location": location}
-                tweets.append(tweet)
             except:
                 continue
-        print("Tweets: ", len(tweets))
-        df = pd.DataFrame(tweets)
+
+            self.len_all_tweets += 1
+            if locs_only and not location: # Location is None or empty string
+                continue
+            tweet_ids.append(tweet_id)
+            user_ids.append(user_id)
+            locations.append(location)
+            if self.with_text:
+                texts.append(dict_line.get('text'))
+                langs.append(dict_line.get('lang'))
+
+        print("Tweets: ", self.len_all_tweets)
+        df = pd.DataFrame({"tweet_id": np.array(tweet_ids, dtype=np.int64),
+                           "user_id": np.array(user_ids, dtype=np.int64),
+                           "location": np.array(locations, dtype=object)})
+        if self.with_text:
+            df["text"] = np.array(texts, dtype=object)
+            df["lang"] = np.array(langs, dtype=object)
         return df
 
     def extract_geo_tweets(self):
         """
         Extract geo-tagged tweets from the data file, storing tweet ID, user ID, full name of the tagged location, country of the geo-tag, and geo-tag type
+        The ID's are stored as int64; full name, country and type repeat a lot and are stored as categoricals.
         Returns
             df: DataFrame with geo-tagged tweets
         """
-        geo_tweets = []
-        for line in self.lines:
+        tweet_ids, user_ids, full_names, countries, types, texts, langs = [], [], [], [], [], [], []
+        for line in self.extract_lines():
             try:
                 dict_line = json.loads(line)
+                if self.index is not None:
+                    self.add_to_index(dict_line)
                 tweet_id = dict_line['id']
                 user_id = dict_line['user']['id']
 
@@ -84,14 +135,27 @@ class TweetFile:
                 full_name = place_obj['full_name']
                 country = place_obj['country']
                 type = place_obj['place_type']
-
-                tweet = {"tweet_id": tweet_id, "user_id": user_id, "full_name": full_name, "country": country,
-                         "type": type}
-                geo_tweets.append(tweet)
             except:
                 continue
-        print("Geo-tagged tweets: ", len(geo_tweets))
-        df = pd.DataFrame(geo_tweets)
+
+            tweet_ids.append(tweet_id)
+            user_ids.append(user_id)
+            full_names.append(full_name)
+            countries.append(country)
+            types.append(type)
+            if self.with_text:
+                texts.append(dict_line.get('text'))
+                langs.append(dict_line.get('lang'))
+
+        print("Geo-tagged tweets: ", len(tweet_ids))
+        df = pd.DataFrame({"tweet_id": np.array(tweet_ids, dtype=np.int64),
+                           "user_id": np.array(user_ids, dtype=np.int64),
+                           "full_name": pd.Categorical(full_names),
+                           "country": pd.Categorical(countries),
+                           "type": pd.Categorical(types)})
+        if self.with_text:
+            df["text"] = np.array(texts, dtype=object)
+            df["lang"] = np.array(langs, dtype=object)
         return df
 
     def extract_date_name(self):
@@ -102,17 +166,6 @@ class TweetFile:
         end_ind = base_name.index(".")
         return base_name[:end_ind]
 
-    def extract_location(self):
-        """
-        Extract the tweets that have non-empty user-profile location
-        Returns
-            tweets_loc: tweets DataFrame with non-empty location
-        """
-        copy_df = self.tweets
-        df = copy_df.replace(to_replace="", value=pd.NaT) # Replace empty string values with pd.NaT, those are picked up by dropna()
-        tweets_loc = df.dropna(subset=['location'])
-        return tweets_loc
-
     def extract_location_and_descrip(self):
         """
         (NOT USED)
@@ -133,12 +186,15 @@ class TweetFile:
     def get_len_all_tweets(self):
         return self.len_all_tweets
 
-    def get_lines(self):
-        return self.lines
-
     def get_len_tweets(self):
         return self.len_tweets
 
+    def get_len_lines(self):
+        return self.len_lines
+
+    def get_len_bytes(self):
+        return self.len_bytes
+
     def get_tweets(self):
         return self.tweets
 
@@ -1,23 +1,78 @@
+import sqlite3
+import numpy as np
 import pandas as pd
 
 class UniqueUsers:
     """
-    UniqueUsers class to store and update the unique users over many tweet files
+    UniqueUsers class to store and update the unique users over many tweet files.
+    The users are kept in a hash map from int64 user ID to an index into an interned table of location strings, so
+    adding a batch costs time proportional to the batch size and every distinct location is stored only once.
+    As before, the first location seen for a user is the one that is kept.
+    Params
+        spill_path: path to a sqlite file. If given, the user map is kept on disk instead of in memory, for runs over
+                    a year of files - default None
     """
 
-    def __init__(self):
-        # Initialize the Unique Users object with an empty dataframe
-        self.users = pd.DataFrame({"user_id": [], "location": []}, dtype=int)
+    def __init__(self, spill_path=None):
+        self.loc_ids = {} # Location string -> location ID
+        self.locations = [] # Location ID -> location string
+        self.user_locs = {} # User ID -> location ID, in order of first appearance
+        self.n_users = 0
+
+        self.db = None
+        if spill_path is not None:
+            self.db = sqlite3.connect(spill_path)
+            self.db.execute("PRAGMA journal_mode=OFF")
+            self.db.execute("PRAGMA synchronous=OFF")
+            # The location table lives in memory, so a spill file from an earlier run can not be reused
+            self.db.execute("DROP TABLE IF EXISTS users")
+            self.db.execute("CREATE TABLE users (seq INTEGER PRIMARY KEY, user_id INTEGER UNIQUE, loc_id INTEGER)")
+
+    def intern_locations(self, locations):
+        """
+        Returns the location ID for every location in the batch, adding the new ones to the location table
+        """
+        codes, uniques = pd.factorize(locations)
+        # Missing locations (None, NaN) get code -1: they are interned as None, at the last position
+        uniques = list(uniques) + ([None] if (codes < 0).any() else [])
+        unique_ids = np.empty(len(uniques), dtype=np.int64)
+        for ind, location in enumerate(uniques):
+            loc_id = self.loc_ids.get(location)
+            if loc_id is None:
+                loc_id = len(self.locations)
+                self.loc_ids[location] = loc_id
+                self.locations.append(location)
+            unique_ids[ind] = loc_id
+        return unique_ids[codes]
 
     def update_users(self, df):
         """
-        Update unique users with pandas functions
+        Update unique users with the users of a new batch (DataFrame with user_id and location)
         """
-        new_df = pd.concat([self.users, df])
-        self.users = new_df.drop_duplicates(subset=["user_id"]).reset_index(drop=True)
-        print(f"Users updated. Unique users: {len(self.users)}")
+        batch = df.drop_duplicates(subset=["user_id"])
+        user_ids = batch["user_id"].to_numpy(dtype=np.int64)
+        loc_ids = self.intern_locations(batch["location"].to_numpy(dtype=object))
 
-    def get_users(self):
-        return self.users
+        if self.db is None:
+            add_user = self.user_locs.setdefault
+            for user_id, loc_id in zip(user_ids.tolist(), loc_ids.tolist()):
+                add_user(user_id, loc_id)
+            self.n_users = len(self.user_locs)
+        else:
+            cursor = self.db.executemany("INSERT OR IGNORE INTO users (user_id, loc_id) VALUES (?, ?)",
+                                         zip(user_ids.tolist(), loc_ids.tolist()))
+            self.db.commit()
+            self.n_users += cursor.rowcount
+        print(f"Users updated. Unique users: {self.n_users}")
 
+    def get_users(self):
+        if self.db is None:
+            user_ids = np.fromiter(self.user_locs.keys(), dtype=np.int64, count=self.n_users)
+            loc_ids = np.fromiter(self.user_locs.values(), dtype=np.int64, count=self.n_users)
+        else:
+            rows = pd.read_sql_query("SELECT user_id, loc_id FROM users ORDER BY seq", self.db)
+            user_ids = rows["user_id"].to_numpy(dtype=np.int64)
+            loc_ids = rows["loc_id"].to_numpy(dtype=np.int64)
 
+        locations = np.array(self.locations, dtype=object)
+        return pd.DataFrame({"user_id": user_ids, "location": locations[loc_ids]})
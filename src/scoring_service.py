@@ -0,0 +1,240 @@
+# Example params:
+# --port 8765
+# --batch_size 256 (texts per model call)
+# --max_latency 0.05 (seconds a request waits for other requests to fill the batch)
+# --stand_in (optional, tiny stand-in model instead of models/emb.pkl and models/clf.pkl, for testing)
+
+"""
+Local scoring service: loads the embedding model and classifier (models/emb.pkl, models/clf.pkl) once and scores
+cleaned texts over HTTP on localhost, so several jobs on a node share one model instead of each loading their own.
+Requests of concurrent clients are batched: a batch is scored when it holds batch_size texts or when its first
+request has waited max_latency seconds. Endpoints:
+    POST /score    {"texts": [...]} -> {"scores": [...]}
+    GET  /health   status of the service
+    GET  /stats    requests, texts, batches, mean batch size and throughput
+Start the service, then run main_sentiment_imputer.py or project_ida/main_hour_pipeline.py with --scoring_url
+http://127.0.0.1:8765 (see utils/scoring_client.py).
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+SRC_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(SRC_PATH)
+
+class ScoreRequest:
+    """
+    Texts of one request, and the scores or error set by the batching thread
+    """
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.done = threading.Event()
+        self.scores = None
+        self.error = None
+
+class BatchingScorer:
+    """
+    BatchingScorer class to score the texts of concurrent requests in shared batches on a background thread
+    Params
+        emb_model: embedding model with an encode() method
+        clf_model: classifier with a predict_proba() method
+        batch_size: number of texts after which a batch is scored right away - default 256
+        max_latency: seconds the first request of a batch waits for more requests - default 0.05
+    """
+
+    def __init__(self, emb_model, clf_model, batch_size=256, max_latency=0.05):
+        self.emb_model = emb_model
+        self.clf_model = clf_model
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.queue = queue.Queue()
+
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.stats_counts = {"requests": 0, "texts": 0, "batches": 0, "errors": 0, "busy_seconds": 0.0}
+
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.batch_loop, name="batching-scorer", daemon=True)
+        self.thread.start()
+
+    def score(self, texts, timeout=None):
+        """
+        Score a list of cleaned texts; blocks until the batch with the texts is scored
+        """
+        request = ScoreRequest(texts)
+        self.queue.put(request)
+        if not request.done.wait(timeout):
+            raise TimeoutError("No scores within {} seconds".format(timeout))
+        if request.error is not None:
+            raise RuntimeError(request.error)
+        return request.scores
+
+    def next_batch(self):
+        """
+        Collect requests until the batch holds batch_size texts or the first request has waited max_latency
+        """
+        try:
+            batch = [self.queue.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+        n_texts = len(batch[0].texts)
+        deadline = time.monotonic() + self.max_latency
+        while n_texts < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            n_texts += len(request.texts)
+        return batch
+
+    def batch_loop(self):
+        while not self.stopped.is_set():
+            batch = self.next_batch()
+            if len(batch) > 0:
+                self.run_batch(batch)
+
+    def run_batch(self, batch):
+        texts = [text for request in batch for text in request.texts]
+        start = time.perf_counter()
+        error = None
+        try:
+            if len(texts) > 0:
+                embeddings = self.emb_model.encode(texts, show_progress_bar=False, batch_size=self.batch_size)
+                scores = self.clf_model.predict_proba(embeddings)[:, 1].tolist()
+            else:
+                scores = []
+        except Exception as e:
+            error = "{}: {}".format(type(e).__name__, e)
+        busy = time.perf_counter() - start
+
+        with self.lock:
+            self.stats_counts["requests"] += len(batch)
+            self.stats_counts["texts"] += len(texts)
+            self.stats_counts["batches"] += 1
+            self.stats_counts["busy_seconds"] += busy
+            if error is not None:
+                self.stats_counts["errors"] += len(batch)
+
+        offset = 0
+        for request in batch:
+            if error is None:
+                request.scores = scores[offset:offset + len(request.texts)]
+                offset += len(request.texts)
+            else:
+                request.error = error
+            request.done.set()
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.stats_counts)
+        uptime = time.time() - self.started
+        stats["busy_seconds"] = round(stats["busy_seconds"], 3)
+        stats["uptime_seconds"] = round(uptime, 1)
+        stats["queued_requests"] = self.queue.qsize()
+        stats["mean_batch_size"] = round(stats["texts"] / stats["batches"], 1) if stats["batches"] > 0 else None
+        stats["texts_per_second"] = round(stats["texts"] / uptime, 1) if uptime > 0 else None
+        stats["texts_per_busy_second"] = round(stats["texts"] / stats["busy_seconds"], 1) \
+            if stats["busy_seconds"] > 0 else None
+        return stats
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+
+class ScoringHandler(BaseHTTPRequestHandler):
+    """
+    HTTP handler of the scoring service; the server holds the BatchingScorer as server.scorer
+    """
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self.send_json(200, {"status": "ok", "batch_size": self.server.scorer.batch_size,
+                                 "max_latency": self.server.scorer.max_latency})
+        elif self.path == "/stats":
+            self.send_json(200, self.server.scorer.stats())
+        else:
+            self.send_json(404, {"error": "Unknown path {}".format(self.path)})
+
+    def do_POST(self):
+        if self.path != "/score":
+            self.send_json(404, {"error": "Unknown path {}".format(self.path)})
+            return
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            texts = [str(text) for text in payload["texts"]]
+        except (ValueError, KeyError, TypeError) as e:
+            self.send_json(400, {"error": "Expected a JSON body with a list of texts: {}".format(e)})
+            return
+        try:
+            self.send_json(200, {"scores": self.server.scorer.score(texts)})
+        except (RuntimeError, TimeoutError) as e:
+            self.send_json(500, {"error": str(e)})
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+def make_server(scorer, host="127.0.0.1", port=8765, verbose=False):
+    """
+    HTTP server that answers every request on its own thread and shares the scorer
+    """
+    server = ThreadingHTTPServer((host, port), ScoringHandler)
+    server.daemon_threads = True
+    server.scorer = scorer
+    server.verbose = verbose
+    return server
+
+def load_stand_in_models():
+    sys.path.append(os.path.join(SRC_PATH, "benchmarks"))
+    from synthetic_data import StandInEmbedding, StandInClassifier
+    return StandInEmbedding(), StandInClassifier()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1", type=str, help="Address to listen on (localhost only by default)")
+    parser.add_argument("--port", default=8765, type=int, help="Port to listen on")
+    parser.add_argument("--batch_size", default=256, type=int, help="Texts per batch of the model")
+    parser.add_argument("--max_latency", default=0.05, type=float,
+                        help="Seconds a request waits for other requests to fill the batch")
+    parser.add_argument("--stand_in", action="store_true",
+                        help="Use a tiny stand-in model instead of models/emb.pkl and models/clf.pkl (for testing)")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args()
+
+    if args.stand_in:
+        args.emb_model, args.clf_model = load_stand_in_models()
+    else:
+        from main_sentiment_imputer import load_models
+        load_models(args)
+
+    scorer = BatchingScorer(args.emb_model, args.clf_model, batch_size=args.batch_size, max_latency=args.max_latency)
+    server = make_server(scorer, args.host, args.port, args.verbose)
+    print("Scoring service listening on http://{}:{}".format(args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        scorer.close()
+        print("Stopped. Stats: ", json.dumps(scorer.stats()))
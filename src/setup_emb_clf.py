@@ -5,9 +5,14 @@ from tqdm.auto import tqdm
 import json
 import argparse
 import torch
+import os
 
-from src.utils.emb_clf_setup_utils import split_train_test, train_model, test_model
+from src.utils.emb_clf_setup_utils import split_train_test, train_model, test_model, train_model_streaming, \
+    predict_streaming, check_parity, print_scores
 from src.utils.data_read_in import clean_for_content
+from src.utils.embedding_store import EmbeddingStore
+from src.utils.metrics import Metrics
+from src.utils.profiling import make_profiler, add_profile_args
 
 if __name__ == '__main__':
 
@@ -27,47 +32,98 @@ if __name__ == '__main__':
     parser.add_argument('--random_seed', default=123, type=int, help='random seed')
     parser.add_argument('--batch_size', default = 100, type = int, help='batch size')
     parser.add_argument('--pca_dims', default = 100, type = int, help='number of embedding dimensions for classifier')
+    parser.add_argument('--emb_path', default='data/labeled_data/embeddings', type=str,
+                        help='folder of the embedding stores, one per embedding model, max_seq_length and dtype')
+    parser.add_argument('--emb_dtype', default='float16', type=str, help='dtype of the stored embeddings: float16 or float32')
+    parser.add_argument('--shard_size', default=None, type=int,
+                        help='number of tweets per embedding shard (default: the size of an existing store, or 50000)')
+    parser.add_argument('--streaming', action='store_true',
+                        help='train out-of-core with IncrementalPCA and SGD on chunks of the stored embeddings')
+    parser.add_argument('--chunk_size', default=50000, type=int, help='number of tweets per chunk in streaming mode')
+    parser.add_argument('--epochs', default=5, type=int, help='number of passes over the training set in streaming mode')
+    parser.add_argument('--parity_sample', default=0, type=int,
+                        help='compare the streaming and in-memory models on a subsample of this size (0: no check)')
+    parser.add_argument('--metrics_path', default='', type=str,
+                        help='JSON-lines file to write the stage timings, counts and memory to')
+    add_profile_args(parser)
     args = parser.parse_args()
+    metrics = Metrics(args.metrics_path if args.metrics_path != '' else None, run_name="setup_emb_clf",
+                      profiler=make_profiler(args, "setup_emb_clf", os.path.join('output', 'profiles')))
+    train_path = '/Users/arneeichholtz/Documents/GitHub/geotweet-sentiment-geography/data/labeled_data/training.1600000.processed.noemoticon.csv'
 
-    print("Reading in training data")
-    df = pd.read_csv('/Users/arneeichholtz/Documents/GitHub/geotweet-sentiment-geography/data/labeled_data/training.1600000.processed.noemoticon.csv',
-                     encoding='latin', header=None, usecols=[0,5]) # changed the path to a local path on my device. This will be different in the script on the server.
-    df.columns = ['label', 'text']
-
-    print("Cleaning training data")
-    df['label'] = [0 if x==0 else 1 for x in df['label']]
-    df['lang'] = 'en'
-    df['text'] = [clean_for_content(text, lang) for text, lang in tqdm(zip(df['text'], df['lang']), total=df.shape[0])]
-    df = df[df['text']!=''].reset_index(drop=True)
-
-    print("Creating Embeddings")
-    modelPath = "/Users/arneeichholtz/Documents/GitHub/stsb-xlm-r-multilingual"
-    emb_model = SentenceTransformer(model_name_or_path = modelPath) # added model_name_or_path so that the model will be downloaded locally and not from internet.
-    emb_model.max_seq_length = args.max_seq_length
-    embeddings = emb_model.encode(df['text'].head().values, show_progress_bar=True, batch_size=args.batch_size)
-    torch.save(emb_model, 'models') # this I don't fully understand. Why save the model and not the embeddings? I changed 'models/emb.pkl' -> 'models'
-
-    # Generate Training set
-    print("Preparing training and test sets")
-    split_train_test(df, args)
-    with open('/Users/arneeichholtz/Documents/GitHub/geotweet-sentiment-geography/data/labeled_data/train_ids.txt', 'r') as fp:
-        train_ids = json.load(fp)
-    with open('/Users/arneeichholtz/Documents/GitHub/geotweet-sentiment-geography/data/labeled_data/test_ids.txt', 'r') as fp:
-        test_ids = json.load(fp)
-
-    # Create and Train Model
-    train_df = df.loc[train_ids,:]
-    train_embeddings = embeddings[train_ids,:]
-
-    clf_model = train_model(train_df, train_embeddings, args) # trained on the embeddings and features
-    torch.save(clf_model, 'models')
-
-    print("\nPerformance on train set:")
-    test_model(clf_model, train_df, train_embeddings)
-
-    # Test Model:
-    test_df = df.loc[test_ids,:]
-    test_embeddings = embeddings[test_ids,:]
-
-    print("\nPerformance on test set:")
-    test_model(clf_model, test_df, test_embeddings)
+    # The training data is the only input file, so the whole run is one metrics record (and one profile)
+    with metrics.file(os.path.basename(train_path)):
+        print("Reading in training data")
+        with metrics.stage("read"):
+            df = pd.read_csv(train_path, encoding='latin', header=None, usecols=[0,5]) # changed the path to a local path on my device. This will be different in the script on the server.
+        df.columns = ['label', 'text']
+        metrics.count("rows_in", len(df))
+
+        print("Cleaning training data")
+        with metrics.stage("clean"):
+            df['label'] = [0 if x==0 else 1 for x in df['label']]
+            df['lang'] = 'en'
+            df['text'] = [clean_for_content(text, lang) for text, lang in tqdm(zip(df['text'], df['lang']), total=df.shape[0])]
+            df = df[df['text']!=''].reset_index(drop=True)
+
+        print("Creating Embeddings")
+        modelPath = "/Users/arneeichholtz/Documents/GitHub/stsb-xlm-r-multilingual"
+        emb_model = SentenceTransformer(model_name_or_path = modelPath) # added model_name_or_path so that the model will be downloaded locally and not from internet.
+        emb_model.max_seq_length = args.max_seq_length
+        # The embeddings are stored on disk, so they are only encoded once per model and max_seq_length (and an
+        # interrupted run continues where it stopped). The model itself is saved for main_sentiment_imputer.py
+        store = EmbeddingStore(args.emb_path, os.path.basename(modelPath.rstrip('/')), args.max_seq_length,
+                               dtype=args.emb_dtype, shard_size=args.shard_size)
+        with metrics.stage("encode"):
+            store.encode(df['text'].values, emb_model, batch_size=args.batch_size)
+            store.save_labels(df['label'].values)
+        os.makedirs('models', exist_ok=True)
+        torch.save(emb_model, 'models/emb.pkl')
+
+        # Generate Training set
+        print("Preparing training and test sets")
+        with metrics.stage("split"):
+            split_train_test(df, args)
+        with open('/Users/arneeichholtz/Documents/GitHub/geotweet-sentiment-geography/data/labeled_data/train_ids.txt', 'r') as fp:
+            train_ids = json.load(fp)
+        with open('/Users/arneeichholtz/Documents/GitHub/geotweet-sentiment-geography/data/labeled_data/test_ids.txt', 'r') as fp:
+            test_ids = json.load(fp)
+
+        if args.parity_sample > 0:
+            with metrics.stage("parity"):
+                check_parity(store, train_ids, test_ids, df['label'].values, args)
+
+        if args.streaming:
+            # Create and Train Model out-of-core: only one chunk of embeddings is in memory at a time
+            with metrics.stage("train"):
+                clf_model = train_model_streaming(store, train_ids, df['label'].values, args)
+            torch.save(clf_model, 'models/clf.pkl')
+
+            with metrics.stage("test"):
+                print("\nPerformance on train set:")
+                print_scores(predict_streaming(clf_model, store, train_ids, args.chunk_size), df.loc[train_ids,:])
+
+                print("\nPerformance on test set:")
+                print_scores(predict_streaming(clf_model, store, test_ids, args.chunk_size), df.loc[test_ids,:])
+        else:
+            # Create and Train Model
+            train_df = df.loc[train_ids,:]
+            train_embeddings = store.take(train_ids)
+
+            with metrics.stage("train"):
+                clf_model = train_model(train_df, train_embeddings, args) # trained on the embeddings and features
+            torch.save(clf_model, 'models/clf.pkl')
+
+            with metrics.stage("test"):
+                print("\nPerformance on train set:")
+                test_model(clf_model, train_df, train_embeddings)
+
+                # Test Model:
+                test_df = df.loc[test_ids,:]
+                test_embeddings = store.take(test_ids)
+
+                print("\nPerformance on test set:")
+                test_model(clf_model, test_df, test_embeddings)
+        metrics.count("rows_out", len(df))
+
+    metrics.summary()
@@ -0,0 +1,140 @@
+# Example params:
+# --emb_model_name stsb-xlm-r-multilingual --max_seq_length 64 (the embedding store written by setup_emb_clf.py)
+# --pca_dims 50 100 200 --reg 0.1 1 10 --reg_norm l1 l2
+# --n_jobs 8
+# --export_path models/clf_sweep.pkl (optional, the best model is saved there)
+
+"""
+Hyperparameter sweep of the sentiment classifier over pca_dims, reg and reg_norm, on the embeddings stored by
+setup_emb_clf.py. PCA is fitted once with the largest pca_dims: the components are ordered by explained variance, so
+the projection for a smaller pca_dims is the first pca_dims columns of the largest one and does not need a refit. The
+logistic regressions of the grid are fitted in parallel, the results are written to a table sorted by test accuracy
+and the best model is exported as a PCA + logistic regression pipeline, like the model of train_model.
+"""
+
+import os
+import copy
+import time
+import argparse
+import datetime
+import itertools
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.decomposition import PCA
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import train_test_split
+from sklearn.pipeline import Pipeline
+
+from src.utils.embedding_store import EmbeddingStore
+
+def truncate_pca(pca, n_components):
+    """
+    Copy of a fitted PCA that keeps only its first n_components components
+    """
+    pca = copy.deepcopy(pca)
+    pca.components_ = pca.components_[:n_components]
+    pca.explained_variance_ = pca.explained_variance_[:n_components]
+    pca.explained_variance_ratio_ = pca.explained_variance_ratio_[:n_components]
+    pca.singular_values_ = pca.singular_values_[:n_components]
+    pca.n_components = pca.n_components_ = n_components
+    return pca
+
+def fit_setting(Z_train, y_train, Z_test, y_test, pca_dims, reg, reg_norm, args):
+    """
+    Fit the logistic regression of one grid setting on the first pca_dims projected dimensions and score it
+    Returns
+        result: dictionary with the setting and its scores
+        logreg: the fitted LogisticRegression
+    """
+    start = time.perf_counter()
+    if reg_norm == 'l1':
+        logreg = LogisticRegression(random_state=args.random_seed, solver='saga', max_iter=args.max_iter, C=reg,
+                                    penalty='l1')
+    else:
+        logreg = LogisticRegression(random_state=args.random_seed, solver='lbfgs', max_iter=args.max_iter, C=reg,
+                                    penalty=reg_norm)
+    logreg.fit(Z_train[:, :pca_dims], y_train)
+    fit_seconds = time.perf_counter() - start
+
+    test_pred = logreg.predict(Z_test[:, :pca_dims])
+    tp = np.sum((test_pred == 1) & (y_test == 1))
+    result = {'pca_dims': pca_dims, 'reg': reg, 'reg_norm': reg_norm,
+              'train_accuracy': logreg.score(Z_train[:, :pca_dims], y_train),
+              'test_accuracy': np.mean(test_pred == y_test),
+              'precision': tp / max(np.sum(test_pred == 1), 1), 'recall': tp / max(np.sum(y_test == 1), 1),
+              'fit_seconds': round(fit_seconds, 2)}
+    return result, logreg
+
+def export_model(clf, path):
+    import torch # Saved like setup_emb_clf.py does, so main_sentiment_imputer.py can load it with torch.load
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    torch.save(clf, path)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--emb_path', default='data/labeled_data/embeddings', type=str,
+                        help='folder of the embedding stores, as in setup_emb_clf.py')
+    parser.add_argument('--emb_model_name', default='stsb-xlm-r-multilingual', type=str,
+                        help='name of the embedding model of the store')
+    parser.add_argument('--max_seq_length', type=int, default=64, help='maximum sequence length of the store')
+    parser.add_argument('--emb_dtype', default='float16', type=str, help='dtype of the stored embeddings')
+    parser.add_argument('--train_size', default=0.8, type=float, help='What is the size of the training set?')
+    parser.add_argument('--random_seed', default=123, type=int, help='random seed')
+    parser.add_argument('--sample', default=0, type=int,
+                        help='sweep on a random subsample of this many training tweets (0: the full training set)')
+    parser.add_argument('--pca_dims', nargs='+', default=[50, 100, 200], type=int, help='pca_dims values of the grid')
+    parser.add_argument('--reg', nargs='+', default=[0.1, 1., 10.], type=float, help='reg (C) values of the grid')
+    parser.add_argument('--reg_norm', nargs='+', default=['l2'], type=str, help='reg_norm values of the grid')
+    parser.add_argument('--max_iter', type=int, default=100, help='number of max iterations for model fitting')
+    parser.add_argument('--n_jobs', default=-1, type=int, help='number of parallel fits (-1: all cores)')
+    parser.add_argument('--output_path', default='output/sweeps', type=str, help='folder for the results table')
+    parser.add_argument('--export_path', default='models/clf_sweep.pkl', type=str,
+                        help='path of the best model (empty: do not export)')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    store = EmbeddingStore(args.emb_path, args.emb_model_name, args.max_seq_length, dtype=args.emb_dtype)
+    labels = store.load_labels()
+    # The same split as split_train_test in setup_emb_clf.py, which splits the rows 0..n-1 of the training data
+    train_ids, test_ids = train_test_split(np.arange(len(labels)), test_size=1-args.train_size,
+                                           random_state=args.random_seed)
+    if 0 < args.sample < len(train_ids):
+        train_ids = np.random.default_rng(args.random_seed).choice(train_ids, args.sample, replace=False)
+    print("TRAIN size:", len(train_ids))
+    print("TEST size:", len(test_ids))
+
+    X_train = store.take(train_ids)
+    y_train, y_test = labels[train_ids], labels[test_ids]
+
+    max_dims = max(args.pca_dims)
+    print("Fitting PCA with {} components".format(max_dims))
+    pca = PCA(n_components=max_dims, random_state=args.random_seed).fit(X_train)
+    Z_train = pca.transform(X_train)
+    del X_train
+    Z_test = np.concatenate([pca.transform(store.take(test_ids[i:i + 100000])) for i in range(0, len(test_ids), 100000)])
+    pca_seconds = time.perf_counter() - start
+
+    grid = list(itertools.product(sorted(args.pca_dims), args.reg, args.reg_norm))
+    print("Fitting {} settings".format(len(grid)))
+    fits = Parallel(n_jobs=args.n_jobs)(
+        delayed(fit_setting)(Z_train, y_train, Z_test, y_test, pca_dims, reg, reg_norm, args)
+        for pca_dims, reg, reg_norm in grid)
+
+    results = pd.DataFrame([result for result, _ in fits]).sort_values('test_accuracy', ascending=False)
+    os.makedirs(args.output_path, exist_ok=True)
+    out_file = os.path.join(args.output_path, "sweep_{}.csv".format(datetime.datetime.now().strftime("%Y%m%d_%H%M%S")))
+    results.to_csv(out_file, index=False)
+    print(results.to_string(index=False))
+    print("\nPCA and projection: {:.1f} s, total: {:.1f} s".format(pca_seconds, time.perf_counter() - start))
+    print("Results written to ", out_file)
+
+    best = results.index[0]
+    best_result, best_logreg = fits[best]
+    if args.export_path != '':
+        clf = Pipeline([('pca', truncate_pca(pca, best_result['pca_dims'])), ('logreg', best_logreg)])
+        export_model(clf, args.export_path)
+        print("Best model (pca_dims {}, reg {}, reg_norm {}) written to {}".format(
+            best_result['pca_dims'], best_result['reg'], best_result['reg_norm'], args.export_path))
@@ -7,6 +7,13 @@ import datetime
 import re
 
 from utils.data_read_in import read_in
+from utils.keyword_filter import KeywordFilter
+from utils.metrics import Metrics, get_metrics
+from utils.profiling import make_profiler
+from utils.score_io import read_scores, find_score_file
+
+# Nullable integers, so a missing id does not turn the column into float64 (which rounds 19-digit ids)
+ID_DTYPES = {'message_id': 'Int64', 'user_id': 'Int64'}
 
 def check_args(args):
 
@@ -52,6 +59,12 @@ def check_args(args):
     args.excl_keywords = list(args.excl_keywords)
     args.keywords = args.incl_keywords + args.excl_keywords
 
+    # Compile the keyword sets once for the whole run
+    ignore_case = getattr(args, 'keywords_ignore_case', False)
+    whole_words = getattr(args, 'keywords_whole_words', False)
+    args.incl_filter = KeywordFilter(args.incl_keywords, ignore_case, whole_words) if len(args.incl_keywords)>0 else None
+    args.excl_filter = KeywordFilter(args.excl_keywords, ignore_case, whole_words) if len(args.excl_keywords)>0 else None
+
     args.filename = "{}_{}_{}_{}{}".format(
         args.sentiment_method,
         'global' if len(args.countries)==0 else "_".join([elem.lower() for elem in args.countries]),
@@ -63,6 +76,13 @@ def check_args(args):
     if args.subset_usernames_file != '':
         args.usernames = [elem for elem in open(args.subset_usernames_file).read().split("\n") if elem != '']
 
+    # Per-day stage timings, counts and memory, written to args.metrics_path if given; with args.profile the hot
+    # functions are profiled per day as well
+    if getattr(args, 'metrics', None) is None:
+        metrics_path = getattr(args, 'metrics_path', '')
+        args.metrics = Metrics(metrics_path if metrics_path != '' else None, run_name="aggregation",
+                               profiler=make_profiler(args, "aggregation", 'data/aggregate_sentiment/profiles'))
+
     return args
 
 def get_dates(args):
@@ -74,82 +94,109 @@ def get_dates(args):
 
     return dates
 
-def get_daily_data(date, args):
-
-    df_day = pd.DataFrame()
-
-    for i in range(24):
-
-        try:
-
-            try:
+def read_hour(date, hour, args, path_ext=''):
+    """
+    Read the text, geo and sentiment files for one hour. The text column is only read when keyword filtering needs
+    it, and the id columns are cast to int64 so the frames can be joined on a sorted message_id.
+    """
+    hour_name = "{}_{}_{}_{}".format(date.year, date.month, str(date.day).zfill(2), str(hour).zfill(2))
+
+    text_cols = ["message_id", "user_id", "tweet_lang"]
+    if len(args.keywords) > 0:
+        text_cols.append("text")
+    text_df = read_in(
+        file = "{}.csv.gz".format(hour_name),
+        path = os.path.join(args.text_path, path_ext),
+        cols = text_cols,
+        dtype = ID_DTYPES
+    )
 
-                text_df = read_in(
-                    file = "{}_{}_{}_{}.csv.gz".format(date.year, date.month, str(date.day).zfill(2), str(i).zfill(2)),
-                    path = args.text_path,
-                    cols = ["message_id", "user_id", "tweet_lang", "text"]
-                )
+    geo_df = pd.read_csv(os.path.join(args.geo_path, path_ext, 'geography_{}.csv.gz'.format(hour_name)),
+                         sep='\t', usecols = ['message_id', 'ID_0', 'ISO', 'ID_1', 'ID_2'], dtype = ID_DTYPES)
+    geo_df.columns = [elem.lower() for elem in list(geo_df)]
+
+    # The sentiment scores can also be parquet or feather files in year=/month= partitions, see utils/score_io.py
+    sent_df = read_scores(find_score_file(args.sent_path, date.year, date.month, '{}_sentiment_{}'.format(
+        args.sentiment_method, hour_name
+    ), year_folder=path_ext), sep='\t')
+
+    text_df = drop_missing_ids(text_df, ['message_id', 'user_id'], hour_name)
+    geo_df = drop_missing_ids(geo_df, ['message_id'], 'geography_' + hour_name)
+    sent_df = drop_missing_ids(sent_df, ['message_id'], 'sentiment_' + hour_name)
+
+    return text_df, geo_df, sent_df
+
+def drop_missing_ids(df, cols, name):
+    """
+    Drop the rows without an id (e.g. a truncated last line) and cast the id columns to int64
+    """
+    missing = df[cols].isnull().any(axis=1).to_numpy()
+    if missing.any():
+        print("Dropped {} rows without {} from {}".format(missing.sum(), " or ".join(cols), name))
+        df = df[~missing].copy()
+    for col in cols:
+        df[col] = df[col].astype(np.int64)
+    return df
 
-                geo_df = pd.read_csv(os.path.join(args.geo_path, 'geography_{}_{}_{}_{}.csv.gz'.format(
-                    date.year, date.month, str(date.day).zfill(2), str(i).zfill(2)
-                )), sep='\t', usecols = ['message_id', 'ID_0', 'ISO', 'ID_1', 'ID_2'])
-                geo_df.columns = [elem.lower() for elem in list(geo_df)]
+def join_on_message_id(frames):
+    """
+    Inner-join frames on message_id. The hourly files are written in message_id order, so sorting is normally just
+    a monotonicity check and the join runs as a merge of sorted indexes instead of building hash tables.
+    """
+    df = None
+    for frame in frames:
+        frame = frame.set_index('message_id')
+        if not frame.index.is_monotonic_increasing:
+            frame = frame.sort_index(kind='stable')
+        df = frame if df is None else df.join(frame, how='inner', lsuffix='_x', rsuffix='_y')
+    return df.reset_index()
 
-                sent_df = pd.read_csv(os.path.join(args.sent_path, '{}_sentiment_{}_{}_{}_{}.csv.gz'.format(
-                    args.sentiment_method, date.year, date.month, str(date.day).zfill(2), str(i).zfill(2)
-                )), sep='\t')
+def get_daily_data(date, args):
 
-            except: # Account for folder structure with years
+    metrics = get_metrics(args)
+    hour_dfs = []
 
-                text_df = read_in(
-                    file = "{}_{}_{}_{}.csv.gz".format(date.year, date.month, str(date.day).zfill(2), str(i).zfill(2)),
-                    path = os.path.join(args.text_path, date.year),
-                    cols = ["message_id", "user_id", "tweet_lang", "text"]
-                )
+    for i in range(24):
 
-                geo_df = pd.read_csv(os.path.join(args.geo_path, date.year, 'geography_{}_{}_{}_{}.csv.gz'.format(
-                    date.year, date.month, str(date.day).zfill(2), str(i).zfill(2)
-                )), sep='\t', usecols = ['message_id', 'ID_0', 'ISO', 'ID_1', 'ID_2'])
-                geo_df.columns = [elem.lower() for elem in list(geo_df)]
+        try:
 
-                sent_df = pd.read_csv(os.path.join(args.sent_path, date.year, '{}_sentiment_{}_{}_{}_{}.csv.gz'.format(
-                    args.sentiment_method, date.year, date.month, str(date.day).zfill(2), str(i).zfill(2)
-                )), sep='\t')
+            with metrics.stage("read"):
+                try:
+                    text_df, geo_df, sent_df = read_hour(date, i, args)
+                except FileNotFoundError: # Account for folder structure with years
+                    text_df, geo_df, sent_df = read_hour(date, i, args, path_ext=str(date.year))
+            metrics.count("rows_in", len(text_df))
 
-            sent_df = sent_df[sent_df['score'].notnull()].reset_index(drop=True)
+            sent_df = sent_df[sent_df['score'].notnull()]
 
             if len(args.countries)>0:
-                geo_df = geo_df[geo_df['iso'].isin([elem.upper() for elem in args.countries])].reset_index(drop=True)
+                geo_df = geo_df[geo_df['iso'].isin([elem.upper() for elem in args.countries])]
 
             if args.subset_usernames_file != '':
-                geo_df = geo_df[geo_df['user_id'].isin(args.usernames)].reset_index(drop=True)
+                text_df = text_df[text_df['user_id'].astype(str).isin(args.usernames)]
 
-            df = pd.merge(text_df, geo_df, how='inner', on='message_id')
-            df = pd.merge(df, sent_df, how='inner', on='message_id')
+            with metrics.stage("merge"):
+                df = join_on_message_id([text_df, geo_df, sent_df])
             del text_df, geo_df, sent_df
 
-            if len(args.keywords) > 0 or args.lang_level:
+            with metrics.stage("filter"):
                 if len(args.incl_keywords)>0:
                     df = df[df['text'].notnull()].reset_index(drop=True)
-                    regex = '|'.join(args.incl_keywords)
-                    df['keep'] = [bool(re.search(regex, elem)) for elem in df['text'].values]
-                    df = df[df['keep']==True].reset_index(drop=True)
-                    del df['keep']
+                    df = df[args.incl_filter.match(df['text'].values)].reset_index(drop=True)
                 if len(args.excl_keywords)>0:
                     df = df[df['text'].notnull()].reset_index(drop=True)
-                    regex = '|'.join(args.excl_keywords)
-                    df['drop'] = [bool(re.search(regex, elem)) for elem in df['text'].values]
-                    df = df[df['drop']==False].reset_index(drop=True)
-                    del df['drop']
-            del df['text']
+                    df = df[~args.excl_filter.match(df['text'].values)].reset_index(drop=True)
+                if 'text' in df:
+                    del df['text']
 
 
-        except:
-            print("\nNo data for {}_{}_{}_{}".format(date.year, date.month, str(date.day).zfill(2), str(i).zfill(2)))
+        except (OSError, ValueError) as e: # Missing, empty or unreadable files of the hour
+            print("\nNo data for {}_{}_{}_{}: {}".format(date.year, date.month, str(date.day).zfill(2), str(i).zfill(2), e))
+            metrics.count("missing_hours")
             df = pd.DataFrame({
-                'message_id': pd.Series([], dtype='str'),
+                'message_id': pd.Series([], dtype='int64'),
                 'lang': pd.Series([], dtype='str'),
-                'user_id': pd.Series([], dtype='str'),
+                'user_id': pd.Series([], dtype='int64'),
                 'objectid': pd.Series([], dtype='int'),
                 'id_0': pd.Series([], dtype='int'),
                 'iso': pd.Series([], dtype='str'),
@@ -170,7 +217,10 @@ def get_daily_data(date, args):
 
         df = df[['message_id', 'lang', 'user_id', 'score']+args.geo_vars+args.time_vars]
 
-        df_day = pd.concat([df_day, df]).reset_index(drop=True)
+        hour_dfs.append(df)
+        metrics.count("rows_out", len(df))
+
+    df_day = pd.concat(hour_dfs).reset_index(drop=True)
 
     return df_day
 
@@ -242,17 +292,23 @@ def run_aggregation(args):
     ind_df = pd.DataFrame()
     dates = get_dates(args)
     for date in dates:
-        temp = get_daily_data(date, args)
-        temp = temp.groupby(['user_id']+args.time_vars+args.geo_vars+args.other_gb_vars)
-        temp = pd.DataFrame({
-            'count': temp['message_id'].count(),
-            'score': temp['score'].mean(),
-        }).reset_index()
-
-        ind_df = weighted_groupby(pd.concat([ind_df, temp], axis=0), args)
-
-        if last_day(date, args) or date==dates[-1]:
-            ind_df = aggregate_sentiment(ind_df, args)
-            df = pd.concat([df, ind_df], axis=0)
-            save_df(df, args)
-            ind_df = pd.DataFrame()
+        with args.metrics.file(str(date)):
+            temp = get_daily_data(date, args)
+            with args.metrics.stage("aggregate"):
+                temp = temp.groupby(['user_id']+args.time_vars+args.geo_vars+args.other_gb_vars)
+                temp = pd.DataFrame({
+                    'count': temp['message_id'].count(),
+                    'score': temp['score'].mean(),
+                }).reset_index()
+
+                ind_df = weighted_groupby(pd.concat([ind_df, temp], axis=0), args)
+
+            if last_day(date, args) or date==dates[-1]:
+                with args.metrics.stage("aggregate"):
+                    ind_df = aggregate_sentiment(ind_df, args)
+                    df = pd.concat([df, ind_df], axis=0)
+                with args.metrics.stage("write"):
+                    save_df(df, args)
+                ind_df = pd.DataFrame()
+
+    args.metrics.summary()
@@ -3,11 +3,11 @@ import os
 import re
 import html
 
-def read_in(file, path, cols):
+def read_in(file, path, cols, dtype=None):
 
     df = pd.read_csv(
         os.path.join(path, file), sep='\t', low_memory=False, lineterminator='\n',
-        usecols=cols
+        usecols=cols, dtype=dtype
     )
     if "tweet_lang" in list(df):
         df.rename(columns={'tweet_lang':'lang'}, inplace=True)
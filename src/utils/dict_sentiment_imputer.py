@@ -11,6 +11,8 @@ import operator
 import re
 import emoji
 
+from utils.metrics import get_metrics
+
 def read_dic(filepath):
     '''
     Reads a LIWC lexicon from a file in the .dic format, returning a tuple of
@@ -236,10 +238,20 @@ def by_chunk(df_split, imputation_method, sentiment_dict, args):
 
 def parallel_imputation(file, args, imputation_method):
 
-    sentiment_dict = file_to_dict(imputation_method)
+    metrics = get_metrics(args)
+    with metrics.file("text_{}.tsv.gz:{}".format(args.date, imputation_method)):
+        return parallel_imputation_file(args, imputation_method, metrics)
+
+def parallel_imputation_file(args, imputation_method, metrics):
+
+    with metrics.stage("load_dict"):
+        sentiment_dict = file_to_dict(imputation_method)
 
     results_dict = {}
-    data_obs = sum(1 for line in open(os.path.join(args.data_path, 'text_{}.tsv.gz'.format(args.date)), encoding="utf8", errors='ignore'))-1
+    file_path = os.path.join(args.data_path, 'text_{}.tsv.gz'.format(args.date))
+    with metrics.stage("count_rows"):
+        data_obs = sum(1 for line in open(file_path, encoding="utf8", errors='ignore'))-1
+    metrics.count("bytes_compressed", os.path.getsize(file_path))
     nb_iters = int(np.ceil(data_obs/args.max_rows))
 
     start = time.time()
@@ -247,24 +259,29 @@ def parallel_imputation(file, args, imputation_method):
 
         print("Reading in data from {} (iteration {} of {})...".format(args.date, i+1, nb_iters))
 
-        df_split = pd.read_csv(
-            os.path.join(args.data_path, 'text_{}.tsv.gz'.format(args.date)), sep='\t', low_memory=False,
-            nrows=args.max_rows, skiprows=range(1, i*args.max_rows+1), usecols=['message_id', 'lang', 'text_clean']
-        )
-        df_split = np.array_split(df_split, args.nb_cores)
-        pool = Pool(args.nb_cores)
-        results_dict[i] = pd.concat(pool.starmap(by_chunk, [[df_split_i, imputation_method, sentiment_dict, args] for df_split_i in df_split]))
-        del df_split
-        pool.close()
-        pool.join()
+        with metrics.stage("read"):
+            df_split = pd.read_csv(
+                file_path, sep='\t', low_memory=False,
+                nrows=args.max_rows, skiprows=range(1, i*args.max_rows+1), usecols=['message_id', 'lang', 'text_clean']
+            )
+        metrics.count("rows_in", len(df_split))
+        with metrics.stage("impute"):
+            df_split = np.array_split(df_split, args.nb_cores)
+            pool = Pool(args.nb_cores)
+            results_dict[i] = pd.concat(pool.starmap(by_chunk, [[df_split_i, imputation_method, sentiment_dict, args] for df_split_i in df_split]))
+            del df_split
+            pool.close()
+            pool.join()
     print ("Imputation took {} seconds to process".format(round(time.time()-start, 2)))
 
-    df = pd.DataFrame()
-    for i in range(nb_iters):
-        df = pd.concat([df, results_dict[i]])
-        del results_dict[i]
-    del results_dict
+    with metrics.stage("merge"):
+        df = pd.DataFrame()
+        for i in range(nb_iters):
+            df = pd.concat([df, results_dict[i]])
+            del results_dict[i]
+        del results_dict
 
-    df = df[df['score'].notnull()]
+        df = df[df['score'].notnull()]
+    metrics.count("rows_out", len(df))
 
     return df
@@ -10,11 +10,12 @@ from nltk.corpus import stopwords
 from nltk import SnowballStemmer
 import sys
 from sklearn.model_selection import train_test_split
-from sklearn.decomposition import PCA
+from sklearn.decomposition import PCA, IncrementalPCA
 from sklearn.preprocessing import StandardScaler
-from sklearn.linear_model import LogisticRegression
+from sklearn.linear_model import LogisticRegression, SGDClassifier
 from sklearn.pipeline import Pipeline
 import json
+import argparse
 
 def split_train_test(df, args):
 
@@ -49,12 +50,100 @@ def train_model(train_df, train_embeddings, args):
 
     return clf
 
+def chunk_bounds(n_rows, chunk_size, min_rows):
+    """
+    Start and end of the chunks of n_rows; a last chunk smaller than min_rows is added to the one before it
+    """
+    bounds = [[start, min(start + chunk_size, n_rows)] for start in range(0, n_rows, chunk_size)]
+    if len(bounds) > 1 and bounds[-1][1] - bounds[-1][0] < min_rows:
+        bounds[-2][1] = bounds.pop()[1]
+    return bounds
+
+def train_model_streaming(store, train_ids, labels, args):
+    """
+    Out-of-core version of train_model: reads the embeddings in chunks of args.chunk_size from the embedding store,
+    fits IncrementalPCA in one pass and then a logistic regression by SGD (partial_fit) over args.epochs passes with
+    shuffled chunks. Memory use depends on the chunk size, not on the size of the training set
+    Params
+        store: EmbeddingStore with the embeddings of all labeled tweets
+        train_ids: row indices of the training set
+        labels: array with the labels of all labeled tweets
+        args: arguments from ArgParser, with pca_dims, chunk_size, epochs, reg, reg_norm and random_seed
+    Returns
+        clf: Pipeline of the fitted IncrementalPCA and SGDClassifier, used like the model of train_model
+    """
+    train_ids = np.asarray(train_ids)
+    bounds = chunk_bounds(len(train_ids), args.chunk_size, args.pca_dims)
+
+    print("Fitting IncrementalPCA on {} chunks".format(len(bounds)))
+    pca = IncrementalPCA(n_components=args.pca_dims)
+    for start, end in bounds:
+        pca.partial_fit(store.take(train_ids[start:end]))
+
+    # alpha of SGDClassifier is the regularization strength per sample, C of LogisticRegression the inverse of the
+    # total strength. Averaging the SGD weights makes the result close to the exact solution in a few epochs
+    logreg = SGDClassifier(loss='log_loss', penalty=args.reg_norm, alpha=1 / (args.reg * len(train_ids)),
+                           average=True, random_state=args.random_seed)
+    rng = np.random.default_rng(args.random_seed)
+    classes = np.unique(labels)
+    for epoch in range(args.epochs):
+        correct = 0
+        for chunk in rng.permutation(len(bounds)):
+            start, end = bounds[chunk]
+            order = rng.permutation(end - start)
+            ids = train_ids[start:end][order]
+            X, y = pca.transform(store.take(ids)), labels[ids]
+            if epoch > 0:
+                correct += np.sum(logreg.predict(X) == y)
+            logreg.partial_fit(X, y, classes=classes)
+        if epoch > 0:
+            print('Epoch {}: training set accuracy before the epoch: {}'.format(epoch + 1, correct / len(train_ids)))
+
+    return Pipeline([('pca', pca), ('logreg', logreg)])
+
+def predict_streaming(clf, store, ids, chunk_size):
+    """
+    Predictions of clf for the rows ids of the embedding store, computed in chunks
+    """
+    ids = np.asarray(ids)
+    return np.concatenate([clf.predict(store.take(ids[start:start + chunk_size]))
+                           for start in range(0, len(ids), chunk_size)])
+
+def check_parity(store, train_ids, test_ids, labels, args):
+    """
+    Train the in-memory model (train_model) and the streaming model (train_model_streaming) on the same random
+    subsample of args.parity_sample training tweets and print their accuracy on a test subsample of the same size
+    """
+    rng = np.random.default_rng(args.random_seed)
+    sample_train = rng.choice(train_ids, min(args.parity_sample, len(train_ids)), replace=False)
+    sample_test = rng.choice(test_ids, min(args.parity_sample, len(test_ids)), replace=False)
+    train_df = pd.DataFrame({'label': labels[sample_train]})
+    test_embeddings = store.take(sample_test)
+
+    print("Parity check on {} training and {} test tweets".format(len(sample_train), len(sample_test)))
+    clf_memory = train_model(train_df, store.take(sample_train), args)
+    acc_memory = np.mean(clf_memory.predict(test_embeddings) == labels[sample_test])
+    # Chunks of a tenth of the sample, so the streaming path really runs over several chunks
+    stream_args = argparse.Namespace(**vars(args))
+    stream_args.chunk_size = max(args.pca_dims, len(sample_train) // 10)
+    clf_stream = train_model_streaming(store, sample_train, labels, stream_args)
+    acc_stream = np.mean(clf_stream.predict(test_embeddings) == labels[sample_test])
+
+    print('Parity: in-memory accuracy {:.4f}, streaming accuracy {:.4f}, difference {:+.4f}'.format(
+        acc_memory, acc_stream, acc_stream - acc_memory))
+    return acc_memory, acc_stream
+
 def test_model(clf, test_df, test_embeddings):
 
     print("Testing model...")
 
     test_pred = clf.predict(test_embeddings)
+    print_scores(test_pred, test_df)
 
+def print_scores(test_pred, test_df):
+    """
+    Print accuracy, precision and recall of the predictions test_pred against test_df['label']
+    """
     correct = test_pred==test_df['label']
     wrong = test_pred!=test_df['label']
     tp = sum(correct & test_df['label'])
@@ -1,6 +1,9 @@
 import pandas as pd
 import numpy as np
-import torch
+try:
+    import torch
+except ImportError: # Only needed to free the GPU memory, not for the stand-in models of the benchmarks
+    torch = None
 from tqdm.auto import tqdm
 import os
 import json
@@ -8,9 +11,10 @@ import gzip
 
 from utils.data_read_in import read_in, clean_for_content
 
-def create_embeddings(emb_model, df, args):
-    emb = emb_model.encode(df['text'].values, show_progress_bar=True, batch_size=args.batch_size)
-    torch.cuda.empty_cache()
+def create_embeddings(emb_model, df, args, show_progress_bar=True):
+    emb = emb_model.encode(df['text'].values, show_progress_bar=show_progress_bar, batch_size=args.batch_size)
+    if torch is not None:
+        torch.cuda.empty_cache()
     return emb
 
 
@@ -0,0 +1,168 @@
+"""
+On-disk store for the embeddings of the labeled training tweets, so setup_emb_clf.py encodes them once and every
+training run reads them back. A store is a folder per embedding model, max_seq_length and dtype:
+    <root>/<model>_seq<max_seq_length>_<dtype>/shard_00000.npy, shard_00001.npy, ..., progress.json
+Texts are encoded in shards of shard_size rows that are written as .npy files and recorded in progress.json when they
+are complete, so an interrupted run continues with the first missing shard. Every shard also records a checksum of its
+texts, so a shard is encoded again if the cleaned training data changed. The shards are opened as memory maps, and
+take() reads the rows of a set of train or test ID's without loading the whole matrix.
+"""
+
+import os
+import re
+import json
+import zlib
+import numpy as np
+from tqdm.auto import tqdm
+
+PROGRESS_FILE = "progress.json"
+DEFAULT_SHARD_SIZE = 50000
+
+def texts_checksum(texts):
+    checksum = 0
+    for text in texts:
+        checksum = zlib.crc32(str(text).encode("utf-8"), checksum)
+    return checksum
+
+class EmbeddingStore:
+    """
+    EmbeddingStore class to encode texts in resumable, memory-mapped shards and read rows back by index
+    Params
+        root: folder that holds the stores of all models
+        model_name: name of the embedding model, part of the store key
+        max_seq_length: maximum sequence length of the embedding model, part of the store key
+        dtype: float16 (half the disk space and memory) or float32 - default float16
+        shard_size: rows per shard; an existing store keeps the shard size it was written with, and a different
+                    shard_size raises a ValueError - default None (the stored shard size, or 50000 for a new store)
+    """
+
+    def __init__(self, root, model_name, max_seq_length, dtype="float16", shard_size=None):
+        if dtype not in ["float16", "float32"]:
+            raise ValueError("Unknown embedding dtype {}, choose float16 or float32".format(dtype))
+        self.model_name = model_name
+        self.max_seq_length = max_seq_length
+        self.dtype = np.dtype(dtype)
+        key = "{}_seq{}_{}".format(re.sub(r"[^\w.-]", "_", model_name), max_seq_length, dtype)
+        self.path = os.path.join(root, key)
+        os.makedirs(self.path, exist_ok=True)
+
+        self.progress = {"model": model_name, "max_seq_length": max_seq_length, "dtype": dtype,
+                         "shard_size": shard_size or DEFAULT_SHARD_SIZE, "n_rows": None, "dim": None, "shards": {}}
+        progress_path = os.path.join(self.path, PROGRESS_FILE)
+        if os.path.exists(progress_path):
+            with open(progress_path) as f:
+                self.progress = json.load(f)
+            # The shards on disk are cut at the stored shard size, so another size can not be used to read or resume
+            if shard_size is not None and shard_size != self.progress["shard_size"]:
+                raise ValueError("Embedding store {} has shard size {}, not {}: leave out the shard size or remove the "
+                                 "store to encode it again".format(self.path, self.progress["shard_size"], shard_size))
+        self.shards = {} # Shard index -> memory map
+
+    @property
+    def shard_size(self):
+        return self.progress["shard_size"]
+
+    def __len__(self):
+        return self.progress["n_rows"] or 0
+
+    @property
+    def shape(self):
+        return (len(self), self.progress["dim"])
+
+    def shard_path(self, shard):
+        return os.path.join(self.path, "shard_{}.npy".format(str(shard).zfill(5)))
+
+    def save_progress(self):
+        # Write to a temporary file first, so an interrupted run never leaves a half-written progress file
+        tmp_path = os.path.join(self.path, PROGRESS_FILE + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.progress, f, indent=1)
+        os.replace(tmp_path, os.path.join(self.path, PROGRESS_FILE))
+
+    def is_complete(self):
+        n_shards = -(-len(self) // self.shard_size)
+        return self.progress["n_rows"] is not None and len(self.progress["shards"]) == n_shards
+
+    def encode(self, texts, emb_model, batch_size=100):
+        """
+        Encode the texts with emb_model, skipping the shards that are already done for the same texts
+        Params
+            texts: array of the cleaned texts, in the row order of the training data
+            emb_model: embedding model with an encode() method, like SentenceTransformer
+            batch_size: batch size of the embedding model - default 100
+        Returns
+            self
+        """
+        n_rows = len(texts)
+        if self.progress["n_rows"] != n_rows:
+            if self.progress["n_rows"] is not None:
+                print("Training data changed from {} to {} rows, encoding all shards again".format(
+                    self.progress["n_rows"], n_rows))
+            self.progress["n_rows"] = n_rows
+            self.progress["shards"] = {}
+        self.shards = {}
+
+        starts = range(0, n_rows, self.shard_size)
+        todo = []
+        for shard, start in enumerate(starts):
+            checksum = texts_checksum(texts[start:start + self.shard_size])
+            if self.progress["shards"].get(str(shard)) != checksum or not os.path.exists(self.shard_path(shard)):
+                todo.append((shard, start, checksum))
+        print("Embedding store {}: {} of {} shards done".format(self.path, len(starts) - len(todo), len(starts)))
+
+        for shard, start, checksum in tqdm(todo, desc="Encoding shards"):
+            shard_texts = texts[start:start + self.shard_size]
+            embeddings = emb_model.encode(list(shard_texts), show_progress_bar=False, batch_size=batch_size)
+            self.progress["dim"] = int(embeddings.shape[1])
+
+            tmp_path = self.shard_path(shard) + ".tmp.npy"
+            out = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=self.dtype, shape=embeddings.shape)
+            out[:] = embeddings
+            out.flush()
+            del out
+            os.replace(tmp_path, self.shard_path(shard))
+
+            self.progress["shards"][str(shard)] = checksum
+            self.save_progress()
+        return self
+
+    def save_labels(self, labels):
+        """
+        Save the labels of the encoded texts with the store, so the classifier can be trained from the store alone
+        """
+        np.save(os.path.join(self.path, "labels.npy"), np.asarray(labels))
+
+    def load_labels(self):
+        return np.load(os.path.join(self.path, "labels.npy"))
+
+    def shard(self, shard):
+        if shard not in self.shards:
+            self.shards[shard] = np.load(self.shard_path(shard), mmap_mode="r")
+        return self.shards[shard]
+
+    def take(self, ids, dtype=np.float32):
+        """
+        Read the rows with the given indices (like the train or test ID's) from the memory-mapped shards
+        Params
+            ids: array-like of row indices
+            dtype: dtype of the returned array - default float32
+        Returns
+            embeddings: array of shape (len(ids), dim), in the order of ids
+        """
+        if not self.is_complete():
+            raise ValueError("Embedding store {} is not complete, run encode first".format(self.path))
+        ids = np.asarray(ids, dtype=np.int64)
+        out = np.empty((len(ids), self.progress["dim"]), dtype=dtype)
+        shard_of = ids // self.shard_size
+        for shard in np.unique(shard_of):
+            rows = np.flatnonzero(shard_of == shard)
+            out[rows] = self.shard(int(shard))[ids[rows] - shard * self.shard_size]
+        return out
+
+    def iter_chunks(self, ids, chunk_size=50000, dtype=np.float32):
+        """
+        Yield (positions, embeddings) for consecutive chunks of ids, so a model can be trained out-of-core
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        for start in range(0, len(ids), chunk_size):
+            yield np.arange(start, min(start + chunk_size, len(ids))), self.take(ids[start:start + chunk_size], dtype)
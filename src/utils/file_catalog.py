@@ -0,0 +1,250 @@
+"""
+File catalog shared by the entry points. The data folders hold tens of thousands of hour-files with different naming
+schemes, for example:
+    worldgeo raw tweets:    2021-08-01_00_00_01.txt.gz
+    onepercent raw tweets:  2021_08_01_00_onepercent.txt.gz
+    sentiment scores:       sentiment_2021-08-01_00_00_01.csv
+    affected tweets:        aff_2021_08_01_00_onepercent.csv
+    aggregation inputs:     2021_8_01_00.csv.gz
+    monthly files:          2013-08.txt.gz (day and hour 0)
+The catalog lists a data root once (and optionally its sub-folders) and parses every file name into (stream, year,
+month, day, hour). Files without a date are kept apart in undated; sidecar indexes of the raw files (.idx.npz, see
+project_ida/gzip_index.py) are not listed. The listing can be cached in a folder; the cache is invalidated when the
+modification time of any listed folder changes.
+"""
+
+import os
+import re
+import json
+import hashlib
+from collections import namedtuple
+
+DATE_REGEX = re.compile(r"(?P<year>\d{4})[-_](?P<month>\d{1,2})[-_](?P<day>\d{1,2})_(?P<hour>\d{1,2})(?!\d)")
+MONTH_REGEX = re.compile(r"(?P<year>\d{4})[-_](?P<month>\d{1,2})(?!\d)")
+
+SIDECAR_EXTS = (".idx.npz",)
+
+CatalogEntry = namedtuple("CatalogEntry", ["stream", "year", "month", "day", "hour", "date_name", "name", "path"])
+
+def parse_file_name(name, path=None):
+    """
+    Parse a file name into a CatalogEntry, or None if the name has no date. Monthly files (a year and month, but no
+    day and hour) get day and hour 0.
+    The stream is the name without the date, the minute/second fields and the extension, e.g. "sentiment" or
+    "onepercent" (empty for worldgeo raw files). The date name is the name from the date up to the extension, like
+    the date names used for the output files.
+    """
+    match = DATE_REGEX.search(name)
+    if match is None:
+        match = MONTH_REGEX.search(name)
+        if match is None:
+            return None
+    day = int(match.groupdict().get("day") or 0)
+    hour = int(match.groupdict().get("hour") or 0)
+
+    stem_end = name.index(".", match.end()) if "." in name[match.end():] else len(name)
+    date_name = name[match.start():stem_end]
+    prefix = name[:match.start()].strip("_-")
+    suffix = [part for part in name[match.end():stem_end].split("_") if part != "" and not part.isdigit()]
+    stream = "_".join([part for part in [prefix] if part != ""] + suffix)
+
+    return CatalogEntry(stream, int(match.group("year")), int(match.group("month")), day, hour, date_name, name,
+                        path if path is not None else name)
+
+def select_entries(entries, year=None, months=None, start=None, end=None, stream=None, ext=None):
+    """
+    Select the entries in a date range and/or of a stream
+    Params
+        year: year (int or str) - default None (all years)
+        months: list of months; all months from the lowest to the highest are included - default None (all)
+        start, end: (year, month, day, hour) tuples, inclusive bounds - default None
+        stream: only files of this stream - default None (all streams)
+        ext: only files whose name ends with ext, e.g. ".ids.npy" - default None
+    Returns
+        entries: list of the selected CatalogEntry objects, in the original order
+    """
+    if months is not None and len(months) > 0:
+        months = [int(month) for month in months]
+        low, high = min(months), max(months)
+    else:
+        low, high = 1, 12
+
+    selected = []
+    for entry in entries:
+        key = (entry.year, entry.month, entry.day, entry.hour)
+        if year is not None and entry.year != int(year):
+            continue
+        if not low <= entry.month <= high:
+            continue
+        if (start is not None and key < tuple(start)) or (end is not None and key > tuple(end)):
+            continue
+        if stream is not None and entry.stream != stream:
+            continue
+        if ext is not None and not entry.name.endswith(ext):
+            continue
+        selected.append(entry)
+    return selected
+
+def filter_names(names, **filters):
+    """
+    Filter a list of file names (see select_entries for the filters), keeping their order. Names without a date can not
+    be filtered; they are left out, and listed so they are not skipped unnoticed
+    """
+    entries = [parse_file_name(name) for name in names]
+    undated = [name for name, entry in zip(names, entries) if entry is None]
+    if len(undated) > 0:
+        print("{} files without a date are left out: {}".format(len(undated), ", ".join(undated)))
+    return [entry.name for entry in select_entries([e for e in entries if e is not None], **filters)]
+
+class FileCatalog:
+    """
+    FileCatalog class to list and query the hour-files under a data root
+    Params
+        root: folder to list
+        cache_dir: folder for the cached listing - default None (no cache)
+        recursive: bool to also list the sub-folders, e.g. year=/month= partitions - default False
+    """
+
+    def __init__(self, root, cache_dir=None, recursive=False):
+        self.root = os.path.abspath(root)
+        self.recursive = recursive
+        self.cache_path = None
+        if cache_dir is not None:
+            key = "{}{}".format(self.root, os.sep + "**" if recursive else "")
+            root_hash = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+            self.cache_path = os.path.join(cache_dir, "catalog_{}.json".format(root_hash))
+
+        cache = self.load_cache()
+        if cache is None:
+            self.entries, self.undated = self.scan()
+        else:
+            self.entries, self.undated = cache
+        if len(self.undated) > 0:
+            print("{} files in {} have no date and are not in the catalog: {}".format(
+                len(self.undated), self.root, ", ".join(self.undated[:10]) + (", ..." if len(self.undated) > 10 else "")))
+
+    def list_folders(self):
+        """
+        Yields (folder, file names) for the root, and for its sub-folders if recursive
+        """
+        if not self.recursive:
+            if os.path.isdir(self.root):
+                yield self.root, [f for f in os.listdir(self.root) if os.path.isfile(os.path.join(self.root, f))]
+            return
+        for dir_path, dir_names, file_names in os.walk(self.root):
+            dir_names.sort()
+            yield dir_path, file_names
+
+    def scan(self):
+        """
+        List the folders once and parse every file name
+        Returns
+            entries: list of CatalogEntry objects, sorted by date
+            undated: sorted list of the paths (relative to the root) of the files without a date
+        """
+        entries, undated, mtimes = [], [], {}
+        for dir_path, file_names in self.list_folders():
+            mtimes[dir_path] = os.stat(dir_path).st_mtime
+            for name in file_names:
+                if name.endswith(SIDECAR_EXTS):
+                    continue
+                rel_path = os.path.relpath(os.path.join(dir_path, name), self.root)
+                entry = parse_file_name(name, rel_path)
+                if entry is None:
+                    undated.append(rel_path)
+                else:
+                    entries.append(entry)
+
+        entries.sort(key=lambda e: (e.year, e.month, e.day, e.hour, e.path))
+        undated.sort()
+        self.save_cache(entries, undated, mtimes)
+        return entries, undated
+
+    def load_cache(self):
+        """
+        Returns the cached (entries, undated), or None if there is no cache or one of the listed folders has changed
+        """
+        if self.cache_path is None or not os.path.exists(self.cache_path):
+            return None
+        try:
+            with open(self.cache_path, "r") as f:
+                cache = json.load(f)
+            for dir_path, mtime in cache["mtimes"].items():
+                if os.stat(dir_path).st_mtime != mtime:
+                    return None
+        except (OSError, ValueError, KeyError):
+            return None
+        return [CatalogEntry(*entry) for entry in cache["entries"]], cache["undated"]
+
+    def save_cache(self, entries, undated, mtimes):
+        if self.cache_path is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            tmp_path = self.cache_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"root": self.root, "mtimes": mtimes, "entries": entries, "undated": undated}, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError:
+            print("Could not write file catalog cache to ", self.cache_path)
+
+    def files(self, **filters):
+        """
+        Range query on the catalog, see select_entries for the filters
+        Returns
+            entries: list of CatalogEntry objects, sorted by date
+        """
+        return select_entries(self.entries, **filters)
+
+    def names(self, **filters):
+        """
+        Paths of the files matching the filters (see files), relative to the root: the base names unless recursive
+        """
+        return [entry.path for entry in self.files(**filters)]
+
+    def full_path(self, entry):
+        return os.path.join(self.root, entry.path)
+
+    def by_hour(self, **filters):
+        """
+        Dictionary of (year, month, day, hour) -> list of all entries of that hour, sorted by path
+        """
+        hours = {}
+        for entry in self.files(**filters):
+            hours.setdefault((entry.year, entry.month, entry.day, entry.hour), []).append(entry)
+        return hours
+
+    def join(self, other, filters=None, other_filters=None):
+        """
+        Exact hour-level join between two catalogs: pairs of files of the same hour, hours missing in either
+        catalog are skipped. If an hour has several files on either side (e.g. worldgeo files of the same hour with
+        other minutes), every file is paired with the file with the same date name in the other catalog
+        Params
+            other: FileCatalog of the other folder
+            filters, other_filters: dictionaries of filters (see files) for this and the other catalog
+        Returns
+            pairs: list of (entry, other_entry) tuples, sorted by date
+        Raises
+            ValueError if the files of an hour with several files can not be paired by date name
+        """
+        hours = self.by_hour(**(filters or {}))
+        other_hours = other.by_hour(**(other_filters or {}))
+        common = hours.keys() & other_hours.keys()
+        missing = len(hours) - len(common)
+        if missing > 0:
+            print("{} hour-files in {} have no match in {}".format(missing, self.root, other.root))
+
+        pairs = []
+        for key in sorted(common):
+            entries, other_entries = hours[key], other_hours[key]
+            if len(entries) == 1 and len(other_entries) == 1:
+                pairs.append((entries[0], other_entries[0]))
+                continue
+
+            other_by_name = {entry.date_name: entry for entry in other_entries}
+            for entry in entries:
+                if entry.date_name not in other_by_name or len(other_by_name) < len(other_entries):
+                    raise ValueError("Can not pair the files of hour {}: {} in {} and {} in {}".format(
+                        key, [e.path for e in entries], self.root, [e.path for e in other_entries], other.root))
+                pairs.append((entry, other_by_name[entry.date_name]))
+        return pairs
@@ -0,0 +1,172 @@
+"""
+ID filters for targeted scoring: the imputer can skip every tweet that is not from a user (or is not a tweet) of the
+affected area before cleaning and encoding. IdFilter is an exact set of int64 ID's; BloomFilter trades a small false
+positive rate for a fixed, much smaller memory footprint and can be saved and reused, e.g. built once from the
+<area>_unique_users_loc.csv output of main_affected_tweets.py:
+    python3 src/utils/id_filter.py --input data/Ida_aug-sept-21/affect_tweets/onepercent/2021/south/south_unique_users_loc.csv --output data/south_users.bloom.npz
+"""
+
+import os
+import argparse
+import numpy as np
+import pandas as pd
+
+BLOOM_EXT = ".bloom.npz"
+
+def read_ids(path, column):
+    """
+    Read a set of ID's
+    Params
+        path: .csv file (like the affected users or affected tweets output), folder of .csv files, .npy array or text
+              file with one ID per line. If the .csv files have an "inferred loc" column, only the rows with an
+              inferred location are used
+        column: column with the ID's in the .csv files, user_id or tweet_id
+    Returns
+        ids: sorted array of the unique int64 ID's
+    """
+    if os.path.isdir(path):
+        files = [os.path.join(path, f) for f in sorted(os.listdir(path)) if ".csv" in f]
+        ids = [read_ids(f, column) for f in files]
+        return np.unique(np.concatenate(ids)) if len(ids) > 0 else np.empty(0, dtype=np.int64)
+
+    if path.endswith(".npy"):
+        return np.unique(np.load(path).astype(np.int64))
+
+    if ".csv" in os.path.basename(path):
+        header = pd.read_csv(path, nrows=0).columns
+        cols = [column, "inferred loc"] if "inferred loc" in header else [column]
+        df = pd.read_csv(path, usecols=cols)
+        if "inferred loc" in cols:
+            df = df[df["inferred loc"].notna() & (df["inferred loc"] != "[]")]
+        return np.unique(df[column].to_numpy(dtype=np.int64))
+
+    return np.unique(np.loadtxt(path, dtype=np.int64, ndmin=1))
+
+class IdFilter:
+    """
+    IdFilter class for exact membership tests against a set of ID's, kept as a sorted int64 array
+    Params
+        ids: array-like of ID's
+    """
+
+    def __init__(self, ids):
+        self.ids = np.unique(np.asarray(ids, dtype=np.int64))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def contains(self, ids):
+        """
+        Returns a bool array with for every ID whether it is in the set
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(self.ids) == 0:
+            return np.zeros(len(ids), dtype=bool)
+        pos = np.searchsorted(self.ids, ids)
+        pos[pos == len(self.ids)] = 0
+        return self.ids[pos] == ids
+
+def mix64(x):
+    """
+    splitmix64 finalizer, a fast vectorized hash of uint64 values
+    """
+    x = x ^ (x >> np.uint64(30))
+    x = x * np.uint64(0xbf58476d1ce4e5b9)
+    x = x ^ (x >> np.uint64(27))
+    x = x * np.uint64(0x94d049bb133111eb)
+    return x ^ (x >> np.uint64(31))
+
+class BloomFilter:
+    """
+    BloomFilter class for approximate membership tests: no false negatives, a false positive rate of about error_rate.
+    The bits are stored in a packed uint8 array, the k bit positions of an ID come from double hashing of two
+    splitmix64 hashes.
+    Params
+        n_bits: number of bits
+        n_hashes: number of hash functions
+        bits: packed bit array (for loading a saved filter) - default None (empty filter)
+    """
+
+    def __init__(self, n_bits, n_hashes, bits=None):
+        self.n_bits = int(n_bits)
+        self.n_hashes = int(n_hashes)
+        self.bits = bits if bits is not None else np.zeros((self.n_bits + 7) // 8, dtype=np.uint8)
+
+    @classmethod
+    def from_ids(cls, ids, error_rate=0.001):
+        """
+        Build a filter sized for the given ID's and false positive rate
+        """
+        ids = np.unique(np.asarray(ids, dtype=np.int64))
+        n = max(len(ids), 1)
+        n_bits = int(np.ceil(-n * np.log(error_rate) / np.log(2) ** 2))
+        n_hashes = max(1, int(round(n_bits / n * np.log(2))))
+        bloom = cls(n_bits, n_hashes)
+        bloom.add(ids)
+        return bloom
+
+    def positions(self, ids, i):
+        ids = np.asarray(ids, dtype=np.int64).view(np.uint64)
+        h1 = mix64(ids)
+        h2 = mix64(ids ^ np.uint64(0x9e3779b97f4a7c15)) | np.uint64(1)
+        return (h1 + np.uint64(i) * h2) % np.uint64(self.n_bits)
+
+    def add(self, ids, chunk_size=1000000):
+        ids = np.asarray(ids, dtype=np.int64)
+        for start in range(0, len(ids), chunk_size):
+            chunk = ids[start:start + chunk_size]
+            for i in range(self.n_hashes):
+                pos = self.positions(chunk, i)
+                np.bitwise_or.at(self.bits, pos >> np.uint64(3), np.left_shift(1, pos & np.uint64(7)).astype(np.uint8))
+
+    def contains(self, ids):
+        """
+        Returns a bool array with for every ID whether it is (probably) in the set
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        found = np.ones(len(ids), dtype=bool)
+        for i in range(self.n_hashes):
+            pos = self.positions(ids, i)
+            found &= ((self.bits[pos >> np.uint64(3)] >> (pos & np.uint64(7)).astype(np.uint8)) & 1).astype(bool)
+        return found
+
+    def save(self, path):
+        np.savez(path, bits=self.bits, n_bits=self.n_bits, n_hashes=self.n_hashes)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        return cls(int(data["n_bits"]), int(data["n_hashes"]), data["bits"])
+
+def load_id_filter(path, column, bloom=False, error_rate=0.001):
+    """
+    Load the filter for a set of ID's, see read_ids for the input files
+    Params
+        path: input file or folder; a saved Bloom filter (.bloom.npz) is loaded as is
+        column: column with the ID's in .csv files, user_id or tweet_id
+        bloom: bool to build a Bloom filter instead of an exact set - default False
+        error_rate: false positive rate of the Bloom filter - default 0.001
+    """
+    if path.endswith(BLOOM_EXT):
+        id_filter = BloomFilter.load(path)
+        print("Loaded Bloom filter from {}: {} bits, {} hashes".format(path, id_filter.n_bits, id_filter.n_hashes))
+        return id_filter
+
+    ids = read_ids(path, column)
+    print("Read {} target {}'s from {}".format(len(ids), column, path))
+    if bloom:
+        return BloomFilter.from_ids(ids, error_rate)
+    return IdFilter(ids)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", default="", type=str, help="File or folder with the ID's, see read_ids")
+    parser.add_argument("--output", default="", type=str, help="Path of the Bloom filter (ends with .bloom.npz)")
+    parser.add_argument("--column", default="user_id", type=str, help="Column with the ID's (user_id, tweet_id)")
+    parser.add_argument("--error_rate", default=0.001, type=float, help="False positive rate of the Bloom filter")
+    args = parser.parse_args()
+
+    bloom = BloomFilter.from_ids(read_ids(args.input, args.column), args.error_rate)
+    bloom.save(args.output)
+    print("Bloom filter with {} bits and {} hashes written to {}".format(bloom.n_bits, bloom.n_hashes, args.output))
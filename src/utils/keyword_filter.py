@@ -0,0 +1,118 @@
+import re
+import numpy as np
+
+# Characters that give a keyword regex meaning. Keywords without any of these are plain literals and can go
+# into the Aho-Corasick automaton instead of the regex engine. Also used for the city names in location_matcher.py
+REGEX_META = set(".^$*+?{}[]\\|()")
+
+# Non-ASCII characters that re.IGNORECASE matches against an ASCII letter. "İ" is also the only character that
+# str.lower() turns into two characters, so folding keeps the text as long as the original and match offsets valid
+CASE_FOLD = str.maketrans({"İ": "i", "ı": "i", "ſ": "s"})
+
+
+def fold(text):
+    return text.translate(CASE_FOLD).lower()
+
+
+def is_literal(keyword):
+    return not any(char in REGEX_META for char in keyword)
+
+
+def is_word_char(char):
+    return char.isalnum() or char == "_"
+
+
+class KeywordFilter:
+    """
+    KeywordFilter class to match a whole column of texts against a set of keywords in one call.
+    The keyword set is compiled once: literal keywords go into an Aho-Corasick automaton (if pyahocorasick is
+    installed), everything else into a single compiled regex.
+    Params
+        keywords: list of keywords (literal strings or regular expressions)
+        ignore_case: bool, match case-insensitively - default False
+        whole_words: bool, only match keywords at word boundaries - default False
+    """
+
+    def __init__(self, keywords, ignore_case=False, whole_words=False):
+        self.keywords = list(keywords)
+        self.ignore_case = ignore_case
+        self.whole_words = whole_words
+
+        literals = [kw for kw in self.keywords if is_literal(kw)]
+        patterns = [kw for kw in self.keywords if not is_literal(kw)]
+
+        self.automaton = self.build_automaton(literals)
+        if self.automaton is None:
+            # No automaton available: literals are escaped and matched by the regex as well
+            patterns += [re.escape(kw) for kw in literals]
+        self.regex = self.build_regex(patterns)
+
+    def build_automaton(self, literals):
+        """
+        Build an Aho-Corasick automaton over the literal keywords. Returns None when there are no literals or
+        pyahocorasick is not installed.
+        """
+        if len(literals) == 0:
+            return None
+        try:
+            import ahocorasick
+        except ImportError:
+            return None
+
+        automaton = ahocorasick.Automaton()
+        for kw in literals:
+            key = fold(kw) if self.ignore_case else kw
+            if key != "":
+                automaton.add_word(key, len(key))
+        automaton.make_automaton()
+        return automaton
+
+    def build_regex(self, patterns):
+        """
+        Compile all keyword patterns into one alternation
+        """
+        if len(patterns) == 0:
+            return None
+        regex = "|".join("(?:{})".format(p) for p in patterns)
+        if self.whole_words:
+            regex = r"\b(?:{})\b".format(regex)
+        return re.compile(regex, re.IGNORECASE if self.ignore_case else 0)
+
+    def search_automaton(self, text):
+        if self.ignore_case:
+            text = fold(text)
+        for end, length in self.automaton.iter(text):
+            if not self.whole_words:
+                return True
+            start = end - length + 1
+            if (start == 0 or not is_word_char(text[start - 1])) and \
+                    (end == len(text) - 1 or not is_word_char(text[end + 1])):
+                return True
+        return False
+
+    def search(self, text):
+        """
+        Match a single text. Returns True if any of the keywords is found
+        """
+        if self.automaton is not None and self.search_automaton(text):
+            return True
+        return self.regex is not None and self.regex.search(text) is not None
+
+    def match(self, texts):
+        """
+        Match a whole column of texts in one batch call.
+        Params
+            texts: iterable of strings (e.g. a pandas Series or numpy array)
+        Returns
+            mask: boolean numpy array, True where any of the keywords is found
+        """
+        texts = np.asarray(texts, dtype=object)
+        mask = np.zeros(len(texts), dtype=bool)
+        if self.automaton is not None:
+            search = self.search_automaton
+            mask |= np.fromiter((search(text) for text in texts), dtype=bool, count=len(texts))
+        if self.regex is not None:
+            todo = np.flatnonzero(~mask)
+            search = self.regex.search
+            mask[todo] = np.fromiter((search(text) is not None for text in texts[todo]), dtype=bool, count=len(todo))
+        return mask
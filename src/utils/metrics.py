@@ -0,0 +1,173 @@
+"""
+Per-stage metrics for the entry points. Every hour-file (or day, for the aggregation) gets one record with the wall
+time of each stage (read, parse, clean, encode, classify, infer, merge, write, ...), counters such as rows in/out,
+bytes read and discarded lines, and the current and peak resident memory. Records are appended as JSON lines to the
+metrics file, and summary() prints where the run spent its time and memory.
+"""
+
+import os
+import sys
+import json
+import time
+import datetime
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError: # Not available on Windows
+    resource = None
+
+def current_rss_mb():
+    """
+    Current resident set size of the process in MB, None if it can not be read
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return round(pages * os.sysconf("SC_PAGE_SIZE") / 2**20, 1)
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+def peak_rss_mb(who="self"):
+    """
+    Peak resident set size in MB of the process (who="self") or of its finished child processes (who="children")
+    """
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF if who == "self" else resource.RUSAGE_CHILDREN)
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    scale = 1 if sys.platform == "darwin" else 1024
+    return round(usage.ru_maxrss * scale / 2**20, 1)
+
+def get_metrics(args):
+    """
+    The Metrics object of a run (args.metrics), or a disabled one if the entry point did not set it up
+    """
+    metrics = getattr(args, "metrics", None)
+    return metrics if metrics is not None else Metrics(enabled=False)
+
+class Metrics:
+    """
+    Metrics class to time the stages of a run per file and write the records to a JSON-lines file
+    Params
+        path: JSON-lines file the records are appended to - default None (records are only kept for the summary)
+        run_name: name of the entry point, stored with every record - default ""
+        enabled: bool, a disabled Metrics object records nothing - default True
+        profiler: optional profiler (see utils/profiling.py) that is scoped to the same files - default None
+    """
+
+    def __init__(self, path=None, run_name="", enabled=True, profiler=None):
+        self.path = path
+        self.run_name = run_name
+        self.enabled = enabled
+        self.profiler = profiler
+        self.record = None # Record of the current file
+        self.run_record = self.new_record("<run>") # Stages outside of a file, like inference over all users
+        self.stage_totals = {} # Stage -> [total seconds, number of records with the stage]
+        self.count_totals = {}
+        self.n_files = 0
+        self.start = time.perf_counter()
+
+        if self.enabled and self.path is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+
+    def new_record(self, name):
+        return {"run": self.run_name, "file": name, "start": datetime.datetime.now().isoformat(timespec="seconds"),
+                "stages": {}, "counts": {}}
+
+    def current(self):
+        return self.record if self.record is not None else self.run_record
+
+    @contextmanager
+    def file(self, name):
+        """
+        Context manager around the processing of one file; the record is written when the block ends, also if it
+        raised an exception
+        """
+        if not self.enabled:
+            yield self
+            return
+        self.record = self.new_record(name)
+        if self.profiler is not None:
+            self.profiler.start_file(name)
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.record["seconds"] = round(time.perf_counter() - start, 4)
+            if self.profiler is not None:
+                self.profiler.end_file(name)
+            self.finish(self.record)
+            self.n_files += 1
+            self.record = None
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Context manager to time a stage; time spent in the same stage more than once per file is added up
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stages = self.current()["stages"]
+            stages[name] = stages.get(name, 0) + time.perf_counter() - start
+
+    def count(self, key, value=1):
+        """
+        Add value to a counter of the current file, like rows_in, rows_out, bytes_read or discarded_lines
+        """
+        if not self.enabled:
+            return
+        counts = self.current()["counts"]
+        counts[key] = counts.get(key, 0) + int(value)
+
+    def finish(self, record):
+        record["stages"] = {stage: round(seconds, 4) for stage, seconds in record["stages"].items()}
+        record["rss_mb"] = current_rss_mb()
+        # The peak comes from getrusage and the current size from /proc, so keep the peak at least the current size
+        record["peak_rss_mb"] = max([mb for mb in [peak_rss_mb(), record["rss_mb"]] if mb is not None], default=None)
+        children = peak_rss_mb("children")
+        if children:
+            record["peak_rss_children_mb"] = children
+
+        for stage, seconds in record["stages"].items():
+            totals = self.stage_totals.setdefault(stage, [0, 0])
+            totals[0] += seconds
+            totals[1] += 1
+        for key, value in record["counts"].items():
+            self.count_totals[key] = self.count_totals.get(key, 0) + value
+
+        if self.path is not None:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+
+    def summary(self):
+        """
+        Write the record of the stages outside of files and print a table with the totals per stage and counter.
+        The profiler, if any, writes its output for the whole run
+        """
+        if not self.enabled:
+            return
+        if self.profiler is not None:
+            self.profiler.close()
+            self.profiler = None
+        if len(self.run_record["stages"]) > 0 or len(self.run_record["counts"]) > 0:
+            self.run_record["seconds"] = round(time.perf_counter() - self.start, 4)
+            self.finish(self.run_record)
+            self.run_record = self.new_record("<run>")
+
+        wall = time.perf_counter() - self.start
+        print("\nMetrics {}: {} files, {:.1f} s wall time, peak RSS {} MB".format(
+            self.run_name, self.n_files, wall, peak_rss_mb()))
+        print("{:<16}{:>12}{:>8}{:>8}{:>14}".format("stage", "total (s)", "%", "records", "mean (s)"))
+        for stage, (seconds, n) in sorted(self.stage_totals.items(), key=lambda item: -item[1][0]):
+            print("{:<16}{:>12.2f}{:>8.1f}{:>8}{:>14.4f}".format(stage, seconds, 100 * seconds / max(wall, 1e-9), n,
+                                                               seconds / n))
+        for key, value in sorted(self.count_totals.items()):
+            print("{:<16}{:>12}".format(key, value))
+        if self.path is not None:
+            print("Metrics written to ", self.path)
@@ -0,0 +1,218 @@
+"""
+Opt-in profiling of the hot functions of the pipeline (--profile on the entry points), scoped per file through the
+Metrics file scopes. Two modes:
+    sample:   a background thread samples the stacks of all threads every few milliseconds and keeps the samples that
+              are inside one of the hot functions. Nothing is wrapped, so the overhead does not depend on how often the
+              functions are called. Output: collapsed stacks (<file>.collapsed, all.collapsed), the input format of
+              flamegraph.pl and speedscope.
+    cprofile: the hot functions are wrapped and cProfile runs only while one of them is active.
+              Output: pstats files (<file>.prof, all.prof), e.g. for snakeviz.
+The output of a run is written to <profile_path>/<run name>_<timestamp>. Work done in pool worker processes (dictionary
+imputer, parallel location inference) is not profiled.
+"""
+
+import os
+import re
+import sys
+import pstats
+import cProfile
+import datetime
+import functools
+import threading
+from collections import Counter
+
+# Hot functions as (file name, function name); Inference.find_location is a method of the Inference class
+HOT_FUNCTIONS = [("data_read_in.py", "clean_for_content"), ("dict_sentiment_imputer.py", "_search_trie"),
+                 ("inference.py", "Inference.find_location"), ("aggregation_utils.py", "weighted_groupby"),
+                 ("emb_sentiment_imputer.py", "create_embeddings")]
+
+def safe_name(name):
+    return re.sub(r"[^\w.-]", "_", name)
+
+def make_profiler(args, run_name, default_path):
+    """
+    The profiler for a run as set by --profile (sample or cprofile), or None if profiling is off
+    Params
+        args: arguments from ArgParser, with profile and optionally profile_path and profile_interval
+        run_name: name of the entry point, used in the output folder name
+        default_path: folder for the profiles if --profile_path is not given
+    """
+    mode = getattr(args, "profile", "")
+    if mode == "" or mode is None:
+        return None
+    path = getattr(args, "profile_path", "")
+    out_dir = os.path.join(path if path != "" else default_path,
+                           "{}_{}".format(run_name, datetime.datetime.now().strftime("%Y%m%d_%H%M%S")))
+    if mode == "sample":
+        return SamplingProfiler(out_dir, interval=getattr(args, "profile_interval", 0.005))
+    if mode == "cprofile":
+        return ScopedCProfiler(out_dir)
+    raise ValueError("Unknown profile mode {}, choose sample or cprofile".format(mode))
+
+def add_profile_args(parser):
+    """
+    Add the --profile arguments to the ArgParser of an entry point
+    """
+    parser.add_argument("--profile", default="", type=str,
+                        help="Profile the hot functions per file: sample (collapsed stacks) or cprofile (.prof files)")
+    parser.add_argument("--profile_path", default="", type=str,
+                        help="Folder for the profiles (default: <output_path>/profiles)")
+    parser.add_argument("--profile_interval", default=0.005, type=float, help="Sampling interval in seconds")
+
+class SamplingProfiler:
+    """
+    SamplingProfiler class to sample the stacks that pass through the hot functions and write them as collapsed stacks
+    Params
+        out_dir: output folder of the run
+        interval: seconds between samples - default 0.005
+    """
+
+    def __init__(self, out_dir, interval=0.005):
+        self.out_dir = out_dir
+        self.interval = interval
+        self.hot = set()
+        for file_name, func_name in HOT_FUNCTIONS:
+            self.hot.add((file_name, func_name.split(".")[-1]))
+
+        self.lock = threading.Lock()
+        self.counts = Counter() # Collapsed stack -> samples, of the current file
+        self.run_counts = Counter()
+        self.n_samples = 0
+        os.makedirs(out_dir, exist_ok=True)
+
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.sample_loop, name="sampling-profiler", daemon=True)
+        self.thread.start()
+
+    def sample_loop(self):
+        own_id = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack, is_hot = [], False
+                while frame is not None:
+                    code = frame.f_code
+                    file_name = os.path.basename(code.co_filename)
+                    if (file_name, code.co_name) in self.hot:
+                        is_hot = True
+                    stack.append("{} ({}:{})".format(code.co_name, file_name, code.co_firstlineno))
+                    frame = frame.f_back
+                if is_hot:
+                    with self.lock:
+                        self.counts[";".join(reversed(stack))] += 1
+                        self.n_samples += 1
+
+    def write(self, counts, path):
+        with open(path, "w") as f:
+            for stack, n in counts.most_common():
+                f.write("{} {}\n".format(stack, n))
+
+    def start_file(self, name):
+        with self.lock:
+            self.run_counts.update(self.counts)
+            self.counts = Counter()
+
+    def end_file(self, name):
+        with self.lock:
+            counts, self.counts = self.counts, Counter()
+        self.run_counts.update(counts)
+        if len(counts) > 0:
+            self.write(counts, os.path.join(self.out_dir, safe_name(name) + ".collapsed"))
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+        self.run_counts.update(self.counts)
+        self.write(self.run_counts, os.path.join(self.out_dir, "all.collapsed"))
+        print("Profile: {} samples in the hot functions written to {}".format(self.n_samples, self.out_dir))
+
+def resolve_hot_functions():
+    """
+    Find the hot functions in the loaded modules
+    Returns
+        targets: list of (owner, attribute name, function), owner is a module or the Inference class
+    """
+    targets = []
+    for module in list(sys.modules.values()):
+        module_file = getattr(module, "__file__", None)
+        if module_file is None:
+            continue
+        for file_name, func_name in HOT_FUNCTIONS:
+            if os.path.basename(module_file) != file_name:
+                continue
+            owner = module
+            parts = func_name.split(".")
+            for part in parts[:-1]:
+                owner = getattr(owner, part, None)
+            if owner is not None and hasattr(owner, parts[-1]):
+                targets.append((owner, parts[-1], getattr(owner, parts[-1])))
+    return targets
+
+class ScopedCProfiler:
+    """
+    ScopedCProfiler class to run cProfile only while a hot function is active. The hot functions are replaced in
+    their module (and in every module that imported them by name) by a wrapper that enables the profiler on the
+    outermost call, so recursion (_search_trie) and nested hot functions are counted once
+    Params
+        out_dir: output folder of the run
+    """
+
+    def __init__(self, out_dir):
+        self.out_dir = out_dir
+        os.makedirs(out_dir, exist_ok=True)
+        self.profile = cProfile.Profile()
+        self.run_stats = None
+        self.depth = 0
+        self.patched = [] # (owner, attribute name, original) to restore on close
+
+        for owner, name, func in resolve_hot_functions():
+            wrapper = self.wrap(func)
+            self.patch(owner, name, wrapper)
+            # Modules that did "from module import function" hold their own reference
+            if not isinstance(owner, type):
+                for module in list(sys.modules.values()):
+                    if module is not owner and getattr(module, name, None) is func:
+                        self.patch(module, name, wrapper)
+
+    def patch(self, owner, name, wrapper):
+        self.patched.append((owner, name, getattr(owner, name)))
+        setattr(owner, name, wrapper)
+
+    def wrap(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            self.depth += 1
+            if self.depth == 1:
+                self.profile.enable()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.depth -= 1
+                if self.depth == 0:
+                    self.profile.disable()
+        return wrapper
+
+    def add_to_run(self, profile):
+        if self.run_stats is None:
+            self.run_stats = pstats.Stats(profile)
+        else:
+            self.run_stats.add(profile)
+
+    def start_file(self, name):
+        self.profile = cProfile.Profile()
+
+    def end_file(self, name):
+        profile, self.profile = self.profile, cProfile.Profile()
+        if profile.getstats():
+            profile.dump_stats(os.path.join(self.out_dir, safe_name(name) + ".prof"))
+            self.add_to_run(profile)
+
+    def close(self):
+        for owner, name, original in reversed(self.patched):
+            setattr(owner, name, original)
+        if self.profile.getstats():
+            self.add_to_run(self.profile)
+        if self.run_stats is not None:
+            self.run_stats.dump_stats(os.path.join(self.out_dir, "all.prof"))
+        print("Profile written to ", self.out_dir)
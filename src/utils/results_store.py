@@ -0,0 +1,108 @@
+import os
+import numpy as np
+import pandas as pd
+
+from utils.file_catalog import parse_file_name
+
+MOMENT_COLUMNS = ["date_name", "year", "month", "day", "hour", "count", "sum", "sum_sq"]
+RESULTS_FORMATS = ["csv", "parquet"]
+
+def results_file_path(out_path, area, results_format="csv"):
+    """
+    Results file of an area:
+        csv:     all_means_<area>.csv with base_name, mean and standardized of every hour, as written before
+        parquet: hourly_scores_<area>.parquet with the moments, mean, std and standardized mean of every hour (needs
+                 pyarrow); only this format can be appended to, since the moments are needed to merge runs
+    """
+    if results_format == "csv":
+        return os.path.join(out_path, "all_means_{}.csv".format(area))
+    if results_format == "parquet":
+        return os.path.join(out_path, "hourly_scores_{}.parquet".format(area))
+    raise ValueError("Unknown results format {}, choose from {}".format(results_format, ", ".join(RESULTS_FORMATS)))
+
+def read_results(path):
+    if not path.endswith(".parquet"):
+        raise ValueError("Only parquet results can be appended to, {} has no moments".format(path))
+    return pd.read_parquet(path)
+
+def write_results(df, path):
+    """
+    Write the results to a single file, parquet or csv depending on the extension
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if path.endswith(".parquet"):
+        df.to_parquet(path, index=False)
+    else:
+        # Same columns as the all_means_<area>.csv file compiled from the per-hour aggr_score_<date name>.csv files
+        means = pd.DataFrame({"base_name": ["aggr_score_{}.csv".format(name) for name in df["date_name"]],
+                              "mean": df["mean"], "standardized": df["standardized"]})
+        means.to_csv(path)
+
+class HourlyResults:
+    """
+    HourlyResults class to accumulate the aggregated sentiment scores of every hour-file in memory, so they can be
+    written once to a single file per area instead of a tiny .csv file per hour.
+    For every hour the moments count, sum and sum of squares of the scores are kept. Mean, standard deviation and the
+    standardized mean (over all hours) are computed from those moments when the results are written.
+    """
+
+    def __init__(self):
+        self.rows = {} # Date name -> moments of the hour
+
+    def add(self, date_name, scores):
+        """
+        Add the scores of the affected tweets of an hour-file
+        Params
+            date_name: date name of the hour-file, like 2021-08-01_00_00_01
+            scores: array-like of sentiment scores
+        """
+        scores = np.asarray(scores, dtype=np.float64)
+        scores = scores[~np.isnan(scores)]
+        entry = parse_file_name(date_name)
+        self.rows[date_name] = {"date_name": date_name, "year": entry.year, "month": entry.month, "day": entry.day,
+                                "hour": entry.hour, "count": len(scores), "sum": scores.sum(),
+                                "sum_sq": np.square(scores).sum()}
+
+    def add_moments(self, df):
+        """
+        Add hours from a DataFrame with the moment columns (e.g. results of an earlier run)
+        """
+        for row in df[MOMENT_COLUMNS].to_dict("records"):
+            self.rows[row["date_name"]] = row
+
+    def to_frame(self):
+        """
+        Returns the results as a DataFrame sorted by date, with the moments, mean, std and standardized mean
+        """
+        df = pd.DataFrame(list(self.rows.values()), columns=MOMENT_COLUMNS)
+        df = df.sort_values(["year", "month", "day", "hour", "date_name"]).reset_index(drop=True)
+        df["count"] = df["count"].astype(np.int64)
+
+        count = df["count"].to_numpy(dtype=np.float64)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = df["sum"].to_numpy() / count
+            var = np.maximum(df["sum_sq"].to_numpy() / count - np.square(mean), 0)
+        df["mean"] = mean
+        df["std"] = np.sqrt(var)
+
+        # Standardized mean of each hour with respect to all hours
+        df["standardized"] = (mean - np.nanmean(mean)) / np.nanstd(mean) if len(df) > 0 else []
+        return df
+
+    def save(self, path, append=False):
+        """
+        Write the results to a single file
+        Params
+            path: .parquet or .csv file, see results_file_path
+            append: bool to merge with the hours already in the file (hours in this run replace the stored ones),
+                    for incremental runs; parquet files only - default False
+        """
+        if append and os.path.exists(path):
+            new_rows = self.rows
+            self.rows = {}
+            self.add_moments(read_results(path))
+            self.rows.update(new_rows)
+        df = self.to_frame()
+        write_results(df, path)
+        print("Wrote results for {} hours to {}".format(len(df), path))
+        return df
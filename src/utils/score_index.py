@@ -0,0 +1,95 @@
+"""
+Score index: the sentiment scores of every hour-file stored as a sorted int64 message ID array and a float32 score
+array (<date_name>.ids.npy and <date_name>.scores.npy), so consumers can memory-map them and look up any set of tweet
+ID's with a vectorized searchsorted instead of parsing the sentiment .csv files.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+
+IDS_EXT = ".ids.npy"
+SCORES_EXT = ".scores.npy"
+
+def write_score_index(df, index_path, date_name):
+    """
+    Write the scores of an hour-file to the index
+    Params
+        df: DataFrame with message_id and score columns
+        index_path: folder of the index (one partition per hour-file)
+        date_name: date name of the hour-file, like 2021-08-01_00_00_01
+    """
+    os.makedirs(index_path, exist_ok=True)
+    ids = df['message_id'].to_numpy(dtype=np.int64)
+    scores = df['score'].to_numpy(dtype=np.float32)
+    order = np.argsort(ids, kind='stable')
+
+    # Scores are written first, so a partition is only visible (ids file present) once it is complete
+    np.save(os.path.join(index_path, date_name + SCORES_EXT), scores[order])
+    np.save(os.path.join(index_path, date_name + IDS_EXT), ids[order])
+
+class ScoreIndex:
+    """
+    ScoreIndex class to look up sentiment scores by message ID in the memory-mapped index written by the imputer
+    Params
+        index_path: folder of the index
+    """
+
+    def __init__(self, index_path):
+        self.path = index_path
+        self.partitions = {} # Memory-mapped (ids, scores) per date name, opened on first use
+
+    def date_names(self):
+        """
+        Date names of the hour-files in the index, sorted
+        """
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(f[:-len(IDS_EXT)] for f in os.listdir(self.path) if f.endswith(IDS_EXT))
+
+    def has(self, date_name):
+        return os.path.exists(os.path.join(self.path, date_name + IDS_EXT))
+
+    def load(self, date_name):
+        if date_name not in self.partitions:
+            ids = np.load(os.path.join(self.path, date_name + IDS_EXT), mmap_mode='r')
+            scores = np.load(os.path.join(self.path, date_name + SCORES_EXT), mmap_mode='r')
+            self.partitions[date_name] = (ids, scores)
+        return self.partitions[date_name]
+
+    def lookup(self, tweet_ids, date_names=None):
+        """
+        Look up the scores of a set of tweet ID's
+        Params
+            tweet_ids: array-like of tweet (message) ID's
+            date_names: date name or list of date names of the partitions to search - default None (all partitions)
+        Returns
+            scores: float32 array aligned with tweet_ids, NaN for ID's that are not in the index
+        """
+        tweet_ids = np.asarray(tweet_ids, dtype=np.int64)
+        if date_names is None:
+            date_names = self.date_names()
+        elif isinstance(date_names, str):
+            date_names = [date_names]
+
+        scores = np.full(len(tweet_ids), np.nan, dtype=np.float32)
+        for date_name in date_names:
+            ids, part_scores = self.load(date_name)
+            if len(ids) == 0:
+                continue
+            pos = np.searchsorted(ids, tweet_ids)
+            pos[pos == len(ids)] = 0
+            found = ids[pos] == tweet_ids
+            scores[found] = part_scores[pos[found]]
+        return scores
+
+    def lookup_frame(self, tweet_ids, date_names=None):
+        """
+        Look up the scores of a set of tweet ID's and return only the ones that were found
+        Returns
+            df: DataFrame with message_id and score
+        """
+        tweet_ids = np.asarray(tweet_ids, dtype=np.int64)
+        scores = self.lookup(tweet_ids, date_names)
+        found = ~np.isnan(scores)
+        return pd.DataFrame({'message_id': tweet_ids[found], 'score': scores[found]})
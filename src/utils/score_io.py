@@ -0,0 +1,107 @@
+"""
+Reading and writing of the hourly sentiment score files in the formats of --output_format:
+    csv:     <output_path>/<tweet_type>/<year>/sentiment_<date>.csv, as written by pandas with an index column
+    parquet: <output_path>/<tweet_type>/year=<year>/month=<MM>/sentiment_<date>.parquet
+    feather: <output_path>/<tweet_type>/year=<year>/month=<MM>/sentiment_<date>.feather
+The columnar formats store message_id and user_id as int64 and score as float32, compressed with zstd, and are
+partitioned hive-style so they can also be read as one dataset (e.g. pd.read_parquet on the year= folder). Parquet and
+feather need pyarrow. read_scores reads any of the formats, so the downstream scripts do not depend on the format.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+
+OUTPUT_FORMATS = ["csv", "parquet", "feather"]
+COLUMNAR_EXTS = [".parquet", ".feather"]
+
+def partition_path(path, year, month):
+    return os.path.join(path, "year={}".format(year), "month={}".format(str(month).zfill(2)))
+
+def score_file_path(path, year, month, stem, output_format="csv"):
+    """
+    Path of a score file
+    Params
+        path: root folder of the scores, like <output_path>/<tweet_type>
+        year, month: date of the hour-file
+        stem: file name without extension, like sentiment_2021-08-29_00_00_01
+        output_format: csv, parquet or feather - default csv
+    """
+    if output_format == "csv":
+        return os.path.join(path, str(year), stem + ".csv")
+    if output_format in ["parquet", "feather"]:
+        return os.path.join(partition_path(path, year, month), "{}.{}".format(stem, output_format))
+    raise ValueError("Unknown output format {}, choose from {}".format(output_format, ", ".join(OUTPUT_FORMATS)))
+
+def scores_year_path(path, year):
+    """
+    Folder with the score files of a year: the year= partition if there is one, otherwise the <year> folder
+    """
+    hive_path = os.path.join(path, "year={}".format(year))
+    return hive_path if os.path.isdir(hive_path) else os.path.join(path, str(year))
+
+def find_score_file(path, year, month, stem, default_ext=".csv.gz", year_folder=None):
+    """
+    Path of the score file of an hour in any format: a parquet or feather file in the year=/month= partition if it
+    exists, otherwise <path>/<year_folder>/<stem><default_ext> (year_folder defaults to the year)
+    """
+    for ext in COLUMNAR_EXTS:
+        file_path = os.path.join(partition_path(path, year, month), stem + ext)
+        if os.path.exists(file_path):
+            return file_path
+    return os.path.join(path, str(year) if year_folder is None else year_folder, stem + default_ext)
+
+def compact_scores(df):
+    """
+    Cast the score columns to their compact dtypes: int64 ID's and float32 scores
+    """
+    df = df.reset_index(drop=True)
+    for col in ["message_id", "user_id"]:
+        if col in df.columns:
+            df[col] = df[col].astype(np.int64)
+    if "score" in df.columns:
+        df["score"] = df["score"].astype(np.float32)
+    return df
+
+def write_scores(df, file_path, output_format="csv"):
+    """
+    Write a score DataFrame (message_id, user_id, score) in the given format, creating the partition folders
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+    if output_format == "csv":
+        df.to_csv(file_path)
+    elif output_format == "parquet":
+        compact_scores(df).to_parquet(file_path, compression="zstd", index=False)
+    elif output_format == "feather":
+        compact_scores(df).to_feather(file_path, compression="zstd")
+    else:
+        raise ValueError("Unknown output format {}, choose from {}".format(output_format, ", ".join(OUTPUT_FORMATS)))
+
+def read_scores(file_path, columns=None, sep=","):
+    """
+    Read a score file written in any of the output formats (or a tab-separated .csv.gz with sep="\\t")
+    Params
+        file_path: path of the file, the format follows from the extension
+        columns: columns to read - default None (all)
+        sep: separator of csv files - default ","
+    Returns
+        df: DataFrame with int64 message_id and float64 score, without the rows that have no message_id
+    """
+    if file_path.endswith(".parquet"):
+        df = pd.read_parquet(file_path, columns=columns)
+    elif file_path.endswith(".feather"):
+        df = pd.read_feather(file_path, columns=columns)
+    else:
+        # Nullable integers, so a missing message_id does not turn the column into float64 (which rounds the ids)
+        df = pd.read_csv(file_path, sep=sep, usecols=columns, dtype={"message_id": "Int64"})
+
+    if "message_id" in df.columns:
+        # Rows without a message ID (e.g. a truncated last line of a csv) cannot be joined on it
+        missing = df["message_id"].isnull().to_numpy()
+        if missing.any():
+            print("Dropped {} rows without message_id from {}".format(missing.sum(), file_path))
+            df = df[~missing].copy()
+        df["message_id"] = df["message_id"].astype(np.int64)
+    if "score" in df.columns:
+        df["score"] = df["score"].astype(np.float64)
+    return df
@@ -0,0 +1,75 @@
+"""
+Client of the local scoring service (src/scoring_service.py), which keeps the embedding model and classifier loaded
+and batches the texts of all its clients. Used by main_sentiment_imputer.py and main_hour_pipeline.py
+with --scoring_url.
+"""
+
+import json
+import time
+import socket
+import urllib.error
+import urllib.request
+import numpy as np
+
+class ScoringServiceError(Exception):
+    """
+    The scoring service could not be reached or failed to score a request, also after the retries
+    """
+
+class ScoringClient:
+    """
+    ScoringClient class to score cleaned texts with a running scoring service
+    Params
+        url: address of the service, like http://127.0.0.1:8765
+        request_size: texts per request; larger inputs are sent in several requests - default 1000
+        timeout: seconds to wait for a response - default 600
+        retries: how many times a request is sent again after a connection error, timeout or server error (HTTP 5xx)
+                 - default 3
+        retry_wait: seconds to wait before the first retry, doubled for every next retry - default 1
+    """
+
+    def __init__(self, url, request_size=1000, timeout=600, retries=3, retry_wait=1.0):
+        self.url = url.rstrip("/")
+        self.request_size = request_size
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_wait = retry_wait
+
+    def request(self, path, payload=None):
+        """
+        Send a request and return the decoded JSON response. Connection errors, timeouts and server errors are
+        retried; a rejected request (HTTP 4xx) is not. Raises ScoringServiceError when the request keeps failing
+        """
+        data = None if payload is None else json.dumps(payload).encode("utf-8")
+        for attempt in range(self.retries + 1):
+            req = urllib.request.Request(self.url + path, data=data, headers={"Content-Type": "application/json"})
+            try:
+                with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                    return json.loads(response.read())
+            except urllib.error.HTTPError as e:
+                error = "HTTP {} from {}{}: {}".format(e.code, self.url, path, e.read().decode("utf-8", "replace"))
+                if e.code < 500:
+                    raise ScoringServiceError(error) from e
+            except (urllib.error.URLError, socket.timeout, ConnectionError) as e:
+                error = "Scoring service at {} not reachable: {}".format(self.url, e)
+
+            if attempt < self.retries:
+                print("{}, retrying ({} of {})".format(error, attempt + 1, self.retries))
+                time.sleep(self.retry_wait * 2 ** attempt)
+        raise ScoringServiceError(error)
+
+    def score(self, texts):
+        """
+        Sentiment scores (predicted probability of the positive class) of a list of cleaned texts, as a float array
+        """
+        texts = [str(text) for text in texts]
+        scores = []
+        for start in range(0, len(texts), self.request_size):
+            scores += self.request("/score", {"texts": texts[start:start + self.request_size]})["scores"]
+        return np.array(scores, dtype=np.float64)
+
+    def health(self):
+        return self.request("/health")
+
+    def stats(self):
+        return self.request("/stats")
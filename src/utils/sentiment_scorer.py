@@ -0,0 +1,132 @@
+"""
+Library API to score texts without the file layout of main_sentiment_imputer.py, e.g. from a notebook or another
+service. SentimentScorer.score_stream consumes any iterable of texts (or (text, lang) tuples) - a generator over a
+gzip file, a DataFrame column, a queue - and yields one score per input, in input order:
+    args = argparse.Namespace()
+    load_models(args) # from main_sentiment_imputer.py
+    scorer = SentimentScorer(args.emb_model, args.clf_model)
+    for score in scorer.score_stream(df['text']):
+        ...
+Texts are cleaned with clean_for_content on a reader thread while the model scores the previous chunk. The reader
+hands chunks of buffer_size texts to the scorer through a queue of at most max_pending chunks and blocks when it is
+full, so a fast input never gets ahead of the model: memory is bounded by about (max_pending + 2) * buffer_size texts,
+whatever the length of the input.
+"""
+
+import queue
+import argparse
+import threading
+import numpy as np
+import pandas as pd
+
+from utils.data_read_in import clean_for_content
+from utils.emb_sentiment_imputer import create_embeddings
+
+END_OF_STREAM = object()
+
+class SentimentScorer:
+    """
+    SentimentScorer class to score a stream of texts with the embedding model and classifier
+    Params
+        emb_model: embedding model, like the one loaded from models/emb.pkl
+        clf_model: classifier with predict_proba, like the one loaded from models/clf.pkl
+        batch_size: batch size of the embedding model - default 100
+        buffer_size: texts per chunk that is cleaned and scored at once - default 10000
+        max_pending: number of cleaned chunks that may wait for the model - default 2
+        score_digits: round the scores to this many digits - default None (no rounding)
+        default_lang: language for clean_for_content if the inputs are plain texts - default en
+    """
+
+    def __init__(self, emb_model, clf_model, batch_size=100, buffer_size=10000, max_pending=2, score_digits=None,
+                 default_lang="en"):
+        self.emb_model = emb_model
+        self.clf_model = clf_model
+        self.args = argparse.Namespace(batch_size=batch_size)
+        self.buffer_size = buffer_size
+        self.max_pending = max_pending
+        self.score_digits = score_digits
+        self.default_lang = default_lang
+
+    def clean_chunk(self, items):
+        texts = []
+        for item in items:
+            text, lang = item if isinstance(item, tuple) else (item, self.default_lang)
+            texts.append(clean_for_content(text, lang) if isinstance(text, str) else "")
+        return texts
+
+    def put(self, chunks, chunk, stop):
+        """
+        Put a chunk in the queue, waiting while it is full; returns False if the consumer stopped
+        """
+        while not stop.is_set():
+            try:
+                chunks.put(chunk, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def read_chunks(self, items, chunks, stop):
+        """
+        Reader thread: read and clean chunks of buffer_size items. Errors are passed on to the consumer
+        """
+        try:
+            chunk = []
+            for item in items:
+                chunk.append(item)
+                if len(chunk) == self.buffer_size:
+                    if not self.put(chunks, self.clean_chunk(chunk), stop):
+                        return
+                    chunk = []
+            if len(chunk) > 0 and not self.put(chunks, self.clean_chunk(chunk), stop):
+                return
+            self.put(chunks, END_OF_STREAM, stop)
+        except Exception as e:
+            self.put(chunks, e, stop)
+
+    def score_texts(self, texts):
+        """
+        Scores of a list of cleaned texts; texts that are empty after cleaning get NaN
+        """
+        scores = np.full(len(texts), np.nan)
+        keep = np.array([text != "" for text in texts], dtype=bool)
+        if keep.any():
+            df = pd.DataFrame({"text": np.array(texts, dtype=object)[keep]})
+            embeddings = create_embeddings(self.emb_model, df, self.args, show_progress_bar=False)
+            scores[keep] = self.clf_model.predict_proba(embeddings)[:, 1]
+        if self.score_digits is not None:
+            scores = np.round(scores, self.score_digits)
+        return scores
+
+    def score_stream(self, items):
+        """
+        Score an iterable of texts or (text, lang) tuples
+        Params
+            items: any iterable; it is read on a separate thread, at most about (max_pending + 2) chunks ahead
+        Returns
+            generator of float scores (predicted probability of the positive class), one per input in input order,
+            NaN for texts that are empty after cleaning
+        """
+        chunks = queue.Queue(maxsize=self.max_pending)
+        stop = threading.Event()
+        reader = threading.Thread(target=self.read_chunks, args=(iter(items), chunks, stop), name="scorer-reader",
+                                  daemon=True)
+        reader.start()
+        try:
+            while True:
+                chunk = chunks.get()
+                if chunk is END_OF_STREAM:
+                    break
+                if isinstance(chunk, Exception):
+                    raise chunk
+                for score in self.score_texts(chunk):
+                    yield float(score)
+        finally:
+            # Also when the consumer stops early: the reader stops at its next put
+            stop.set()
+
+    def score(self, items):
+        """
+        Scores of all items as an array, see score_stream
+        """
+        return np.fromiter(self.score_stream(items), dtype=np.float64)
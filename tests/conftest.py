@@ -0,0 +1,9 @@
+import os
+import sys
+
+# The scripts import their modules relative to src and src/project_ida (see the sys.path lines in the entry points)
+ROOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SRC_PATH = os.path.join(ROOT_PATH, "src")
+for path in [ROOT_PATH, SRC_PATH, os.path.join(SRC_PATH, "project_ida"), os.path.join(SRC_PATH, "benchmarks")]:
+    if path not in sys.path:
+        sys.path.append(path)
@@ -0,0 +1,60 @@
+import os
+import argparse
+import datetime
+import numpy as np
+import pandas as pd
+
+import synthetic_data
+from utils.aggregation_utils import read_hour, join_on_message_id, drop_missing_ids
+
+DATE = datetime.date(2021, 8, 29)
+
+
+def make_args(tmp_path, n_hours=2):
+    args = argparse.Namespace(text_path=str(tmp_path / "text"), geo_path=str(tmp_path / "geo"),
+                              sent_path=str(tmp_path / "sent"), sentiment_method="bert", keywords=[])
+    synthetic_data.generate_aggregation_hours(args.text_path, args.geo_path, args.sent_path, n_hours=n_hours,
+                                              tweets_per_hour=200, n_users=50, seed=0, date=DATE)
+    return args
+
+
+def test_join_on_message_id_equals_merge():
+    rng = np.random.default_rng(0)
+    a = pd.DataFrame({"message_id": rng.permutation(100), "x": rng.random(100)})
+    b = pd.DataFrame({"message_id": np.arange(0, 200, 2), "y": rng.random(100)})
+    joined = join_on_message_id([a, b])
+    expected = a.merge(b, on="message_id").sort_values("message_id").reset_index(drop=True)
+    pd.testing.assert_frame_equal(joined[["message_id", "x", "y"]], expected[["message_id", "x", "y"]])
+
+
+def test_read_hour_projects_columns(tmp_path):
+    args = make_args(tmp_path)
+    text_df, geo_df, sent_df = read_hour(DATE, 0, args)
+    assert "text" not in text_df
+    assert text_df["message_id"].dtype == np.int64 and text_df["user_id"].dtype == np.int64
+
+    args.keywords = ["storm"]
+    text_df, _, _ = read_hour(DATE, 0, args)
+    assert "text" in text_df
+
+
+def test_read_hour_drops_rows_without_ids(tmp_path):
+    args = make_args(tmp_path)
+    text_file = os.path.join(args.text_path, "2021_8_29_00.csv.gz")
+    text_df = pd.read_csv(text_file, sep="\t", dtype={"message_id": "Int64", "user_id": "Int64"})
+    text_df.loc[3, "message_id"] = pd.NA
+    text_df.loc[5, "user_id"] = pd.NA
+    text_df.to_csv(text_file, sep="\t", index=False)
+
+    read_df, _, _ = read_hour(DATE, 0, args)
+    assert len(read_df) == len(text_df) - 2
+    assert read_df["message_id"].dtype == np.int64
+    # The ids of the other rows are read exactly, not rounded through float64
+    expected = text_df["message_id"].drop([3, 5])
+    assert read_df["message_id"].tolist() == expected.tolist()
+
+
+def test_drop_missing_ids():
+    df = pd.DataFrame({"message_id": [1, None, 3], "user_id": [4, 5, None]})
+    out = drop_missing_ids(df, ["message_id", "user_id"], "test")
+    assert list(out["message_id"]) == [1] and out["user_id"].dtype == np.int64
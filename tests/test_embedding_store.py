@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from synthetic_data import StandInEmbedding
+from utils.embedding_store import EmbeddingStore
+
+
+class CountingEmbedding(StandInEmbedding):
+    """
+    Stand-in embedding that counts the encoded texts, and can fail after a number of encode calls
+    """
+
+    def __init__(self, fail_after=None):
+        super().__init__()
+        self.n_texts = 0
+        self.n_calls = 0
+        self.fail_after = fail_after
+
+    def encode(self, sentences, show_progress_bar=False, batch_size=100):
+        if self.fail_after is not None and self.n_calls == self.fail_after:
+            raise KeyboardInterrupt
+        self.n_calls += 1
+        self.n_texts += len(sentences)
+        return super().encode(sentences, show_progress_bar, batch_size)
+
+
+TEXTS = np.array(["storm number {} in the {}".format(ind, word) for ind, word in
+                  enumerate(np.random.default_rng(0).choice(["city", "rain", "night"], 95))])
+
+
+def test_resume_encodes_only_missing_shards(tmp_path):
+    with pytest.raises(KeyboardInterrupt):
+        EmbeddingStore(str(tmp_path), "stand-in", 64, shard_size=20).encode(TEXTS, CountingEmbedding(fail_after=2))
+
+    model = CountingEmbedding()
+    store = EmbeddingStore(str(tmp_path), "stand-in", 64).encode(TEXTS, model)
+    assert (model.n_calls, model.n_texts) == (3, 55)
+    assert store.shape == (95, 64) and store.is_complete()
+
+    ids = [94, 0, 41, 20, 19]
+    expected = StandInEmbedding().encode(TEXTS[ids]).astype(np.float16).astype(np.float32)
+    np.testing.assert_array_equal(store.take(ids), expected)
+
+    # A finished store is read back without encoding; a changed shard is encoded again
+    model = CountingEmbedding()
+    EmbeddingStore(str(tmp_path), "stand-in", 64, shard_size=20).encode(TEXTS, model)
+    assert model.n_texts == 0
+    changed = TEXTS.copy()
+    changed[45] = "a different text"
+    EmbeddingStore(str(tmp_path), "stand-in", 64).encode(changed, model)
+    assert model.n_texts == 20
+
+
+def test_shard_size_mismatch_raises(tmp_path):
+    EmbeddingStore(str(tmp_path), "stand-in", 64, shard_size=20).encode(TEXTS, CountingEmbedding())
+    with pytest.raises(ValueError):
+        EmbeddingStore(str(tmp_path), "stand-in", 64, shard_size=50)
+    assert EmbeddingStore(str(tmp_path), "stand-in", 64).shard_size == 20
+    assert EmbeddingStore(str(tmp_path), "stand-in", 128).shard_size == 50000
@@ -0,0 +1,95 @@
+import os
+import argparse
+import pytest
+
+from utils.file_catalog import FileCatalog, filter_names, parse_file_name
+
+
+def touch(folder, *names):
+    os.makedirs(folder, exist_ok=True)
+    for name in names:
+        open(os.path.join(folder, name), "w").close()
+
+
+def test_parse_file_name():
+    entry = parse_file_name("2021_08_01_05_onepercent.txt.gz")
+    assert (entry.stream, entry.year, entry.month, entry.day, entry.hour) == ("onepercent", 2021, 8, 1, 5)
+    assert entry.date_name == "2021_08_01_05_onepercent"
+
+    entry = parse_file_name("sentiment_2021-08-01_00_00_01.csv")
+    assert (entry.stream, entry.day, entry.hour, entry.date_name) == ("sentiment", 1, 0, "2021-08-01_00_00_01")
+
+    entry = parse_file_name("2013-08.txt.gz")
+    assert (entry.year, entry.month, entry.day, entry.hour, entry.date_name) == (2013, 8, 0, 0, "2013-08")
+
+    assert parse_file_name("README.md") is None
+
+
+def test_filter_names_keeps_monthly_files():
+    names = ["2013-07.txt.gz", "2013-08.txt.gz", "2013-08-02_01_00_01.txt.gz", "2013-09.txt.gz", "notes.txt"]
+    assert filter_names(names, year="2013", months=["8"]) == ["2013-08.txt.gz", "2013-08-02_01_00_01.txt.gz"]
+
+
+def test_imputer_leaves_undated_names_out(capsys):
+    from main_sentiment_imputer import select_file_names
+    names = ["2021-08-01_00_00_01.txt.gz", "README", "2021-09-01_00_00_01.txt.gz", "2020-12-31_23_00_01.txt.gz"]
+    args = argparse.Namespace(months='', output_format="parquet")
+    assert select_file_names(names, "2021", args) == [names[0], names[2], names[3]]
+    assert "1 files without a date are left out: README" in capsys.readouterr().out
+    args.months = ["9"]
+    assert select_file_names(names, "2021", args) == ["2021-09-01_00_00_01.txt.gz"]
+
+
+def test_listing_is_not_recursive(tmp_path):
+    root = str(tmp_path / "2021")
+    touch(root, "2021-08-01_01_00_01.txt.gz", "2021-08-01_00_00_01.txt.gz", "README.md")
+    touch(os.path.join(root, "old"), "2021-08-01_02_00_01.txt.gz")
+
+    catalog = FileCatalog(root)
+    assert catalog.names() == ["2021-08-01_00_00_01.txt.gz", "2021-08-01_01_00_01.txt.gz"]
+    assert catalog.undated == ["README.md"]
+
+    catalog = FileCatalog(root, recursive=True)
+    assert catalog.names(start=(2021, 8, 1, 1)) == ["2021-08-01_01_00_01.txt.gz", os.path.join("old", "2021-08-01_02_00_01.txt.gz")]
+    assert os.path.exists(catalog.full_path(catalog.files()[-1]))
+
+
+def test_cache_is_opt_in(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path / "home"))
+    root = str(tmp_path / "data")
+    touch(root, "2021-08-01_00_00_01.txt.gz")
+    FileCatalog(root)
+    assert not os.path.exists(tmp_path / "home")
+
+    cache_dir = str(tmp_path / "cache")
+    assert FileCatalog(root, cache_dir=cache_dir).names() == ["2021-08-01_00_00_01.txt.gz"]
+    assert len(os.listdir(cache_dir)) == 1
+
+    # A new file changes the folder mtime, so the cached listing is not used
+    touch(root, "2021-08-01_01_00_01.txt.gz")
+    assert len(FileCatalog(root, cache_dir=cache_dir).names()) == 2
+
+
+def test_join_keeps_every_file_of_an_hour(tmp_path):
+    aff = str(tmp_path / "aff")
+    scores = str(tmp_path / "scores")
+    touch(aff, "aff_2021-08-01_00_00_01.csv", "aff_2021-08-01_00_30_02.csv", "aff_2021-08-01_01_00_01.csv",
+          "aff_2021-08-01_02_00_01.csv")
+    touch(scores, "sentiment_2021-08-01_00_00_01.csv", "sentiment_2021-08-01_00_30_02.csv",
+          "sentiment_2021-08-01_01_00_01.csv")
+
+    pairs = FileCatalog(aff).join(FileCatalog(scores))
+    assert [(a.name, s.name) for a, s in pairs] == [
+        ("aff_2021-08-01_00_00_01.csv", "sentiment_2021-08-01_00_00_01.csv"),
+        ("aff_2021-08-01_00_30_02.csv", "sentiment_2021-08-01_00_30_02.csv"),
+        ("aff_2021-08-01_01_00_01.csv", "sentiment_2021-08-01_01_00_01.csv")]
+    assert [len(entries) for entries in FileCatalog(aff).by_hour().values()] == [2, 1, 1]
+
+
+def test_join_raises_on_ambiguous_hours(tmp_path):
+    aff = str(tmp_path / "aff")
+    scores = str(tmp_path / "scores")
+    touch(aff, "aff_2021-08-01_00_00_01.csv", "aff_2021-08-01_00_30_02.csv")
+    touch(scores, "sentiment_2021-08-01_00_15_00.csv")
+    with pytest.raises(ValueError):
+        FileCatalog(aff).join(FileCatalog(scores))
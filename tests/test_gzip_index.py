@@ -0,0 +1,112 @@
+import os
+import gzip
+import json
+import numpy as np
+import pytest
+
+import synthetic_data
+from gzip_index import GzipIndex, build_index, index_file_path
+from tweet_file import TweetFile
+from utils.file_catalog import FileCatalog
+
+
+def write_members(path, lines, member_size):
+    """
+    Write the lines as a series of gzip members of member_size lines, like a BGZF file
+    """
+    with open(path, "wb") as f:
+        for start in range(0, len(lines), member_size):
+            f.write(gzip.compress("".join(lines[start:start + member_size]).encode("utf-8")))
+
+
+def full_scan(path, tweet_ids=(), user_ids=()):
+    tweets = []
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            try:
+                tweet = json.loads(line)
+                if tweet["id"] in tweet_ids or tweet["user"]["id"] in user_ids:
+                    tweets.append(tweet)
+            except (ValueError, KeyError):
+                continue
+    return tweets
+
+
+@pytest.fixture(params=["single", "multi"])
+def hour_file(request, tmp_path):
+    folder = str(tmp_path / "raw")
+    name = synthetic_data.generate_raw_hours(folder, "onepercent", n_hours=1, tweets_per_hour=600, n_users=80)[0]
+    path = tmp_path / "raw" / name
+    if request.param == "multi":
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            lines = f.readlines()
+        write_members(path, lines, member_size=37)
+    return str(path), request.param
+
+
+def test_lookup_equals_full_scan(hour_file, tmp_path):
+    hour_file, _ = hour_file
+    index_path = str(tmp_path / "index")
+    build_index(hour_file, index_path)
+    index = GzipIndex(hour_file, index_path)
+
+    assert len(index) == 600
+    all_tweets = full_scan(hour_file, tweet_ids=set(index.tweet_ids.tolist()))
+    rng = np.random.default_rng(0)
+    tweet_ids = [tweet["id"] for tweet in rng.choice(all_tweets, 25)] + [7]
+    user_ids = [all_tweets[0]["user"]["id"], all_tweets[-1]["user"]["id"], 3]
+
+    assert index.lookup(tweet_ids=tweet_ids) == full_scan(hour_file, tweet_ids=set(tweet_ids))
+    assert index.lookup(user_ids=user_ids) == full_scan(hour_file, user_ids=set(user_ids))
+    assert index.lookup(tweet_ids, user_ids) == full_scan(hour_file, set(tweet_ids), set(user_ids))
+    assert index.lookup() == []
+
+
+def test_checkpoints(hour_file, tmp_path):
+    hour_file, kind = hour_file
+    build_index(hour_file, str(tmp_path))
+    checkpoints = GzipIndex(hour_file, str(tmp_path)).checkpoints
+    assert tuple(checkpoints[0]) == (0, 0)
+    if kind == "single":
+        assert len(checkpoints) == 1
+    else:
+        # One checkpoint per member of 37 lines (the synthetic file also has a few malformed lines)
+        assert len(checkpoints) >= 600 // 37
+        assert (np.diff(checkpoints, axis=0) > 0).all()
+
+
+def test_tweet_file_writes_the_same_index(hour_file, tmp_path):
+    hour_file, _ = hour_file
+    TweetFile(hour_file, is_geo=False, index_path=str(tmp_path / "parsed"))
+    build_index(hour_file, str(tmp_path / "built"))
+    parsed = np.load(index_file_path(hour_file, str(tmp_path / "parsed")))
+    built = np.load(index_file_path(hour_file, str(tmp_path / "built")))
+    for key in ["checkpoints", "tweet_ids", "tweet_offsets", "user_ids", "user_offsets"]:
+        np.testing.assert_array_equal(parsed[key], built[key])
+
+
+def test_out_of_date_index_raises(hour_file, tmp_path):
+    hour_file, _ = hour_file
+    build_index(hour_file, str(tmp_path))
+    with open(hour_file, "ab") as f:
+        f.write(gzip.compress(b'{"id": 1}\n'))
+    with pytest.raises(ValueError):
+        GzipIndex(hour_file, str(tmp_path))
+
+
+def test_indexes_stay_out_of_the_raw_listings(tmp_path):
+    from main_sentiment_imputer import list_raw_files
+    folder = str(tmp_path / "raw")
+    names = synthetic_data.generate_raw_hours(folder, "onepercent", n_hours=2, tweets_per_hour=50)
+    # The default index folder is a sub-folder of the raw files
+    default_index = build_index(os.path.join(folder, names[0]))
+    assert os.path.dirname(default_index) == os.path.join(folder, "gzip_index")
+    # Also when an index is written next to the raw files
+    build_index(os.path.join(folder, names[1]), folder)
+    assert os.path.exists(os.path.join(folder, names[1] + ".idx.npz"))
+
+    assert FileCatalog(folder).names() == sorted(names)
+    assert FileCatalog(folder, recursive=True).names() == sorted(names)
+    assert list_raw_files(folder) == sorted(names)
+    for name in list_raw_files(folder):
+        assert TweetFile(os.path.join(folder, name), is_geo=False).get_len_lines() > 0
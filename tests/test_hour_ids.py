@@ -0,0 +1,58 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+
+from hour_ids import HourIds
+
+
+class HourFile:
+    """
+    Stand-in for a TweetFile with the getters HourIds uses
+    """
+
+    def __init__(self, date_name, n_tweets, seed):
+        rng = np.random.default_rng(seed)
+        self.date_name = date_name
+        self.tweets = pd.DataFrame({"tweet_id": 1430000000000000000 + np.arange(n_tweets),
+                                    "user_id": 10**9 + rng.integers(0, 50, n_tweets),
+                                    "location": "somewhere"})
+
+    def get_tweets(self):
+        return self.tweets
+
+    def get_date_name(self):
+        return self.date_name
+
+    def get_len_tweets(self):
+        return len(self.tweets) + 3
+
+    def get_len_all_tweets(self):
+        return len(self.tweets) + 5
+
+
+@pytest.mark.parametrize("spill", [False, True])
+def test_round_trip(tmp_path, spill):
+    hour_ids = HourIds(str(tmp_path / "spill") if spill else None)
+    files = [HourFile("2021_08_29_{}_onepercent".format(str(hour).zfill(2)), 20 + hour, hour) for hour in range(3)]
+    scores = [np.where(np.arange(len(f.tweets)) % 4 == 0, np.nan, 0.5) for f in files]
+    hour_ids.add(files[0], scores[0])
+    hour_ids.add(files[1])
+    hour_ids.add(files[2], scores[2])
+    assert len(hour_ids) == 3
+
+    for hour, (date_name, tweets_df, len_tweets, len_all_tweets) in enumerate(hour_ids):
+        tweet_file = files[hour]
+        assert date_name == tweet_file.date_name
+        assert (len_tweets, len_all_tweets) == (tweet_file.get_len_tweets(), tweet_file.get_len_all_tweets())
+        np.testing.assert_array_equal(tweets_df["tweet_id"], tweet_file.tweets["tweet_id"])
+        np.testing.assert_array_equal(tweets_df["user_id"], tweet_file.tweets["user_id"])
+        if hour == 1:
+            assert "score" not in tweets_df
+        else:
+            np.testing.assert_array_equal(tweets_df["score"], scores[hour])
+
+    if spill:
+        assert len(os.listdir(tmp_path / "spill")) == 5
+        hour_ids.cleanup()
+        assert os.listdir(tmp_path / "spill") == []
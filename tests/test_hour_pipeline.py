@@ -0,0 +1,33 @@
+import argparse
+import numpy as np
+import pandas as pd
+
+from synthetic_data import StandInEmbedding, StandInClassifier
+from scoring_service import BatchingScorer
+from main_hour_pipeline import score_tweets
+
+
+class LocalClient:
+    """
+    Stand-in for a ScoringClient that scores with a BatchingScorer in the same process
+    """
+
+    def __init__(self, scorer):
+        self.scorer = scorer
+
+    def score(self, texts):
+        return np.array(self.scorer.score(list(texts), timeout=10), dtype=np.float64)
+
+
+def test_client_mode_equals_local_models():
+    tweets_df = pd.DataFrame({"text": ["storm is here", None, "http://t.co/abc123", "happy to be home", "lights back"],
+                              "lang": ["en", "en", "en", "en", "fr"]})
+    local = argparse.Namespace(emb_model=StandInEmbedding(), clf_model=StandInClassifier(), scoring_client=None,
+                               batch_size=100, score_digits=6)
+    scores = score_tweets(tweets_df, local)
+    assert np.isnan(scores[[1, 2]]).all() and not np.isnan(scores[[0, 3, 4]]).any()
+
+    scorer = BatchingScorer(StandInEmbedding(), StandInClassifier(), max_latency=0.01)
+    client = argparse.Namespace(scoring_client=LocalClient(scorer), score_digits=6)
+    np.testing.assert_array_equal(score_tweets(tweets_df, client), scores)
+    scorer.close()
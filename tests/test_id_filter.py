@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+
+from utils.id_filter import BloomFilter, IdFilter, load_id_filter, read_ids
+
+
+def user_ids(n, seed=0):
+    return 10**9 + np.random.default_rng(seed).integers(0, 10**12, n)
+
+
+def test_id_filter_is_exact():
+    ids = user_ids(1000)
+    queries = np.concatenate([ids[::3], user_ids(1000, seed=1), [-1, 0, np.iinfo(np.int64).max]])
+    np.testing.assert_array_equal(IdFilter(ids).contains(queries), np.isin(queries, ids))
+    assert not IdFilter([]).contains(queries).any()
+
+
+def test_bloom_has_no_false_negatives():
+    ids = user_ids(20000)
+    bloom = BloomFilter.from_ids(ids, error_rate=0.01)
+    assert bloom.contains(ids).all()
+
+    others = np.setdiff1d(user_ids(50000, seed=1), ids)
+    assert bloom.contains(others).mean() < 0.02
+
+
+def test_bloom_save_load(tmp_path):
+    ids = user_ids(500)
+    bloom = BloomFilter.from_ids(ids)
+    path = str(tmp_path / "users.bloom.npz")
+    bloom.save(path)
+
+    loaded = load_id_filter(path, "user_id")
+    assert (loaded.n_bits, loaded.n_hashes) == (bloom.n_bits, bloom.n_hashes)
+    queries = np.concatenate([ids, user_ids(500, seed=1)])
+    np.testing.assert_array_equal(loaded.contains(queries), bloom.contains(queries))
+
+
+def test_read_ids_keeps_users_with_a_location(tmp_path):
+    folder = tmp_path / "users"
+    folder.mkdir()
+    pd.DataFrame({"user_id": [3, 1, 2, 1], "inferred loc": ["['NJ']", "[]", None, "['LA']"]}).to_csv(folder / "a.csv")
+    pd.DataFrame({"user_id": [5, 3]}).to_csv(folder / "b.csv")
+    np.savetxt(tmp_path / "ids.txt", [7, 5, 7], fmt="%d")
+
+    np.testing.assert_array_equal(read_ids(str(folder), "user_id"), [1, 3, 5])
+    np.testing.assert_array_equal(read_ids(str(tmp_path / "ids.txt"), "user_id"), [5, 7])
+    assert isinstance(load_id_filter(str(folder), "user_id"), IdFilter)
+    assert isinstance(load_id_filter(str(folder), "user_id", bloom=True), BloomFilter)
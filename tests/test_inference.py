@@ -0,0 +1,78 @@
+import re
+import numpy as np
+import pandas as pd
+import pytest
+
+from inference import Inference, location_key
+
+SHEET = pd.DataFrame({
+    "Name": ["Louisiana", "New Jersey", "Newark, NJ", "Crowley, LA"],
+    "city": [None, None, "Newark", "Crowley"],
+    "regex": [r"(?i:Louisiana)|\bLA\b", r"^ NJ\b|(?i:New Jersey)", "(?i:Newark)", r"(?i:Crowley),?\s((?i:LA\b)|(?i:Louisiana))"],
+})
+
+LOCATIONS = ["Newark", "  Newark ", "newark", "Crowley, LA", "Crowley", np.nan, None, "", "New Jersey", "LA",
+             "Newark", np.nan, " NJ"]
+
+
+@pytest.fixture
+def sheet_path(tmp_path):
+    path = tmp_path / "Location_test.xlsx"
+    SHEET.to_excel(path, index=False)
+    return str(path)
+
+
+def users(locations):
+    return pd.DataFrame({"user_id": np.arange(len(locations)), "location": np.array(locations, dtype=object)})
+
+
+def brute_force(location):
+    if not isinstance(location, str):
+        return []
+    for name, regex in zip(SHEET["Name"], SHEET["regex"]):
+        if re.search(regex, location):
+            return [name]
+    return []
+
+
+def test_find_location_equals_brute_force(sheet_path):
+    df = Inference(sheet_path).find_location(users(LOCATIONS))
+    assert list(df["user_id"]) == list(range(len(LOCATIONS)))
+    assert list(df["inferred loc"]) == [brute_force(location) for location in LOCATIONS]
+
+
+def test_whitespace_does_not_depend_on_row_order(sheet_path):
+    # The regex for New Jersey anchors on a leading space, so "NJ" and " NJ" have a different match
+    variants = ["NJ", " NJ", "NJ ", " NJ ", "Newark", " Newark", "Newark  ", "\tCrowley, LA", "Crowley,  LA", "LA "]
+    locations = np.array(variants * 5, dtype=object)
+    inference = Inference(sheet_path)
+    for seed in range(5):
+        shuffled = np.random.default_rng(seed).permutation(locations)
+        df = inference.find_location(users(shuffled))
+        expected = [inference.find_location_row(row, not_found=[])["inferred loc"] for _, row in users(shuffled).iterrows()]
+        assert list(df["inferred loc"]) == expected
+    assert inference.find_location(users(["NJ", " NJ"]))["inferred loc"].tolist() == [[], ["New Jersey"]]
+    assert location_key(" NJ") == " NJ" and location_key(np.nan) is None
+
+
+def test_persistent_cache(sheet_path, tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / "cache")
+    first = Inference(sheet_path, cache_dir=cache_dir).find_location(users(LOCATIONS))
+
+    inference = Inference(sheet_path, cache_dir=cache_dir)
+    assert len(inference.cache) == len({location_key(loc) for loc in LOCATIONS} - {None})
+
+    # All locations are cached: nothing is matched and the cache file is not written again
+    saves = []
+    monkeypatch.setattr(inference, "save_cache", lambda: saves.append(1))
+    monkeypatch.setattr(inference, "match_locations", lambda locations: pytest.fail("cached locations matched"))
+    second = inference.find_location(users(LOCATIONS))
+    assert saves == []
+    assert list(second["inferred loc"]) == list(first["inferred loc"])
+
+
+def test_workers_give_the_same_result(sheet_path):
+    locations = LOCATIONS * 20 + ["Crowley Louisiana {}".format(ind) for ind in range(50)]
+    single = Inference(sheet_path).find_location(users(locations))
+    sharded = Inference(sheet_path, workers=2).find_location(users(locations))
+    assert list(sharded["inferred loc"]) == list(single["inferred loc"])
@@ -0,0 +1,62 @@
+import re
+import numpy as np
+import pytest
+
+import utils.keyword_filter as keyword_filter
+from utils.keyword_filter import KeywordFilter, fold, is_literal
+
+TEXTS = ["Storm warning for Houston", "the stormy night", "FLOOD in the city", "no match here", "",
+         "İstanbul storm", "İİİ flood", "flooding", "a Hurricane-Ida update", "hurricane ida"]
+
+
+def reference(keywords, texts, ignore_case, whole_words):
+    """
+    One regex search per keyword and text, like the original keyword selection
+    """
+    flags = re.IGNORECASE if ignore_case else 0
+    mask = []
+    for text in texts:
+        found = False
+        for kw in keywords:
+            pattern = kw if not is_literal(kw) else re.escape(kw)
+            if whole_words:
+                pattern = r"\b(?:{})\b".format(pattern)
+            found = found or re.search(pattern, text, flags) is not None
+        mask.append(found)
+    return np.array(mask)
+
+
+@pytest.fixture(params=["automaton", "regex"])
+def backend(request, monkeypatch):
+    if request.param == "automaton":
+        pytest.importorskip("ahocorasick")
+    else:
+        # Without pyahocorasick all keywords go through the regex
+        monkeypatch.setattr(KeywordFilter, "build_automaton", lambda self, literals: None)
+    return request.param
+
+
+@pytest.mark.parametrize("ignore_case", [False, True])
+@pytest.mark.parametrize("whole_words", [False, True])
+def test_match_equals_regex_reference(backend, ignore_case, whole_words):
+    keywords = ["storm", "flood", r"hurricane.ida", "city"]
+    matcher = KeywordFilter(keywords, ignore_case=ignore_case, whole_words=whole_words)
+    np.testing.assert_array_equal(matcher.match(TEXTS), reference(keywords, TEXTS, ignore_case, whole_words))
+    assert [matcher.search(text) for text in TEXTS] == list(reference(keywords, TEXTS, ignore_case, whole_words))
+
+
+def test_whole_words_after_dotted_capital_i(backend):
+    # "İ".lower() is two characters long; the word boundaries must still be checked at the right offsets
+    matcher = KeywordFilter(["ida"], ignore_case=True, whole_words=True)
+    assert list(matcher.match(["İİİ ida", "İİİida", "İİİ idaho", "İda"])) == [True, False, False, True]
+
+
+def test_fold_keeps_length():
+    text = "İstanbul ıi ſ ABC"
+    assert len(fold(text)) == len(text)
+    assert fold(text) == "istanbul ii s abc"
+
+
+def test_regex_meta_is_shared():
+    import location_matcher
+    assert location_matcher.REGEX_META is keyword_filter.REGEX_META
@@ -0,0 +1,103 @@
+import re
+import numpy as np
+import pandas as pd
+import pytest
+
+from location_matcher import LocationMatcher, literal_key
+
+CITIES = ["Jamesburg", "Crowley", "New Orleans", "St. Louis", "Houma", "Ida", "Newark"]
+
+
+def location_sheet():
+    """
+    Regex sheet in the format of prepare_files.setup_regex_files: states without a city, (?i:City) for unique cities
+    and (?i:City),?\\s((?i:LA\\b)|(?i:Louisiana)) for the others
+    """
+    rows = [("Louisiana", None, r"(?i:Louisiana)|\bLA\b"), ("New Jersey", None, r"(?i:New Jersey)|\bNJ\b")]
+    for ind, city in enumerate(CITIES):
+        if ind % 2 == 0:
+            rows.append((city + ", LA", city, "(?i:{})".format(city)))
+        else:
+            rows.append((city + ", LA", city, r"(?i:{}),?\s((?i:LA\b)|(?i:Louisiana))".format(city)))
+    return pd.DataFrame(rows, columns=["Name", "city", "regex"])
+
+
+LOCATIONS = ["Jamesburg", "jamesburg, nj", "Crowley LA", "crowley", "Crowley, louisiana", "NEW ORLEANS", "St. Louis",
+             "st louis", "Houma 🌴", "near İda", "ıda", "Newark, LA", "Newark", "NJ", "somewhere", "", "the LA area",
+             "Baton Rouge, LA", "ID: Ida"]
+
+
+def brute_force(names, location):
+    for name, regex in zip(names["Name"], names["regex"]):
+        if re.search(regex, location):
+            return name
+    return None
+
+
+@pytest.fixture(params=["automaton", "prefix"])
+def backend(request, monkeypatch):
+    if request.param == "automaton":
+        pytest.importorskip("ahocorasick")
+    else:
+        monkeypatch.setattr(LocationMatcher, "build_automaton", lambda self: None)
+    return request.param
+
+
+def test_match_equals_brute_force(backend):
+    names = location_sheet()
+    matcher = LocationMatcher(names, verbose=False)
+    assert matcher.match_all(LOCATIONS) == [brute_force(names, location) for location in LOCATIONS]
+
+
+def test_literal_keys():
+    names = location_sheet()
+    matcher = LocationMatcher(names, verbose=False)
+    # The states have no city and "St. Louis" contains a regex character: those are checked for every location
+    assert [names["Name"][ind] for ind in matcher.always] == ["Louisiana", "New Jersey", "St. Louis, LA"]
+    assert set(matcher.key_inds) == {city.lower() for city in CITIES if city != "St. Louis"}
+    assert matcher.candidates("somewhere") == matcher.always
+
+
+def test_literal_key_rules():
+    assert literal_key("Crowley", r"(?i:Crowley),?\s((?i:LA\b)|(?i:Louisiana))") == "crowley"
+    assert literal_key("Crowley", r"(?i:Crowley)|\bLA\b") is None # The city is not required for a match
+    assert literal_key("Crowley", r"\bCrowley\b") is None
+    assert literal_key(np.nan, "(?i:Crowley)") is None
+    assert literal_key("Cañon City", "(?i:Cañon City)") is None
+    for quantifier in ["?", "*", "+", "{0,1}"]:
+        assert literal_key("Crowley", r"(?i:Crowley)" + quantifier + r",?\sLA\b") is None
+
+
+def test_optional_city_is_not_prefiltered(backend):
+    rows = [("Houma, LA", "Houma", r"(?i:Houma)?,?\s(?i:Terrebonne)"), ("Crowley, LA", "Crowley", r"(?i:Crowley){0,1}\sLA\b"),
+            ("Kenner, LA", "Kenner", r"(?i:Kenner)*Jefferson"), ("Newark, NJ", "Newark", "(?i:Newark)")]
+    names = pd.DataFrame(rows, columns=["Name", "city", "regex"])
+    matcher = LocationMatcher(names, verbose=False)
+    assert set(matcher.key_inds) == {"newark"}
+    locations = ["in terrebonne", "Houma, Terrebonne", "near LA", "Crowley LA", "Jefferson parish", "Newark", "nowhere"]
+    matched = matcher.match_all(locations)
+    assert matched == [brute_force(names, location) for location in locations]
+    assert matched[:3] == ["Houma, LA", "Houma, LA", "Crowley, LA"]
+
+
+def test_without_city_column():
+    names = location_sheet().drop(columns="city")
+    matcher = LocationMatcher(names, verbose=False)
+    assert len(matcher.always) == len(names)
+    assert matcher.match_all(LOCATIONS) == [brute_force(names, location) for location in LOCATIONS]
+
+
+def test_synthetic_sheet_has_literal_keys(tmp_path, backend):
+    import synthetic_data
+    path = str(tmp_path / "Location_names.xlsx")
+    synthetic_data.generate_location_names(path, n_extra=20)
+    names = pd.read_excel(path)
+    assert list(names.columns) == ["Name", "city", "state", "state_abbrev", "regex"]
+
+    matcher = LocationMatcher(names, verbose=False)
+    assert matcher.always == []
+    assert len(matcher.key_inds) == len(names)
+    locations = list(synthetic_data.random_users(300, 300)["location"]) + ["Jackson, MS", "jackson mississippi"]
+    matched = matcher.match_all(locations)
+    assert matched == [brute_force(names, location) for location in locations]
+    assert "New Orleans" in matched and "Jackson, MS" in matched
@@ -0,0 +1,109 @@
+import json
+import pytest
+
+from utils import metrics as metrics_module
+from utils.metrics import Metrics, get_metrics
+
+
+class Clock:
+    """
+    Stand-in for time.perf_counter that only moves when advanced
+    """
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(metrics_module.time, "perf_counter", clock)
+    return clock
+
+
+def read_records(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_records_per_file(tmp_path, clock):
+    path = str(tmp_path / "metrics" / "run.jsonl")
+    metrics = Metrics(path, run_name="imputer")
+    with metrics.file("2021-08-29_00_00_01.txt.gz"):
+        with metrics.stage("read"):
+            clock.advance(2)
+        with metrics.stage("encode"):
+            clock.advance(1)
+            # A stage run more than once per file is added up
+            with metrics.stage("read"):
+                clock.advance(0.5)
+        clock.advance(0.25)
+        metrics.count("rows_in", 10)
+        metrics.count("rows_in", 5)
+        metrics.count("failed_files")
+
+    with pytest.raises(KeyError):
+        with metrics.file("2021-08-29_01_00_01.txt.gz"):
+            with metrics.stage("read"):
+                clock.advance(1)
+            metrics.count("rows_in", 3)
+            raise KeyError("id")
+
+    first, second = read_records(path)
+    assert set(first) >= {"run", "file", "start", "stages", "counts", "seconds", "rss_mb", "peak_rss_mb"}
+    assert (first["run"], first["file"]) == ("imputer", "2021-08-29_00_00_01.txt.gz")
+    assert first["stages"] == {"read": 2.5, "encode": 1.5}
+    assert first["counts"] == {"rows_in": 15, "failed_files": 1}
+    assert first["seconds"] == 3.75
+    # The record of a file that raised is written as well, and the counts start from zero
+    assert (second["stages"], second["counts"], second["seconds"]) == ({"read": 1}, {"rows_in": 3}, 1)
+    assert metrics.n_files == 2 and metrics.record is None
+
+
+def test_summary_totals(tmp_path, clock, capsys):
+    path = str(tmp_path / "run.jsonl")
+    metrics = Metrics(path, run_name="aggregator")
+    for name in ["a", "b"]:
+        with metrics.file(name):
+            with metrics.stage("merge"):
+                clock.advance(1.5)
+            metrics.count("rows_out", 4)
+    # Stages and counts outside of a file go to the record of the run
+    with metrics.stage("infer"):
+        clock.advance(3)
+    metrics.count("users", 7)
+    assert len(read_records(path)) == 2
+
+    metrics.summary()
+    records = read_records(path)
+    run = records[-1]
+    assert run["file"] == "<run>" and run["stages"] == {"infer": 3} and run["counts"] == {"users": 7}
+    assert run["seconds"] == 6
+    assert metrics.stage_totals == {"merge": [3, 2], "infer": [3, 1]}
+    assert metrics.count_totals == {"rows_out": 8, "users": 7}
+    out = capsys.readouterr().out
+    assert "Metrics aggregator: 2 files" in out and "rows_out" in out
+
+    # A second summary without new stages does not write another run record
+    metrics.summary()
+    assert len(read_records(path)) == 3
+
+
+def test_disabled_metrics_record_nothing(tmp_path, capsys):
+    path = str(tmp_path / "run.jsonl")
+    metrics = Metrics(path, enabled=False)
+    with metrics.file("a"):
+        with metrics.stage("read"):
+            pass
+        metrics.count("rows_in", 3)
+    metrics.summary()
+    assert not (tmp_path / "run.jsonl").exists() and capsys.readouterr().out == ""
+    assert metrics.stage_totals == {} and metrics.n_files == 0
+
+    assert not get_metrics(object()).enabled
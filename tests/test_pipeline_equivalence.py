@@ -0,0 +1,91 @@
+import os
+import sys
+import runpy
+import argparse
+import pandas as pd
+import pytest
+
+import synthetic_data
+from synthetic_data import StandInEmbedding, StandInClassifier
+from main_sentiment_imputer import imputer
+from main_affected_tweets import affect_tweets_worldgeo, affect_tweets_oneperc
+from main_hour_pipeline import pipeline_worldgeo, pipeline_oneperc
+from utils.results_store import results_file_path
+
+YEAR = "2021"
+AGGREGATOR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "project_ida",
+                          "main_senti_aggregator.py")
+FULL_STATES = {"north": ["New Jersey, USA"], "south": ["Louisiana, USA", "Mississippi, USA"]}
+AREAS = {"worldgeo": ["full_country", "north", "south"], "onepercent": ["north", "south"]}
+
+
+@pytest.fixture
+def aff_cities_path(tmp_path):
+    path = tmp_path / "aff"
+    os.makedirs(path / "Ida_files")
+    pd.DataFrame({"city_and_abbrev": ["Newark, NJ", "Jersey City, NJ"]}).to_csv(path / "Ida_files" / "north.csv")
+    pd.DataFrame({"city_and_abbrev": ["New Orleans, LA", "Houma, LA"]}).to_csv(path / "Ida_files" / "south.csv")
+    synthetic_data.generate_location_names(str(path / "regex_files" / "Location_north.xlsx"), n_extra=50, seed=1)
+    synthetic_data.generate_location_names(str(path / "regex_files" / "Location_south.xlsx"), n_extra=50, seed=2)
+    return str(path)
+
+
+def make_args(tmp_path, aff_cities_path, stream, names):
+    return argparse.Namespace(tweet_type=stream, areas=AREAS[stream], country="United States",
+                              aff_cities_path=aff_cities_path, file_names=names, index_path="", workers=1,
+                              loc_cache_path=str(tmp_path / "location_cache"), spill_dir="", users_spill_path="",
+                              debug_path="", emb_model=StandInEmbedding(), clf_model=StandInClassifier(),
+                              scoring_client=None, batch_size=100, score_digits=6)
+
+
+def run_separate_scripts(args, tmp_path, tweets_folder_path):
+    """
+    main_sentiment_imputer.py, main_affected_tweets.py and main_senti_aggregator.py one after the other
+    """
+    stream = args.tweet_type
+    imputer_args = argparse.Namespace(**vars(args), data_path=os.path.dirname(tweets_folder_path),
+                                      output_path=str(tmp_path / "sentiment_scores"), output_format="csv",
+                                      score_index_path="", user_filter=None, tweet_filter=None)
+    for name in args.file_names:
+        imputer(name, YEAR, imputer_args)
+
+    out_paths = {area: str(tmp_path / "affect_tweets" / stream / YEAR / area) for area in args.areas}
+    for out_path in out_paths.values():
+        os.makedirs(os.path.join(out_path, "tweets"))
+        os.makedirs(os.path.join(out_path, "stats"))
+    if stream == "onepercent":
+        affect_tweets_oneperc(args, tweets_folder_path, out_paths)
+    else:
+        affect_tweets_worldgeo(args, tweets_folder_path, out_paths, FULL_STATES)
+
+    argv = sys.argv
+    sys.argv = [AGGREGATOR, "--senti_scores_path", str(tmp_path / "sentiment_scores"),
+                "--aff_tweets_path", str(tmp_path / "affect_tweets"), "--output_path", str(tmp_path / "separate"),
+                "--years", YEAR, "--tweet_type", stream, "--areas"] + args.areas
+    try:
+        runpy.run_path(AGGREGATOR, run_name="__main__")
+    finally:
+        sys.argv = argv
+    return {area: pd.read_csv(results_file_path(str(tmp_path / "separate" / stream / YEAR / area), area), index_col=0)
+            for area in args.areas}
+
+
+@pytest.mark.parametrize("stream", ["worldgeo", "onepercent"])
+def test_hour_pipeline_equals_separate_scripts(tmp_path, aff_cities_path, stream):
+    tweets_folder_path = str(tmp_path / "raw" / stream / YEAR)
+    names = synthetic_data.generate_raw_hours(tweets_folder_path, stream, n_hours=3, tweets_per_hour=400, n_users=300)
+    args = make_args(tmp_path, aff_cities_path, stream, names)
+
+    separate = run_separate_scripts(args, tmp_path, tweets_folder_path)
+    if stream == "onepercent":
+        fused = pipeline_oneperc(args, YEAR, tweets_folder_path)
+    else:
+        fused = pipeline_worldgeo(args, YEAR, tweets_folder_path, FULL_STATES)
+
+    for area in args.areas:
+        fused_df = fused[area].to_frame()
+        assert len(fused_df) == len(names) and (fused_df["count"] > 0).all()
+        # Same hours, means and standardized means in the all_means_<area>.csv files
+        path = results_file_path(str(tmp_path / "fused" / stream / YEAR / area), area)
+        fused[area].save(path)
+        pd.testing.assert_frame_equal(pd.read_csv(path, index_col=0), separate[area], check_exact=False, rtol=1e-9)
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+
+import synthetic_data
+from place_lookup import PlaceAreaLookup
+
+AFF_CITIES = {"north": pd.DataFrame({"city_and_abbrev": ["Newark, NJ", "Jersey City, NJ"]}),
+              "south": pd.DataFrame({"city_and_abbrev": ["New Orleans, LA", "Houma, LA"]})}
+FULL_STATES = {"north": ["New Jersey, USA"], "south": ["Louisiana, USA", "Mississippi, USA"]}
+
+
+def reference(country_df, area):
+    """
+    The per-area selection of main_affected_tweets.py before the lookup: affected cities by name, plus the tweets
+    tagged with a fully affected state
+    """
+    if area == "full_country":
+        return country_df["tweet_id"].tolist()
+    is_city = (country_df["type"] == "city") & country_df["full_name"].isin(AFF_CITIES[area]["city_and_abbrev"])
+    is_state = (country_df["type"] == "admin") & country_df["full_name"].isin(FULL_STATES[area])
+    return country_df["tweet_id"][is_city | is_state].tolist()
+
+
+def country_tweets(n_tweets=500, seed=0):
+    rng = np.random.default_rng(seed)
+    places = [place for place in synthetic_data.PLACES if place[2] == "United States"]
+    places += [("city", "Houma, LA", "United States"), ("admin", "Mississippi, USA", "United States"),
+               ("poi", "Newark, NJ", "United States"), (None, None, "United States")]
+    rows = [places[ind] for ind in rng.integers(0, len(places), n_tweets)]
+    return pd.DataFrame({"tweet_id": np.arange(n_tweets), "type": [row[0] for row in rows],
+                         "full_name": [row[1] for row in rows]})
+
+
+def test_classify_equals_reference():
+    areas = ["full_country", "north", "south"]
+    lookup = PlaceAreaLookup(areas, AFF_CITIES, FULL_STATES)
+    for seed in range(3):
+        country_df = country_tweets(seed=seed)
+        masks = lookup.classify(country_df)
+        for area in areas:
+            assert country_df["tweet_id"][lookup.in_area(masks, area)].tolist() == reference(country_df, area)
+
+
+def test_places_are_cached():
+    lookup = PlaceAreaLookup(["north", "south"], AFF_CITIES, FULL_STATES)
+    lookup.classify(country_tweets(seed=0))
+    n_places = len(lookup.cache)
+    lookup.classify(country_tweets(seed=1))
+    assert len(lookup.cache) == n_places
+    assert lookup.cache[("city", "Newark, NJ")] == lookup.bits["north"]
+    assert lookup.cache[("poi", "Newark, NJ")] == 0
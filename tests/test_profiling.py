@@ -0,0 +1,64 @@
+import os
+import time
+import argparse
+import pstats
+import numpy as np
+import pytest
+
+import synthetic_data
+from utils import data_read_in
+from utils.metrics import Metrics
+from utils.profiling import add_profile_args, make_profiler
+
+
+def clean_texts(seconds=0.3):
+    """
+    Call the hot clean_for_content for at least the given time, so the sampler catches it
+    """
+    rng = np.random.default_rng(0)
+    texts = [synthetic_data.random_text(rng) for _ in range(200)]
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        for text in texts:
+            data_read_in.clean_for_content(text, "en")
+
+
+def profile_files(out_dir, ext):
+    return {name: os.path.getsize(os.path.join(out_dir, name)) for name in os.listdir(out_dir) if name.endswith(ext)}
+
+
+def test_add_profile_args():
+    parser = argparse.ArgumentParser()
+    add_profile_args(parser)
+    args = parser.parse_args([])
+    assert (args.profile, args.profile_path, args.profile_interval) == ("", "", 0.005)
+    assert make_profiler(args, "imputer", "unused") is None
+    args = parser.parse_args(["--profile", "sample", "--profile_interval", "0.001"])
+    assert (args.profile, args.profile_interval) == ("sample", 0.001)
+    with pytest.raises(ValueError):
+        make_profiler(argparse.Namespace(profile="line"), "imputer", "unused")
+
+
+@pytest.mark.parametrize("mode, ext", [("cprofile", ".prof"), ("sample", ".collapsed")])
+def test_profile_files_are_written(tmp_path, mode, ext):
+    args = argparse.Namespace(profile=mode, profile_path=str(tmp_path / "profiles"), profile_interval=0.001)
+    original = data_read_in.clean_for_content
+    metrics = Metrics(run_name="imputer", profiler=make_profiler(args, "imputer", "unused"))
+    (out_dir,) = [str(path) for path in (tmp_path / "profiles").iterdir()]
+    assert os.path.basename(out_dir).startswith("imputer_")
+
+    with metrics.file("2021-08-29_00_00_01.txt.gz"):
+        clean_texts()
+    metrics.summary()
+
+    files = profile_files(out_dir, ext)
+    assert set(files) == {"2021-08-29_00_00_01.txt.gz" + ext, "all" + ext}
+    assert all(size > 0 for size in files.values())
+    if mode == "cprofile":
+        functions = [func for _, _, func in pstats.Stats(os.path.join(out_dir, "all.prof")).stats]
+        assert "clean_for_content" in functions
+        # The wrappers are removed when the run ends
+        assert data_read_in.clean_for_content is original
+    else:
+        with open(os.path.join(out_dir, "all.collapsed")) as f:
+            assert all("clean_for_content (data_read_in.py" in line for line in f)
@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.results_store import HourlyResults, results_file_path
+
+DATE_NAMES = ["2021-08-29_0{}_00_01".format(hour) for hour in range(4)]
+
+
+def hour_scores(seed):
+    scores = np.random.default_rng(seed).random(20 + seed)
+    scores[::7] = np.nan
+    return scores
+
+
+def baseline_means(tmp_path):
+    """
+    all_means_<area>.csv as compiled by the original comp_single_file from the per-hour mean files
+    """
+    means = [np.nanmean(hour_scores(seed)) for seed in range(len(DATE_NAMES))]
+    standardized = [(mean - np.nanmean(means)) / np.nanstd(means) for mean in means]
+    path = tmp_path / "baseline.csv"
+    pd.DataFrame({"base_name": ["aggr_score_{}.csv".format(name) for name in DATE_NAMES], "mean": means,
+                  "standardized": standardized}).to_csv(path)
+    return pd.read_csv(path)
+
+
+def fill(results, date_names=DATE_NAMES):
+    for seed, date_name in enumerate(DATE_NAMES):
+        if date_name in date_names:
+            results.add(date_name, hour_scores(seed))
+    return results
+
+
+def test_csv_matches_the_original_file(tmp_path):
+    path = results_file_path(str(tmp_path / "out"), "north", "csv")
+    assert path.endswith("all_means_north.csv")
+    fill(HourlyResults()).save(path)
+
+    written = pd.read_csv(path)
+    expected = baseline_means(tmp_path)
+    assert list(written.columns) == list(expected.columns)
+    assert list(written["base_name"]) == list(expected["base_name"])
+    np.testing.assert_allclose(written[["mean", "standardized"]], expected[["mean", "standardized"]])
+
+
+def test_csv_can_not_be_appended(tmp_path):
+    path = results_file_path(str(tmp_path), "north", "csv")
+    fill(HourlyResults()).save(path)
+    with pytest.raises(ValueError):
+        fill(HourlyResults()).save(path, append=True)
+
+
+def test_moments():
+    df = fill(HourlyResults()).to_frame()
+    for seed, row in df.iterrows():
+        scores = hour_scores(seed)
+        assert row["count"] == np.sum(~np.isnan(scores))
+        assert row["mean"] == pytest.approx(np.nanmean(scores))
+        assert row["std"] == pytest.approx(np.nanstd(scores))
+    assert list(df[["year", "month", "day", "hour"]].iloc[1]) == [2021, 8, 29, 1]
+
+
+def test_parquet_append(tmp_path):
+    pytest.importorskip("pyarrow")
+    path = results_file_path(str(tmp_path), "south", "parquet")
+    fill(HourlyResults(), DATE_NAMES[:2]).save(path)
+    fill(HourlyResults(), DATE_NAMES[1:]).save(path, append=True)
+    pd.testing.assert_frame_equal(pd.read_parquet(path), fill(HourlyResults()).to_frame())
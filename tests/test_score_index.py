@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+
+from utils.score_index import ScoreIndex, write_score_index
+
+
+def hour_scores(seed, n_tweets=200):
+    rng = np.random.default_rng(seed)
+    ids = 1430000000000000000 + seed * 10**12 + rng.permutation(n_tweets * 3)[:n_tweets]
+    return pd.DataFrame({"message_id": ids, "user_id": rng.integers(0, 50, n_tweets),
+                         "score": np.round(rng.random(n_tweets), 6)})
+
+
+def test_lookup_equals_merge(tmp_path):
+    index_path = str(tmp_path)
+    frames = {"2021-08-29_0{}_00_01".format(hour): hour_scores(hour) for hour in range(3)}
+    for date_name, df in frames.items():
+        write_score_index(df, index_path, date_name)
+    write_score_index(hour_scores(9, 0), index_path, "2021-08-29_09_00_01")
+
+    index = ScoreIndex(index_path)
+    assert index.date_names() == sorted(list(frames) + ["2021-08-29_09_00_01"])
+    assert index.has("2021-08-29_01_00_01") and not index.has("2021-08-29_05_00_01")
+
+    date_name = "2021-08-29_01_00_01"
+    df = frames[date_name]
+    rng = np.random.default_rng(0)
+    tweet_ids = np.concatenate([rng.choice(df["message_id"], 50), [1, 2, 10**18 + 7]])
+    expected = pd.DataFrame({"tweet_id": tweet_ids}).merge(df, left_on="tweet_id", right_on="message_id")
+
+    found = index.lookup_frame(tweet_ids, date_name)
+    np.testing.assert_array_equal(found["message_id"], expected["message_id"])
+    np.testing.assert_allclose(found["score"], expected["score"], rtol=1e-6)
+
+    # Every partition is searched when no date name is given; unknown ids get NaN
+    scores = index.lookup(np.concatenate([frames["2021-08-29_00_00_01"]["message_id"][:5], [3]]))
+    np.testing.assert_allclose(scores[:5], frames["2021-08-29_00_00_01"]["score"][:5], rtol=1e-6)
+    assert np.isnan(scores[5])
@@ -0,0 +1,55 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.score_io import find_score_file, read_scores, score_file_path, scores_year_path, write_scores
+
+STEM = "sentiment_2021-08-29_00_00_01"
+
+
+def scores_df(n_tweets=100, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({"message_id": 1430000000000000000 + rng.permutation(10**6)[:n_tweets],
+                         "user_id": 10**9 + rng.integers(0, 10**6, n_tweets),
+                         "score": np.round(rng.random(n_tweets), 6)})
+
+
+@pytest.mark.parametrize("output_format", ["csv", "parquet", "feather"])
+def test_round_trip(tmp_path, output_format):
+    if output_format != "csv":
+        pytest.importorskip("pyarrow")
+    root = str(tmp_path / "worldgeo")
+    df = scores_df()
+    file_path = score_file_path(root, "2021", 8, STEM, output_format)
+    write_scores(df, file_path, output_format)
+    assert find_score_file(root, "2021", 8, STEM, default_ext=".csv") == file_path
+
+    read = read_scores(file_path)
+    np.testing.assert_array_equal(read["message_id"], df["message_id"])
+    assert read["message_id"].dtype == np.int64 and read["score"].dtype == np.float64
+    # The columnar formats store the scores as float32
+    np.testing.assert_allclose(read["score"], df["score"], rtol=1e-6)
+
+    read = read_scores(file_path, columns=["message_id", "score"])
+    assert list(read.columns) == ["message_id", "score"]
+
+
+def test_paths(tmp_path):
+    root = str(tmp_path)
+    assert score_file_path(root, "2021", 8, STEM, "parquet") == os.path.join(root, "year=2021", "month=08",
+                                                                             STEM + ".parquet")
+    assert scores_year_path(root, "2021") == os.path.join(root, "2021")
+    os.makedirs(os.path.join(root, "year=2021"))
+    assert scores_year_path(root, "2021") == os.path.join(root, "year=2021")
+    with pytest.raises(ValueError):
+        score_file_path(root, "2021", 8, STEM, "json")
+
+
+def test_rows_without_message_id_are_dropped(tmp_path):
+    file_path = str(tmp_path / (STEM + ".csv"))
+    with open(file_path, "w") as f:
+        f.write(",message_id,user_id,score\n0,1430000000000000001,7,0.5\n1,,8,0.25\n2,1430000000000000003,9,0.75\n")
+    read = read_scores(file_path)
+    assert list(read["message_id"]) == [1430000000000000001, 1430000000000000003]
+    assert list(read["score"]) == [0.5, 0.75]
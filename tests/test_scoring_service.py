@@ -0,0 +1,121 @@
+import time
+import argparse
+import threading
+import numpy as np
+import pytest
+
+import synthetic_data
+from synthetic_data import StandInEmbedding, StandInClassifier
+from scoring_service import BatchingScorer, make_server
+from utils.scoring_client import ScoringClient, ScoringServiceError
+
+
+class FailingClassifier(StandInClassifier):
+    def predict_proba(self, embeddings):
+        raise MemoryError("out of memory")
+
+
+def texts(n, seed):
+    rng = np.random.default_rng(seed)
+    return [synthetic_data.random_text(rng) for _ in range(n)]
+
+
+def direct_scores(texts):
+    return StandInClassifier().predict_proba(StandInEmbedding().encode(texts))[:, 1]
+
+
+@pytest.fixture
+def service():
+    """
+    Start a service on a free port; yields a function that returns the url for a scorer
+    """
+    servers = []
+
+    def start(scorer):
+        server = make_server(scorer, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append((server, scorer))
+        return "http://127.0.0.1:{}".format(server.server_address[1])
+
+    yield start
+    for server, scorer in servers:
+        server.shutdown()
+        server.server_close()
+        scorer.close()
+
+
+def test_concurrent_clients_equal_direct_scores(service):
+    scorer = BatchingScorer(StandInEmbedding(), StandInClassifier(), batch_size=64, max_latency=0.02)
+    url = service(scorer)
+    inputs = [texts(120 + 10 * client, seed=client) for client in range(4)]
+    results = [None] * 4
+
+    def run(client):
+        results[client] = ScoringClient(url, request_size=25).score(inputs[client])
+
+    threads = [threading.Thread(target=run, args=(client,)) for client in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for client in range(4):
+        np.testing.assert_allclose(results[client], direct_scores(inputs[client]), rtol=1e-6)
+    stats = ScoringClient(url).stats()
+    assert stats["texts"] == sum(len(client_texts) for client_texts in inputs) and stats["errors"] == 0
+
+
+def test_errors_are_raised(service):
+    scorer = BatchingScorer(StandInEmbedding(), FailingClassifier(), batch_size=64, max_latency=0.01)
+    url = service(scorer)
+    client = ScoringClient(url, retries=1, retry_wait=0)
+    with pytest.raises(ScoringServiceError, match="HTTP 500"):
+        client.score(["storm"])
+    assert scorer.stats()["errors"] == 2 # The server error was retried once
+
+    # A rejected request is not retried
+    with pytest.raises(ScoringServiceError, match="HTTP 404"):
+        client.request("/unknown")
+
+    server = make_server(scorer, port=0)
+    closed_url = "http://127.0.0.1:{}".format(server.server_address[1])
+    server.server_close()
+    with pytest.raises(ScoringServiceError, match="not reachable"):
+        ScoringClient(closed_url, retries=1, retry_wait=0).health()
+
+
+def test_imputer_stops_on_service_errors(tmp_path):
+    from main_sentiment_imputer import imputer
+    names = synthetic_data.generate_raw_hours(str(tmp_path / "raw" / "2021"), "worldgeo", n_hours=1,
+                                              tweets_per_hour=50)
+    args = argparse.Namespace(data_path=str(tmp_path / "raw"), output_path=str(tmp_path / "out"),
+                              tweet_type="worldgeo", output_format="csv", score_index_path="", score_digits=6,
+                              scoring_client=ScoringClient("http://127.0.0.1:9", retries=0))
+    with pytest.raises(ScoringServiceError):
+        imputer(names[0], "2021", args)
+
+
+def test_requests_within_max_latency_share_a_batch():
+    scorer = BatchingScorer(StandInEmbedding(), StandInClassifier(), batch_size=1000, max_latency=0.5)
+    inputs = [texts(10, seed=client) for client in range(4)]
+    results = [None] * 4
+
+    def run(client):
+        results[client] = scorer.score(inputs[client], timeout=10)
+
+    threads = [threading.Thread(target=run, args=(client,)) for client in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = scorer.stats()
+    assert (stats["requests"], stats["batches"]) == (4, 1)
+    for client in range(4):
+        np.testing.assert_allclose(results[client], direct_scores(inputs[client]), rtol=1e-6)
+
+    # A full batch is scored right away, without waiting for max_latency
+    scorer.max_latency = 5
+    start = time.monotonic()
+    scorer.score(texts(1000, seed=9), timeout=10)
+    assert time.monotonic() - start < 2
+    scorer.close()
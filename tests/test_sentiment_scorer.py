@@ -0,0 +1,65 @@
+import itertools
+import numpy as np
+import pytest
+
+import synthetic_data
+from synthetic_data import StandInEmbedding, StandInClassifier
+from utils.data_read_in import clean_for_content
+from utils.sentiment_scorer import SentimentScorer
+
+
+def items(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return [(synthetic_data.random_text(rng), synthetic_data.LANGS[ind % len(synthetic_data.LANGS)]) for ind in range(n)]
+
+
+def reference(items):
+    """
+    Scores as main_sentiment_imputer.py computes them: clean every text, score the non-empty ones
+    """
+    texts = [clean_for_content(text, lang) if isinstance(text, str) else "" for text, lang in items]
+    scores = np.full(len(texts), np.nan)
+    keep = np.array([text != "" for text in texts])
+    embeddings = StandInEmbedding().encode(np.array(texts, dtype=object)[keep])
+    scores[keep] = StandInClassifier().predict_proba(embeddings)[:, 1]
+    return scores
+
+
+def test_scores_in_input_order():
+    inputs = items(250) + [("http://t.co/abc123", "en"), (None, "en"), ("", "en")] + items(30, seed=1)
+    scorer = SentimentScorer(StandInEmbedding(), StandInClassifier(), buffer_size=40, max_pending=1)
+    scores = scorer.score(inputs)
+    np.testing.assert_allclose(scores, reference(inputs), rtol=1e-6)
+    assert np.isnan(scores[250:253]).all()
+
+    # Plain texts use the default language; rounding follows score_digits
+    scorer = SentimentScorer(StandInEmbedding(), StandInClassifier(), buffer_size=64, score_digits=3)
+    texts = [text for text, _ in items(100)]
+    np.testing.assert_array_equal(scorer.score(texts), np.round(reference([(text, "en") for text in texts]), 3))
+
+
+def test_early_stop_bounds_the_read_ahead():
+    n_read = itertools.count()
+
+    def endless():
+        for text, lang in itertools.cycle(items(50)):
+            next(n_read)
+            yield text, lang
+
+    scorer = SentimentScorer(StandInEmbedding(), StandInClassifier(), buffer_size=20, max_pending=2)
+    stream = scorer.score_stream(endless())
+    first = list(itertools.islice(stream, 30))
+    stream.close()
+    assert len(first) == 30
+    # Two chunks consumed, max_pending chunks in the queue and one chunk waiting to be put
+    assert next(n_read) <= (2 + 2 + 1) * 20
+
+
+def test_reader_errors_are_raised():
+    def broken():
+        yield from items(30)
+        raise OSError("truncated file")
+
+    scorer = SentimentScorer(StandInEmbedding(), StandInClassifier(), buffer_size=10)
+    with pytest.raises(OSError, match="truncated"):
+        scorer.score(broken())
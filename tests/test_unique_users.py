@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import synthetic_data
+from unique_users import UniqueUsers
+
+
+def reference(batches):
+    """
+    The original pandas implementation: concat and keep the first row of every user
+    """
+    users = pd.DataFrame({"user_id": [], "location": []}, dtype=int)
+    for batch in batches:
+        users = pd.concat([users, batch]).drop_duplicates(subset=["user_id"]).reset_index(drop=True)
+    return users
+
+
+def batches():
+    out = [synthetic_data.random_users(300, 100, seed) for seed in range(4)]
+    out.append(pd.DataFrame({"user_id": [10**9 + 500, 10**9 + 501, 10**9 + 502, 10**9 + 500],
+                             "location": [None, np.nan, "Newark", "Houston"]}))
+    return out
+
+
+@pytest.mark.parametrize("spill", [False, True])
+def test_equals_reference(tmp_path, spill):
+    unique_users = UniqueUsers(str(tmp_path / "users.sqlite") if spill else None)
+    for batch in batches():
+        unique_users.update_users(batch)
+    users = unique_users.get_users()
+    expected = reference(batches())
+
+    assert list(users["user_id"]) == list(expected["user_id"].astype(np.int64))
+    assert unique_users.n_users == len(expected)
+    is_missing = expected["location"].isnull().to_numpy()
+    assert list(users["location"].isnull()) == list(is_missing)
+    assert list(users["location"][~is_missing]) == list(expected["location"][~is_missing])
+
+
+def test_missing_locations_stay_missing():
+    unique_users = UniqueUsers()
+    unique_users.update_users(pd.DataFrame({"user_id": [1, 2, 3, 4], "location": ["a", None, np.nan, "b"]}))
+    users = unique_users.get_users()
+    # pd.factorize gives missing values the code -1, which must not pick the last interned location
+    assert list(users["location"].isnull()) == [False, True, True, False]
+    assert list(users["location"][[0, 3]]) == ["a", "b"]
+    assert unique_users.locations.count(None) == 1